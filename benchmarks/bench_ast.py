@@ -0,0 +1,126 @@
+#Compare the memory and field-access speed of slotted AST nodes with the
+#equivalent dict-based tree that parse() used to build.
+#Usage: python benchmarks/bench_ast.py [megabytes]
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sigil
+
+SNIPPET = """counter_{n} = 0
+values_{n} = [1, 2.5, 3, "four", true]
+while (counter_{n} < 10 and !false) {{
+  values_{n}.append(counter_{n} * 2 + .5)
+  if (counter_{n} >= 5) {{ total = total + values_{n}[0] }} else {{ counter_{n} = counter_{n} + 1 }}
+  counter_{n} = -counter_{n} + len(values_{n}) * 2
+}}
+"""
+
+def generate(megabytes):
+    #Build a generated script of roughly the given size.
+    parts = []
+    size = 0
+    n = 0
+    while size < megabytes * 1024 * 1024:
+        block = SNIPPET.format(n=n)
+        parts.append(block)
+        size += len(block)
+        n += 1
+    return "".join(parts)
+
+def measure(build):
+    #Return the result of build() and the bytes still allocated for it.
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tree = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return tree, after - before
+
+def walk_nodes(node):
+    #Visit every node through attribute access and count them.
+    count = 1
+    for field in node.fields:
+        value = getattr(node, field)
+        if isinstance(value, sigil.Node):
+            count += walk_nodes(value)
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, sigil.Node):
+                    count += walk_nodes(item)
+    return count
+
+def walk_dicts(node):
+    #Visit every node of a dict tree through key lookups and count them.
+    count = 1
+    for field in sigil.NODE_CLASSES[node['type']].fields:
+        value = node[field]
+        if isinstance(value, dict):
+            count += walk_dicts(value)
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict):
+                    count += walk_dicts(item)
+    return count
+
+def read_fields(nodes, dicts, repeat):
+    #Time reading the 'type' tag and a field of every binary node.
+    binary = sigil.KIND_BINARY
+    node_start = time.perf_counter()
+    for _ in range(repeat):
+        for node in nodes:
+            if node.kind == binary:
+                node.op, node.left, node.right
+    node_time = time.perf_counter() - node_start
+
+    dict_start = time.perf_counter()
+    for _ in range(repeat):
+        for node in dicts:
+            if node['type'] == 'binary':
+                node['op'], node['left'], node['right']
+    dict_time = time.perf_counter() - dict_start
+    return node_time, dict_time
+
+def flatten(node, out, get):
+    #Collect every expression node of a tree into a flat list.
+    out.append(node)
+    for value in get(node):
+        if isinstance(value, (sigil.Node, dict)):
+            flatten(value, out, get)
+        elif isinstance(value, list):
+            for item in value:
+                flatten(item, out, get)
+    return out
+
+def main():
+    #Report AST memory, traversal time and field access time for both forms.
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 2
+    code = generate(megabytes)
+    tokens = sigil.tokenize(code)
+
+    nodes, node_bytes = measure(lambda: sigil.parse(tokens))
+    dicts, dict_bytes = measure(lambda: nodes.to_dict())
+    count = walk_nodes(nodes)
+
+    print(f"{len(code) / 1024 / 1024:.1f} MB of source, {count:,} nodes")
+    print(f"{'':<10}{'memory':>12}{'bytes/node':>12}{'walk':>10}")
+    start = time.perf_counter()
+    walk_nodes(nodes)
+    node_walk = time.perf_counter() - start
+    start = time.perf_counter()
+    walk_dicts(dicts)
+    dict_walk = time.perf_counter() - start
+    print(f"{'dicts':<10}{dict_bytes / 1024 / 1024:>10.1f}MB{dict_bytes / count:>12.0f}{dict_walk:>9.3f}s")
+    print(f"{'slots':<10}{node_bytes / 1024 / 1024:>10.1f}MB{node_bytes / count:>12.0f}{node_walk:>9.3f}s")
+    print(f"memory reduction {1 - node_bytes / dict_bytes:.0%}")
+
+    flat_nodes = flatten(nodes, [], lambda node: [getattr(node, field) for field in node.fields])
+    flat_dicts = flatten(dicts, [], lambda node: [node[key] for key in node if key != 'type'])
+    node_time, dict_time = read_fields(flat_nodes, flat_dicts, 5)
+    print(f"field access: dicts {dict_time:.3f}s, slots {node_time:.3f}s ({dict_time / node_time:.2f}x)")
+
+if __name__ == "__main__":
+    main()
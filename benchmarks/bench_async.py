@@ -0,0 +1,75 @@
+#Run many interactive Sigil sessions concurrently in one event loop.
+#Usage: python benchmarks/bench_async.py [max_sessions] [latency_ms]
+#Every session runs a script that asks for input three times. The stand-in
+#input source answers after latency_ms, like a remote user or a network
+#round trip would. Sessions run with interpret_async() as asyncio tasks.
+#When they wait at the same time, the wall time stays close to that of
+#one session while the number of sessions grows, until the interpreter
+#itself keeps the CPU busy.
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sigil
+
+SCRIPT = """
+total = 0
+round = 0
+while (round < 3) {
+  answer = input("Number? ")
+  i = 0
+  while (i < 100) {
+    total = total + len(answer) * i
+    i = i + 1
+  }
+  print "round " + round + ": " + total
+  round = round + 1
+}
+"""
+
+class CountingSink(sigil.AsyncOutputSink):
+    #Count the values printed by all sessions.
+    def __init__(self):
+        self.count = 0
+
+    async def write(self, value):
+        self.count += 1
+
+def input_source(latency):
+    #Return an input source that answers every prompt after latency seconds.
+    async def read(prompt):
+        await asyncio.sleep(latency)
+        return "42"
+    return read
+
+async def run_sessions(sessions, latency):
+    #Run sessions concurrently; return the wall time and the values printed.
+    ast = sigil.parse(sigil.tokenize(SCRIPT))
+    sink = CountingSink()
+    read = input_source(latency)
+    start = time.perf_counter()
+    await asyncio.gather(*(sigil.interpret_async(ast, input_source=read, output=sink)
+                           for _ in range(sessions)))
+    return time.perf_counter() - start, sink.count
+
+def main():
+    #Print the wall time and throughput for a growing number of sessions.
+    max_sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 50.0) / 1000
+
+    print(f"{'sessions':>9}{'wall':>10}{'sequential':>12}{'sessions/s':>12}")
+    sessions = 1
+    while sessions <= max_sessions:
+        elapsed, printed = asyncio.run(run_sessions(sessions, latency))
+        assert printed == sessions * 3
+        # Waiting for the answers one session at a time would take at least
+        sequential = sessions * 3 * latency
+        print(f"{sessions:>9}{elapsed:>9.3f}s{sequential:>11.1f}s{sessions / elapsed:>12.0f}")
+        sessions *= 10 if sessions < 1000 else 2
+    print(f"(every session waits {3 * latency:.2f}s for input)")
+
+if __name__ == "__main__":
+    main()
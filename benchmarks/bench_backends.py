@@ -0,0 +1,102 @@
+#Compare execution backends on loop-heavy Sigil programs.
+#Usage: python benchmarks/bench_backends.py [repeat]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sigil
+
+WORKLOADS = {
+    'counter': """
+i = 0
+total = 0
+while (i < 200000) {
+  total = total + i * 2
+  i = i + 1
+}
+""",
+    'branches': """
+i = 0
+evens = 0
+odds = 0
+while (i < 100000) {
+  if (i / 2 == (i - 1) / 2 + 0.5) {
+    evens = evens + 1
+  } else {
+    odds = odds + 1
+  }
+  i = i + 1
+}
+""",
+    'lists': """
+items = []
+i = 0
+while (i < 50000) {
+  items.append(i)
+  i = i + 1
+}
+i = 0
+total = 0
+while (i < len(items)) {
+  total = total + items[i]
+  i = i + 1
+}
+""",
+    'strings': """
+i = 0
+count = 0
+while (i < 50000) {
+  word = "item" + i
+  if (word != "item") {
+    count = count + 1
+  }
+  i = i + 1
+}
+""",
+    'elements': """
+items = []
+i = 0
+while (i < 1000) {
+  items.append(i)
+  i = i + 1
+}
+round = 0
+total = 0
+while (round < 30) {
+  i = 0
+  while (i < len(items) - 1) {
+    total = total + items[i] * items[i + 1] - items[i]
+    i = i + 1
+  }
+  round = round + 1
+}
+"""
+}
+
+def best_time(ast, backend, repeat):
+    #Return the fastest of several runs of the program on a backend.
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        sigil.interpret(ast, backend=backend)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def main():
+    #Print per-workload timings and the speedup over the tree-walker.
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    backends = ['tree'] + sorted(sigil.BACKENDS)
+
+    print(f"{'workload':<10}" + "".join(f"{name:>12}" for name in backends))
+    for name, code in WORKLOADS.items():
+        ast = sigil.parse(sigil.tokenize(code))
+        times = [best_time(ast, backend, repeat) for backend in backends]
+        print(f"{name:<10}" + "".join(f"{t:>11.3f}s" for t in times))
+        print(f"{'':<10}" + "".join(f"{times[0] / t:>11.2f}x" for t in times))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#Compare running many small scripts one process each with --batch worker pools.
+#Usage: python benchmarks/bench_batch.py [scripts] [jobs]
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SIGIL = os.path.join(ROOT, 'sigil.py')
+
+# A small independent job: some arithmetic, a list and a little output
+SCRIPT = """total = 0
+items = []
+i = 0
+while (i < {size}) {{
+  total = total + i * {n}
+  items.append(total)
+  i = i + 1
+}}
+print "script {n}: " + total + " from " + len(items) + " items"
+"""
+
+def run(args):
+    #Run the interpreter once and return the wall-clock time.
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, SIGIL] + args, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0 or "FAIL" in completed.stdout or "Runtime error" in completed.stdout:
+        raise SystemExit(f"Interpreter failed: {completed.stdout}{completed.stderr}")
+    return elapsed
+
+def main():
+    #Print the time to run every script with one process per script and in batches.
+    scripts = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    jobs = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+
+    workdir = tempfile.mkdtemp(prefix='sigil-bench-')
+    try:
+        cache_dir = os.path.join(workdir, 'cache')
+        paths = []
+        for n in range(scripts):
+            paths.append(os.path.join(workdir, f"script_{n:05}.txt"))
+            with open(paths[-1], 'w') as file:
+                file.write(SCRIPT.format(n=n, size=200 + n % 50))
+
+        start = time.perf_counter()
+        for path in paths:
+            run(['--cache-dir', cache_dir, path])
+        separate = time.perf_counter() - start
+
+        single = run(['--cache-dir', cache_dir, '--batch', workdir, '--jobs', '1'])
+        pooled = run(['--cache-dir', cache_dir, '--batch', workdir, '--jobs', str(jobs)])
+
+        print(f"{scripts} scripts")
+        print(f"{'one process each':<22}{separate:>8.3f}s")
+        print(f"{'batch, 1 worker':<22}{single:>8.3f}s  ({separate / single:.1f}x faster)")
+        print(f"{f'batch, {jobs} workers':<22}{pooled:>8.3f}s  ({separate / pooled:.1f}x faster)")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
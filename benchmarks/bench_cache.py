@@ -0,0 +1,71 @@
+#Compare `python sigil.py prog.txt` startup with and without the compiled-program cache.
+#Usage: python benchmarks/bench_cache.py [megabytes] [repeat]
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SIGIL = os.path.join(ROOT, 'sigil.py')
+
+# Parsed in full but skipped at run time, so startup dominates
+SNIPPET = """  counter_{n} = 0
+  values_{n} = [1, 2.5, 3, "four", true]
+  while (counter_{n} < 10 and !false) {{
+    values_{n}.append(counter_{n} * 2 + .5)
+    if (counter_{n} >= 5) {{ print "item " + values_{n}[0] }} else {{ counter_{n} = counter_{n} + 1 }}
+  }}
+"""
+
+def generate(megabytes):
+    #Build a large program whose body never runs.
+    parts = ["if (false) {\n"]
+    size = 0
+    n = 0
+    while size < megabytes * 1024 * 1024:
+        block = SNIPPET.format(n=n)
+        parts.append(block)
+        size += len(block)
+        n += 1
+    parts.append("}\nprint \"done\"\n")
+    return "".join(parts)
+
+def run(args):
+    #Run the interpreter once and return the wall-clock time.
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, SIGIL] + args, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if "Program executed successfully." not in completed.stdout:
+        raise SystemExit(f"Interpreter failed: {completed.stdout}{completed.stderr}")
+    return elapsed
+
+def main():
+    #Print no-cache, cold-cache and warm-cache startup times.
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    workdir = tempfile.mkdtemp(prefix='sigil-bench-')
+    try:
+        program = os.path.join(workdir, 'program.txt')
+        cache_dir = os.path.join(workdir, 'cache')
+        with open(program, 'w') as file:
+            file.write(generate(megabytes))
+
+        no_cache = min(run(['--no-cache', program]) for _ in range(repeat))
+        cold = []
+        for _ in range(repeat):
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            cold.append(run(['--cache-dir', cache_dir, program]))
+        warm = min(run(['--cache-dir', cache_dir, program]) for _ in range(repeat))
+
+        print(f"{os.path.getsize(program) / 1024 / 1024:.1f} MB program")
+        print(f"{'no cache':<12}{no_cache:>8.3f}s")
+        print(f"{'cold cache':<12}{min(cold):>8.3f}s")
+        print(f"{'warm cache':<12}{warm:>8.3f}s  ({no_cache / warm:.2f}x faster)")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#Measure the cost of running programs under execution limits.
+#Usage: python benchmarks/bench_limits.py [repeat]
+#Each program runs without limits, with a step budget and a timeout, and
+#with a size cap as well. The limits are set high enough never to trigger.
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sigil
+
+PROGRAMS = {
+    # One hot loop, compiled by the loop tracer
+    'counter': """
+i = 0
+total = 0
+while (i < 1000000) {
+  total = total + i * 2
+  i = i + 1
+}
+""",
+    # Many short loops and straight-line statements, mostly interpreted
+    'statements': """
+n = 0
+total = 0
+while (n < 20000) {
+  a = n * 2
+  b = a + 1
+  if (b > a) { total = total + b - a } else { total = total - 1 }
+  k = 0
+  while (k < 3) { k = k + 1 }
+  n = n + 1
+}
+""",
+    # Lists and strings that grow, checked against the size cap
+    'building': """
+items = []
+report = ""
+i = 0
+while (i < 100000) {
+  items.append(i)
+  report = report + "line " + i + "\\n"
+  i = i + 1
+}
+"""
+}
+
+MODES = {
+    'none': None,
+    'steps+time': sigil.Limits(max_steps=10 ** 9, timeout=3600),
+    'all': sigil.Limits(max_steps=10 ** 9, timeout=3600, max_size=10 ** 9)
+}
+
+def best_time(code, limits, repeat):
+    #Return the fastest of several runs of a program.
+    best = None
+    for _ in range(repeat):
+        ast = sigil.parse(sigil.tokenize(code))
+        start = time.perf_counter()
+        sigil.interpret(ast, output='discard', limits=limits)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def main():
+    #Print the run time of every program in every mode and the overhead.
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    print(f"{'program':<12}" + "".join(f"{mode:>14}" for mode in MODES))
+    for name, code in PROGRAMS.items():
+        times = [best_time(code, limits, repeat) for limits in MODES.values()]
+        cells = [f"{times[0]:>13.3f}s"]
+        cells.extend(f"{elapsed:>7.3f}s {elapsed / times[0] - 1:>+5.0%}" for elapsed in times[1:])
+        print(f"{name:<12}" + "".join(cells))
+
+if __name__ == "__main__":
+    main()
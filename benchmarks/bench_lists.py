@@ -0,0 +1,100 @@
+#Compare array-backed number lists with plain Python lists on large numeric lists.
+#Usage: python benchmarks/bench_lists.py [elements] [repeat]
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sigil
+
+# Each workload builds a list of N numbers with append in a while loop
+WORKLOADS = {
+    'append': """
+items = []
+i = 0
+while (i < N) {
+  items.append(i * 0.5)
+  i = i + 1
+}
+""",
+    'sum': """
+items = []
+i = 0
+while (i < N) {
+  items.append(i)
+  i = i + 1
+}
+i = 0
+total = 0
+while (i < len(items)) {
+  total = total + items[i]
+  i = i + 1
+}
+""",
+    'set': """
+items = []
+i = 0
+while (i < N) {
+  items.append(0)
+  i = i + 1
+}
+i = 0
+while (i < len(items)) {
+  items[i] = i * i
+  i = i + 1
+}
+""",
+    'concat': """
+items = []
+i = 0
+while (i < N) {
+  items.append(i)
+  i = i + 1
+}
+both = items + items
+i = 0
+while (i < 20) {
+  both = items + items
+  same = both == items + items
+  i = i + 1
+}
+"""
+}
+
+def measure(ast, number_lists, repeat):
+    #Return the fastest run time and the peak traced memory in bytes.
+    sigil.NUMBER_LISTS = number_lists
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        sigil.interpret(ast, output='discard')
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    tracemalloc.start()
+    result, environment = sigil.interpret(ast, output='discard')
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result, environment
+    return best, peak
+
+def main():
+    #Print time and peak memory per workload for both list representations.
+    elements = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    print(f"{elements} elements")
+    print(f"{'workload':<10}{'list':>12}{'array':>12}{'list MB':>12}{'array MB':>12}")
+    for name, code in WORKLOADS.items():
+        ast = sigil.parse(sigil.tokenize(code.replace('N', str(elements))))
+        list_time, list_peak = measure(ast, False, repeat)
+        array_time, array_peak = measure(ast, True, repeat)
+        print(f"{name:<10}{list_time:>11.3f}s{array_time:>11.3f}s"
+              f"{list_peak / 1e6:>12.1f}{array_peak / 1e6:>12.1f}")
+    sigil.NUMBER_LISTS = True
+
+if __name__ == "__main__":
+    main()
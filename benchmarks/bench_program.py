@@ -0,0 +1,102 @@
+#Measure requests per second when running short scripts with and without compiled programs.
+#Usage: python benchmarks/bench_program.py [requests] [threads]
+#Every request runs one of a few small scripts with its own variables, the
+#way a service evaluating rules or templates would. "parse" tokenizes and
+#parses the source for every request; "cached" asks compile_program() for
+#the program, so each script is parsed once and its trees are reused.
+#Both run on the tree-walker and again on the bytecode machine, where
+#"cached" also compiles each script to bytecode only once.
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sigil
+
+SCRIPTS = [
+    """
+# Discount rule
+discount = 0
+if (total > 100 and member) {
+  discount = total / 10
+} else {
+  if (total > 50) { discount = 5 }
+}
+price = total - discount
+""",
+    """
+# Greeting template
+greeting = "Dear " + name + ",\\n"
+greeting = greeting + "your order of " + total + " has shipped.\\n"
+if (member) { greeting = greeting + "Thank you for being a member!\\n" }
+""",
+    """
+# Score of a list of ratings
+sum = 0
+i = 0
+while (i < len(ratings)) {
+  sum = sum + ratings[i]
+  i = i + 1
+}
+score = sum / len(ratings)
+"""
+]
+
+BACKENDS = ['tree', 'bytecode']
+
+def request_variables(number):
+    #Return the variables of one request.
+    return {
+        'total': float(number % 200),
+        'member': number % 3 == 0,
+        'name': f"customer {number}",
+        'ratings': [float(number % 5 + 1), 4.0, 5.0, 3.0]
+    }
+
+def parse_each_time(code, variables, backend='tree'):
+    #Run a request the way run_program() used to: parse, then interpret.
+    ast = sigil.parse(sigil.tokenize(code))
+    environment = {'variables': dict(variables), 'output': []}
+    return sigil.interpret(ast, environment, backend, output='discard')
+
+def cached(code, variables, backend='tree'):
+    #Run a request through the compiled program cache.
+    return sigil.compile_program(code).run(variables, backend, output='discard')
+
+def throughput(run, backend, requests, threads):
+    #Return the requests per second of running requests spread over threads.
+    def worker(first):
+        for number in range(first, requests, threads):
+            run(SCRIPTS[number % len(SCRIPTS)], request_variables(number), backend)
+
+    workers = [threading.Thread(target=worker, args=(first,)) for first in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return requests / (time.perf_counter() - start)
+
+def main():
+    #Print the throughput of both ways of running requests.
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+    # Every way must compute the same variables
+    for number in range(len(SCRIPTS) * 4):
+        code = SCRIPTS[number % len(SCRIPTS)]
+        expected = dict(parse_each_time(code, request_variables(number))[1]['variables'])
+        for backend in BACKENDS:
+            assert dict(cached(code, request_variables(number), backend)[1]['variables']) == expected
+
+    print(f"{requests} requests on {threads} thread(s)")
+    for backend in BACKENDS:
+        slow = throughput(parse_each_time, backend, requests, threads)
+        print(f"{'parse':<8}{backend:<10}{slow:>10.0f} requests/s")
+        fast = throughput(cached, backend, requests, threads)
+        print(f"{'cached':<8}{backend:<10}{fast:>10.0f} requests/s  ({fast / slow:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#Measure how interactive_mode() scales when a long multi-line block is pasted.
+#Usage: python benchmarks/bench_repl.py [max_lines]
+import builtins
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sigil
+
+def pasted_block(count):
+    #Return the lines of a while block with count lines in total.
+    body = [f"  value_{n} = value_{n} + {n}" for n in range(count - 2)]
+    return ["while (false) {"] + body + ["}", "exit"]
+
+def time_interactive(lines):
+    #Feed lines to interactive_mode() and return the elapsed time.
+    feed = iter(lines)
+    original_input = builtins.input
+    builtins.input = lambda prompt="": next(feed)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            sigil.interactive_mode()
+            return time.perf_counter() - start
+    finally:
+        builtins.input = original_input
+
+def time_rescan(lines):
+    #The previous strategy: re-tokenize and re-parse the whole buffer per line.
+    start = time.perf_counter()
+    buffer = []
+    for line in lines[:-1]:
+        buffer.append(line)
+        try:
+            sigil.parse(sigil.tokenize("\n".join(buffer)))
+            buffer = []
+        except ValueError as e:
+            if "Unexpected end of file" not in str(e):
+                raise
+    return time.perf_counter() - start
+
+# The rescan strategy is quadratic; beyond this it takes minutes
+RESCAN_LIMIT = 1000
+
+def main():
+    #Print paste time and time per line for growing block sizes.
+    max_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    sizes = [max_lines // 20, max_lines // 10, max_lines // 5, max_lines // 2, max_lines]
+
+    print(f"{'lines':>8}{'incremental':>14}{'per line':>12}{'rescan':>12}{'per line':>12}")
+    for size in sizes:
+        lines = pasted_block(size)
+        incremental = time_interactive(lines)
+        row = f"{size:>8}{incremental:>13.3f}s{incremental / size * 1e6:>10.0f}us"
+        if size <= RESCAN_LIMIT:
+            rescan = time_rescan(lines)
+            row += f"{rescan:>11.3f}s{rescan / size * 1e6:>10.0f}us"
+        else:
+            row += f"{'skipped':>12}{'':>12}"
+        print(row)
+
+if __name__ == "__main__":
+    main()
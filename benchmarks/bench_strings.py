@@ -0,0 +1,58 @@
+#Compare building large strings with and without StringBuilder appends.
+#Usage: python benchmarks/bench_strings.py [max_lines] [repeat]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sigil
+
+# A report of N lines of about 65 characters, built one piece at a time.
+# The checkpoint line reads the report once while it is being built.
+REPORT = """
+scores = [3, 1, 4, 1, 5, 9, 2, 6]
+report = "Report\\n"
+i = 0
+while (i < N) {
+  report = report + "line " + i + ": score " + scores[3] + " of " + scores + "\\n"
+  if (i == 1000) {
+    report = report + "checkpoint at " + len(report) + " characters\\n"
+  }
+  i = i + 1
+}
+print len(report)
+"""
+
+def best_time(ast, repeat):
+    #Return the fastest of several runs of the program.
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        sigil.interpret(ast, output='discard')
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def main():
+    #Print build times for doubling report sizes with and without builders.
+    max_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 16000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+    print(f"{'lines':>8}{'size':>10}{'copying':>12}{'builder':>12}")
+    lines = max_lines // 8
+    while lines <= max_lines:
+        code = REPORT.replace('N', str(lines))
+        times = []
+        for builders in (False, True):
+            sigil.STRING_BUILDERS = builders
+            times.append(best_time(sigil.parse(sigil.tokenize(code)), repeat))
+        result, environment = sigil.interpret(sigil.parse(sigil.tokenize(code)), output='discard')
+        size = len(environment['variables']['report'])
+        print(f"{lines:>8}{size / 1e6:>8.1f}MB{times[0]:>11.3f}s{times[1]:>11.3f}s")
+        lines *= 2
+    sigil.STRING_BUILDERS = True
+
+if __name__ == "__main__":
+    main()
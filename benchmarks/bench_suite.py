@@ -0,0 +1,228 @@
+#Time tokenize(), parse() and interpret() separately on a corpus of Sigil workloads.
+#Usage: python benchmarks/bench_suite.py [workload ...] [--repeat N] [--scale X]
+#                                        [--json PATH] [--baseline PATH] [--tolerance FRACTION]
+#Reports the median and 90th percentile time and the peak traced memory of
+#every phase. --json saves the results; --baseline compares them with a
+#saved run and exits with status 1 if a phase got slower (or used more
+#memory) by more than the tolerance.
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sigil
+
+PHASES = ('tokenize', 'parse', 'interpret')
+
+def numeric(scale):
+    #Arithmetic and comparisons in a hot loop.
+    return f"""
+i = 0
+total = 0
+product = 1
+while (i < {int(100000 * scale)}) {{
+  total = total + i * 2 - i / 4
+  if (total > 1000000) {{
+    total = total - 1000000
+  }}
+  product = product * 1.000001
+  i = i + 1
+}}
+print total
+"""
+
+def lists(scale):
+    #Building a list with append, then reading and updating it by index.
+    return f"""
+items = []
+i = 0
+while (i < {int(50000 * scale)}) {{
+  items.append(i * 0.5)
+  i = i + 1
+}}
+i = 0
+total = 0
+while (i < len(items) - 1) {{
+  total = total + items[i] * items[i + 1]
+  items[i] = total
+  i = i + 1
+}}
+names = []
+i = 0
+while (i < {int(5000 * scale)}) {{
+  names.append("name" + i)
+  i = i + 1
+}}
+print len(items) + len(names)
+"""
+
+def strings(scale):
+    #Concatenation: a growing report and many short throwaway strings.
+    return f"""
+report = ""
+i = 0
+count = 0
+while (i < {int(30000 * scale)}) {{
+  report = report + "line " + i + ": " + [i, i + 1] + "\\n"
+  word = "item" + i
+  if (word != "item") {{
+    count = count + len(word)
+  }}
+  i = i + 1
+}}
+print len(report) + count
+"""
+
+def nesting(scale):
+    #Deeply nested blocks and parenthesized expressions.
+    depth = 25
+    expression = "(" * 30 + "i + 1" + ")" * 30
+    lines = ["i = 0", "total = 0", f"while (i < {int(3000 * scale)}) {{"]
+    for level in range(depth):
+        lines.append("  " * (level + 1) + f"if (i > {-level - 1}) {{")
+    lines.append("  " * (depth + 1) + f"total = total + {expression}")
+    for level in reversed(range(depth)):
+        lines.append("  " * (level + 1) + "}")
+    lines.append("  i = i + 1")
+    lines.append("}")
+    lines.append("print total")
+    return "\n".join(lines) + "\n"
+
+def generated(scale):
+    #A large generated file of straight-line code and short loops, where
+    #tokenizing and parsing dominate.
+    snippet = """# block {n}
+counter_{n} = 0
+values_{n} = [1, 2.5, 3, "four", true]
+while (counter_{n} < 3 and !false) {{
+  values_{n}.append(counter_{n} * 2 + .5)
+  label_{n} = "item " + len(values_{n}) + " of block {n}"
+  counter_{n} = counter_{n} + 1
+}}
+if (values_{n}[0] == 1) {{ total = counter_{n} }} else {{ total = 0 }}
+"""
+    return "".join(snippet.format(n=n) for n in range(int(4000 * scale)))
+
+WORKLOADS = {
+    'numeric': numeric,
+    'lists': lists,
+    'strings': strings,
+    'nesting': nesting,
+    'generated': generated
+}
+
+def percentile(samples, fraction):
+    #Return a percentile of the samples, interpolating between neighbours.
+    ordered = sorted(samples)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def run_phase(phase, code, tokens, ast):
+    #Run one phase and return its result.
+    if phase == 'tokenize':
+        return sigil.tokenize(code)
+    if phase == 'parse':
+        return sigil.parse(tokens)
+    return sigil.interpret(ast, output='discard')
+
+def measure(code, repeat):
+    #Time every phase repeat times and trace the peak memory of one run.
+    tokens = sigil.tokenize(code)
+    results = {}
+    for phase in PHASES:
+        samples = []
+        for _ in range(repeat):
+            # interpret() marks the tree it runs, so each run gets a fresh one
+            ast = sigil.parse(tokens) if phase == 'interpret' else None
+            start = time.perf_counter()
+            run_phase(phase, code, tokens, ast)
+            samples.append(time.perf_counter() - start)
+
+        ast = sigil.parse(tokens) if phase == 'interpret' else None
+        tracemalloc.start()
+        run_phase(phase, code, tokens, ast)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results[phase] = {
+            'median': statistics.median(samples),
+            'p90': percentile(samples, 0.9),
+            'peak_bytes': peak,
+            'samples': samples
+        }
+    return results
+
+def compare(results, baseline, tolerance):
+    #Return a line per phase whose median time or peak memory grew by more
+    #than the tolerance compared with the baseline run.
+    regressions = []
+    for name, phases in results['workloads'].items():
+        for phase, current in phases.items():
+            previous = baseline.get('workloads', {}).get(name, {}).get(phase)
+            if previous is None:
+                continue
+            for metric in ('median', 'peak_bytes'):
+                if previous[metric] and current[metric] > previous[metric] * (1 + tolerance):
+                    change = current[metric] / previous[metric] - 1
+                    regressions.append(f"{name} {phase} {metric}: {previous[metric]:.6g} -> "
+                                       f"{current[metric]:.6g} (+{change:.0%})")
+    return regressions
+
+def main():
+    #Run the suite, print a table and optionally save and compare the results.
+    parser = argparse.ArgumentParser(description="Time the tokenize, parse and interpret phases.")
+    parser.add_argument('workloads', nargs='*',
+                        help=f"workloads to run: {', '.join(WORKLOADS)} (default: all)")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per phase (default: 5)")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiply the workload sizes")
+    parser.add_argument('--json', metavar='PATH', help="save the results as JSON")
+    parser.add_argument('--baseline', metavar='PATH', help="compare with results saved by --json")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="allowed slowdown or memory growth before a regression is flagged (default: 0.10)")
+    args = parser.parse_args()
+    for name in args.workloads:
+        if name not in WORKLOADS:
+            parser.error(f"unknown workload: {name}")
+
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'scale': args.scale,
+        'workloads': {}
+    }
+
+    print(f"{'workload':<11}{'phase':<11}{'median':>10}{'p90':>10}{'peak MB':>10}")
+    for name in args.workloads or WORKLOADS:
+        code = WORKLOADS[name](args.scale)
+        phases = results['workloads'][name] = measure(code, args.repeat)
+        for phase, result in phases.items():
+            print(f"{name:<11}{phase:<11}{result['median']:>9.4f}s{result['p90']:>9.4f}s"
+                  f"{result['peak_bytes'] / 1e6:>10.2f}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.tolerance)
+        print()
+        if not regressions:
+            print(f"No regressions against {args.baseline}")
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
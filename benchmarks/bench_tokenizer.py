@@ -0,0 +1,250 @@
+#Compare tokenizer throughput against the original character-at-a-time lexer.
+#Usage: python benchmarks/bench_tokenizer.py [megabytes] [repeat]
+#Also reports the peak memory of each tokenizer's output: the original
+#returns one dict per token, tokenize() a columnar TokenStream.
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sigil
+
+def reference_tokenize(code):
+    #The original character-at-a-time tokenizer, kept as the baseline.
+    tokens = []
+    i = 0
+    line_num = 1
+
+    # Keywords and operators to check
+    keywords = {
+        'true': {'type': 'boolean', 'value': True},
+        'false': {'type': 'boolean', 'value': False},
+        'and': {'type': 'operator', 'value': 'and'},
+        'or': {'type': 'operator', 'value': 'or'},
+        'print': {'type': 'keyword', 'value': 'print'},
+        'if': {'type': 'keyword', 'value': 'if'},
+        'else': {'type': 'keyword', 'value': 'else'},
+        'while': {'type': 'keyword', 'value': 'while'},
+        'input': {'type': 'keyword', 'value': 'input'},
+        'append': {'type': 'keyword', 'value': 'append'},
+        'len': {'type': 'keyword', 'value': 'len'}
+    }
+
+    # Two-character operators
+    two_char_ops = {
+        '==': {'type': 'operator', 'value': '=='},
+        '!=': {'type': 'operator', 'value': '!='},
+        '<=': {'type': 'operator', 'value': '<='},
+        '>=': {'type': 'operator', 'value': '>='}
+    }
+
+    # Single-character operators and punctuation
+    single_char_ops = {
+        '+': {'type': 'operator', 'value': '+'},
+        '-': {'type': 'operator', 'value': '-'},
+        '*': {'type': 'operator', 'value': '*'},
+        '/': {'type': 'operator', 'value': '/'},
+        '=': {'type': 'operator', 'value': '='},
+        '<': {'type': 'operator', 'value': '<'},
+        '>': {'type': 'operator', 'value': '>'},
+        '!': {'type': 'operator', 'value': '!'},
+        '(': {'type': 'punctuation', 'value': '('},
+        ')': {'type': 'punctuation', 'value': ')'},
+        '{': {'type': 'punctuation', 'value': '{'},
+        '}': {'type': 'punctuation', 'value': '}'},
+        '[': {'type': 'punctuation', 'value': '['},
+        ']': {'type': 'punctuation', 'value': ']'},
+        ',': {'type': 'punctuation', 'value': ','},
+        '.': {'type': 'punctuation', 'value': '.'}
+    }
+
+    while i < len(code):
+        char = code[i]
+
+        # Track line numbers
+        if char == '\n':
+            line_num += 1
+            i += 1
+            continue
+
+        # Skip whitespace
+        if char.isspace():
+            i += 1
+            continue
+
+        # Skip comments
+        if char == '#':
+            while i < len(code) and code[i] != '\n':
+                i += 1
+            continue
+
+        # Handle string literals
+        if char == '"':
+            string_value = ""
+            i += 1  # Skip opening quote
+
+            while i < len(code) and code[i] != '"':
+                # Handle escape sequences
+                if code[i] == '\\' and i + 1 < len(code):
+                    i += 1
+                    if code[i] == 'n':
+                        string_value += '\n'
+                    elif code[i] == 't':
+                        string_value += '\t'
+                    elif code[i] == '"':
+                        string_value += '"'
+                    elif code[i] == '\\':
+                        string_value += '\\'
+                    else:
+                        string_value += '\\' + code[i]
+                else:
+                    string_value += code[i]
+
+                # Track line numbers in strings
+                if code[i] == '\n':
+                    line_num += 1
+                i += 1
+
+            if i >= len(code):
+                raise ValueError(f"Line {line_num}: Unterminated string literal")
+
+            i += 1  # Skip closing quote
+            tokens.append({'type': 'string', 'value': string_value, 'line': line_num})
+            continue
+
+        # Handle numbers (including decimals) - improved handling
+        if char.isdigit() or (char == '.' and i + 1 < len(code) and code[i+1].isdigit()):
+            num_str = char
+            i += 1
+            # Allow only one decimal point
+            has_decimal = char == '.'
+
+            while i < len(code) and (code[i].isdigit() or (code[i] == '.' and not has_decimal)):
+                if code[i] == '.':
+                    has_decimal = True
+                num_str += code[i]
+                i += 1
+
+            tokens.append({'type': 'number', 'value': float(num_str), 'line': line_num})
+            continue
+
+        # Check for two-character operators
+        if i + 1 < len(code):
+            two_chars = code[i:i+2]
+            if two_chars in two_char_ops:
+                token = two_char_ops[two_chars].copy()
+                token['line'] = line_num
+                tokens.append(token)
+                i += 2
+                continue
+
+        # Check for identifiers and keywords
+        if char.isalpha() or char == '_':
+            identifier = char
+            i += 1
+            while i < len(code) and (code[i].isalnum() or code[i] == '_'):
+                identifier += code[i]
+                i += 1
+
+            # Check if it's a keyword
+            if identifier in keywords:
+                token = keywords[identifier].copy()
+                token['line'] = line_num
+                tokens.append(token)
+            else:
+                tokens.append({'type': 'identifier', 'value': identifier, 'line': line_num})
+            continue
+
+        # Handle single-character operators and punctuation
+        if char in single_char_ops:
+            token = single_char_ops[char].copy()
+            token['line'] = line_num
+            tokens.append(token)
+            i += 1
+            continue
+
+        # Unrecognized character
+        raise ValueError(f"Line {line_num}: Unrecognized character: {char}")
+
+    return tokens
+
+# Typical generated code: short tokens, keywords and operators
+CODE_SNIPPET = """# generated block {n}
+counter_{n} = 0
+values_{n} = [1, 2.5, 3, "four", true]
+while (counter_{n} < 10 and !false) {{
+  values_{n}.append(counter_{n} * 2 + .5)
+  label = "item \\"{n}\\"\\n" + len(values_{n})
+  if (counter_{n} >= 5) {{ print label }} else {{ counter_{n} = counter_{n} + 1 }}
+  counter_{n} = counter_{n} + 1
+}}
+"""
+
+# Long string literals and comments, where per-character scanning hurts most
+LITERAL_SNIPPET = """# {filler}
+text_{n} = "{filler}\\t{filler}"
+print text_{n}
+"""
+
+WORKLOADS = {
+    'code': CODE_SNIPPET,
+    'literals': LITERAL_SNIPPET
+}
+
+def generate(snippet, megabytes):
+    #Build a generated script of roughly the given size.
+    parts = []
+    size = 0
+    n = 0
+    filler = "lorem ipsum dolor sit amet " * 40
+    while size < megabytes * 1024 * 1024:
+        block = snippet.format(n=n, filler=filler)
+        parts.append(block)
+        size += len(block)
+        n += 1
+    return "".join(parts)
+
+def best_time(tokenize, code, repeat):
+    #Return the fastest of several tokenizer runs and the token count.
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tokens = tokenize(code)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, len(tokens)
+
+def peak_memory(tokenize, code):
+    #Return the peak traced memory of one tokenizer run, in bytes.
+    tracemalloc.start()
+    try:
+        tokenize(code)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def main():
+    #Print tokens/sec for both tokenizers on generated scripts.
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 2
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    for workload, snippet in WORKLOADS.items():
+        code = generate(snippet, megabytes)
+        if sigil.tokenize(code) != reference_tokenize(code):
+            raise SystemExit(f"Tokenizers disagree on the {workload} workload")
+
+        print(f"{workload}: {len(code) / 1024 / 1024:.1f} MB of source")
+        results = {}
+        for name, tokenize in (('original', reference_tokenize), ('regex', sigil.tokenize)):
+            elapsed, count = best_time(tokenize, code, repeat)
+            results[name] = elapsed
+            peak = peak_memory(tokenize, code)
+            print(f"  {name:<10}{elapsed:>8.3f}s {count / elapsed:>14,.0f} tokens/sec "
+                  f"{peak / 1024 / 1024:>9.1f} MB peak")
+        print(f"  {'speedup':<10}{results['original'] / results['regex']:>8.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#Compare the tree-walker with and without compiling hot while loops.
+#Usage: python benchmarks/bench_tracing.py [repeat]
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sigil
+
+WORKLOADS = {
+    'counter': """
+i = 0
+total = 0
+while (i < 200000) {
+  total = total + i * 2
+  i = i + 1
+}
+""",
+    'branches': """
+i = 0
+evens = 0
+odds = 0
+while (i < 100000) {
+  if (i / 2 == (i - 1) / 2 + 0.5) {
+    evens = evens + 1
+  } else {
+    odds = odds + 1
+  }
+  i = i + 1
+}
+""",
+    'elements': """
+items = []
+i = 0
+while (i < 1000) {
+  items.append(i)
+  i = i + 1
+}
+round = 0
+total = 0
+while (round < 30) {
+  i = 0
+  while (i < len(items) - 1) {
+    total = total + items[i] * items[i + 1] - items[i]
+    i = i + 1
+  }
+  round = round + 1
+}
+""",
+    'report': """
+report = ""
+i = 0
+while (i < 50000) {
+  report = report + "line " + i + "\\n"
+  i = i + 1
+}
+""",
+    # total switches between a number and a string every 5000 iterations,
+    # so the compiled loop keeps handing control back to the tree-walker
+    'unstable': """
+i = 0
+k = 0
+total = 0
+while (i < 100000) {
+  k = k + 1
+  if (k == 5000) {
+    k = 0
+    if (total == "reset") { total = 0 } else { total = "reset" }
+  }
+  if (total != "reset") { total = total + 1 }
+  i = i + 1
+}
+""",
+    # Short inner loops: each run stays below the threshold
+    'short': """
+i = 0
+total = 0
+while (i < 20000) {
+  j = 0
+  while (j < 3) {
+    total = total + j
+    j = j + 1
+  }
+  i = i + 1
+}
+"""
+}
+
+def best_time(ast, repeat):
+    #Return the fastest of several runs of the program.
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        sigil.interpret(ast, output='discard')
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def main():
+    #Print per-workload timings with tracing off and on, and the tracer's report.
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    print(f"{'workload':<10}{'off':>10}{'on':>10}{'speedup':>10}")
+    reports = []
+    for name, code in WORKLOADS.items():
+        ast = sigil.parse(sigil.tokenize(code))
+        times = []
+        for tracing in (False, True):
+            sigil.TRACE_LOOPS = tracing
+            times.append(best_time(ast, repeat))
+        print(f"{name:<10}{times[0]:>9.3f}s{times[1]:>9.3f}s{times[0] / times[1]:>9.2f}x")
+
+        report = io.StringIO()
+        result, environment = sigil.interpret(ast, output='discard')
+        sigil.report_traces(environment, report)
+        reports.append(f"{name}:\n{report.getvalue()}")
+    sigil.TRACE_LOOPS = True
+
+    print()
+    print("".join(reports), end="")
+
+if __name__ == "__main__":
+    main()
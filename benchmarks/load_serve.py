@@ -0,0 +1,134 @@
+#Load-test the REPL server: open many sessions and time their requests.
+#Usage: python benchmarks/load_serve.py [--sessions N] [--requests N] [--address ADDRESS]
+#Without --address a server is started on a temporary Unix socket. Every
+#session connects, then sends the same short REPL conversation over and
+#over, waiting for the prompt after each line. Reports the sessions held
+#open at once, the server's memory per session (when it was started here,
+#on Linux) and the throughput and latency of the requests.
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# One round of a session: a counter, a list, a string and a short loop
+CONVERSATION = [
+    'count = count + 1',
+    'items.append(count)',
+    'label = "session " + count + " has " + len(items) + " items"',
+    'i = 0',
+    'while (i < 50) { i = i + 1 }',
+    'print label',
+]
+
+PROMPTS = (b"> ", b"... ")
+
+async def connect(address):
+    #Open a connection to a Unix socket path or a [HOST:]PORT.
+    host, _, port = address.rpartition(':')
+    if port.isdigit():
+        return await asyncio.open_connection(host or '127.0.0.1', int(port))
+    return await asyncio.open_unix_connection(address)
+
+async def read_prompt(reader):
+    #Read until the server shows a prompt; return everything read.
+    data = b""
+    while not data.endswith(PROMPTS):
+        chunk = await reader.read(4096)
+        if not chunk:
+            raise ConnectionError(f"server closed the session: {data.decode()!r}")
+        data += chunk
+    return data
+
+async def open_session(address):
+    #Connect and set up the session's variables.
+    reader, writer = await connect(address)
+    await read_prompt(reader)
+    for line in ('count = 0', 'items = []'):
+        writer.write(line.encode() + b"\n")
+        await read_prompt(reader)
+    return reader, writer
+
+async def run_session(reader, writer, requests, latencies):
+    #Send requests lines of the conversation, timing each response.
+    for number in range(requests):
+        line = CONVERSATION[number % len(CONVERSATION)]
+        start = time.perf_counter()
+        writer.write(line.encode() + b"\n")
+        reply = await read_prompt(reader)
+        latencies.append(time.perf_counter() - start)
+        if b"Error" in reply:
+            raise RuntimeError(f"{line!r} failed: {reply.decode()!r}")
+
+def resident_kb(pid):
+    #Return the resident memory of a process in kB, or None if unknown.
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+async def load(address, sessions, requests, pid):
+    #Open all sessions, then run their conversations at the same time.
+    before = resident_kb(pid) if pid else None
+    start = time.perf_counter()
+    connections = []
+    for _ in range(sessions):
+        connections.append(await open_session(address))
+    opened = time.perf_counter() - start
+    after = resident_kb(pid) if pid else None
+
+    print(f"opened {sessions} sessions in {opened:.2f}s")
+    if before is not None and after is not None:
+        print(f"server memory: {before / 1024:.1f} MB before, {after / 1024:.1f} MB with all sessions open, "
+              f"{(after - before) / sessions:.1f} kB per session")
+
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_session(reader, writer, requests, latencies) for reader, writer in connections))
+    elapsed = time.perf_counter() - start
+
+    for reader, writer in connections:
+        writer.write(b"quit\n")
+        writer.close()
+
+    latencies.sort()
+    print(f"{len(latencies)} requests in {elapsed:.2f}s: {len(latencies) / elapsed:.0f} requests/s")
+    print(f"latency: median {statistics.median(latencies) * 1000:.2f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms, max {latencies[-1] * 1000:.2f} ms")
+
+def main():
+    #Start a server unless one was given, then run the load.
+    parser = argparse.ArgumentParser(description="Load-test the Sigil REPL server.")
+    parser.add_argument('--sessions', type=int, default=500, help="sessions to open at once (default: 500)")
+    parser.add_argument('--requests', type=int, default=60, help="lines sent by every session (default: 60)")
+    parser.add_argument('--address', default=None, help="address of a running server (default: start one)")
+    args = parser.parse_args()
+
+    server = None
+    address = args.address
+    if address is None:
+        address = os.path.join(tempfile.mkdtemp(), 'sigil.sock')
+        server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'sigil.py'), '--serve', address,
+                                   '--max-sessions', str(args.sessions), '--max-steps', '1000000'],
+                                  stderr=subprocess.PIPE, text=True)
+        # Wait for the server to report that it is listening
+        server.stderr.readline()
+
+    try:
+        asyncio.run(load(address, args.sessions, args.requests, server.pid if server else None))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+if __name__ == "__main__":
+    main()
@@ -1,258 +1,1151 @@
-def tokenize(code):
-    #Convert source code into a list of tokens.
-    tokens = []
-    i = 0
-    line_num = 1
-
-    # Keywords and operators to check
-    keywords = {
-        'true': {'type': 'boolean', 'value': True},
-        'false': {'type': 'boolean', 'value': False},
-        'and': {'type': 'operator', 'value': 'and'},
-        'or': {'type': 'operator', 'value': 'or'},
-        'print': {'type': 'keyword', 'value': 'print'},
-        'if': {'type': 'keyword', 'value': 'if'},
-        'else': {'type': 'keyword', 'value': 'else'},
-        'while': {'type': 'keyword', 'value': 'while'},
-        'input': {'type': 'keyword', 'value': 'input'},
-        'append': {'type': 'keyword', 'value': 'append'},
-        'len': {'type': 'keyword', 'value': 'len'}
-    }
-
-    # Two-character operators
-    two_char_ops = {
-        '==': {'type': 'operator', 'value': '=='},
-        '!=': {'type': 'operator', 'value': '!='},
-        '<=': {'type': 'operator', 'value': '<='},
-        '>=': {'type': 'operator', 'value': '>='}
-    }
-
-    # Single-character operators and punctuation
-    single_char_ops = {
-        '+': {'type': 'operator', 'value': '+'},
-        '-': {'type': 'operator', 'value': '-'},
-        '*': {'type': 'operator', 'value': '*'},
-        '/': {'type': 'operator', 'value': '/'},
-        '=': {'type': 'operator', 'value': '='},
-        '<': {'type': 'operator', 'value': '<'},
-        '>': {'type': 'operator', 'value': '>'},
-        '!': {'type': 'operator', 'value': '!'},
-        '(': {'type': 'punctuation', 'value': '('},
-        ')': {'type': 'punctuation', 'value': ')'},
-        '{': {'type': 'punctuation', 'value': '{'},
-        '}': {'type': 'punctuation', 'value': '}'},
-        '[': {'type': 'punctuation', 'value': '['},
-        ']': {'type': 'punctuation', 'value': ']'},
-        ',': {'type': 'punctuation', 'value': ','},
-        '.': {'type': 'punctuation', 'value': '.'}
-    }
-
-    while i < len(code):
-        char = code[i]
-
-        # Track line numbers
-        if char == '\n':
-            line_num += 1
+import array
+import asyncio
+import builtins
+import collections
+import collections.abc
+import copy
+import functools
+import hashlib
+import io
+import json
+import marshal
+import math
+import operator
+import os
+import re
+import reprlib
+import sys
+import tempfile
+import time
+import weakref
+
+# Token type and value for every keyword
+KEYWORDS = {
+    'true': ('boolean', True),
+    'false': ('boolean', False),
+    'and': ('operator', 'and'),
+    'or': ('operator', 'or'),
+    'print': ('keyword', 'print'),
+    'if': ('keyword', 'if'),
+    'else': ('keyword', 'else'),
+    'while': ('keyword', 'while'),
+    'input': ('keyword', 'input'),
+    'append': ('keyword', 'append'),
+    'len': ('keyword', 'len')
+}
+
+# Token codes of the columnar token stream (see TokenStream). Tokens whose
+# value varies share one code per type; every keyword, operator and
+# punctuation mark has a code of its own, so the parser compares one
+# integer instead of a type and a value.
+TOKEN_NUMBER = 0
+TOKEN_STRING = 1
+TOKEN_IDENTIFIER = 2
+TOKEN_BOOLEAN = 3
+TOKEN_PRINT = 4
+TOKEN_IF = 5
+TOKEN_ELSE = 6
+TOKEN_WHILE = 7
+TOKEN_INPUT = 8
+TOKEN_APPEND = 9
+TOKEN_LEN = 10
+TOKEN_AND = 11
+TOKEN_OR = 12
+TOKEN_EQUAL = 13
+TOKEN_NOT_EQUAL = 14
+TOKEN_LESS_EQUAL = 15
+TOKEN_GREATER_EQUAL = 16
+TOKEN_PLUS = 17
+TOKEN_MINUS = 18
+TOKEN_TIMES = 19
+TOKEN_DIVIDE = 20
+TOKEN_ASSIGN = 21
+TOKEN_LESS = 22
+TOKEN_GREATER = 23
+TOKEN_NOT = 24
+TOKEN_LEFT_PAREN = 25
+TOKEN_RIGHT_PAREN = 26
+TOKEN_LEFT_BRACE = 27
+TOKEN_RIGHT_BRACE = 28
+TOKEN_LEFT_BRACKET = 29
+TOKEN_RIGHT_BRACKET = 30
+TOKEN_COMMA = 31
+TOKEN_DOT = 32
+
+# Type and text of the tokens with a code of their own
+FIXED_TOKENS = {
+    TOKEN_PRINT: ('keyword', 'print'),
+    TOKEN_IF: ('keyword', 'if'),
+    TOKEN_ELSE: ('keyword', 'else'),
+    TOKEN_WHILE: ('keyword', 'while'),
+    TOKEN_INPUT: ('keyword', 'input'),
+    TOKEN_APPEND: ('keyword', 'append'),
+    TOKEN_LEN: ('keyword', 'len'),
+    TOKEN_AND: ('operator', 'and'),
+    TOKEN_OR: ('operator', 'or'),
+    TOKEN_EQUAL: ('operator', '=='),
+    TOKEN_NOT_EQUAL: ('operator', '!='),
+    TOKEN_LESS_EQUAL: ('operator', '<='),
+    TOKEN_GREATER_EQUAL: ('operator', '>='),
+    TOKEN_PLUS: ('operator', '+'),
+    TOKEN_MINUS: ('operator', '-'),
+    TOKEN_TIMES: ('operator', '*'),
+    TOKEN_DIVIDE: ('operator', '/'),
+    TOKEN_ASSIGN: ('operator', '='),
+    TOKEN_LESS: ('operator', '<'),
+    TOKEN_GREATER: ('operator', '>'),
+    TOKEN_NOT: ('operator', '!'),
+    TOKEN_LEFT_PAREN: ('punctuation', '('),
+    TOKEN_RIGHT_PAREN: ('punctuation', ')'),
+    TOKEN_LEFT_BRACE: ('punctuation', '{'),
+    TOKEN_RIGHT_BRACE: ('punctuation', '}'),
+    TOKEN_LEFT_BRACKET: ('punctuation', '['),
+    TOKEN_RIGHT_BRACKET: ('punctuation', ']'),
+    TOKEN_COMMA: ('punctuation', ','),
+    TOKEN_DOT: ('punctuation', '.')
+}
+
+# Type name of every token code
+TOKEN_TYPES = ('number', 'string', 'identifier', 'boolean') + tuple(FIXED_TOKENS[code][0] for code in sorted(FIXED_TOKENS))
+
+# Code of every keyword, operator and punctuation mark, by its text
+TOKEN_CODES = {text: code for code, (_, text) in FIXED_TOKENS.items()}
+
+# Code and value of every word the tokenizer does not take for an
+# identifier. Fixed tokens use the text from FIXED_TOKENS as their value, so
+# all tokens with the same text share one string object.
+_WORD_TOKENS = {word: (TOKEN_BOOLEAN, value) if token_type == 'boolean' else (TOKEN_CODES[value], FIXED_TOKENS[TOKEN_CODES[value]][1])
+                for word, (token_type, value) in KEYWORDS.items()}
+
+# Code and shared value of every operator and punctuation mark, by its text
+_SYMBOL_TOKENS = {text: (code, FIXED_TOKENS[code][1]) for text, code in TOKEN_CODES.items()
+                  if not text.isalpha()}
+
+# Master pattern: optional blanks, then one token. Alternatives are tried in
+# the order the scanner has always used (numbers before operators). 'other'
+# catches everything the ASCII rules cannot handle alone - non-ASCII text,
+# unterminated strings, stray characters - and hands it to _scan_unicode().
+_TOKEN_PATTERN = re.compile(r'''
+    [ \t\r\x0b\x0c\x1c-\x1f]*
+    (?:
+        (?P<newline>\n)
+      | (?P<identifier>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<operator>==|!=|<=|>=|[-+*/=<>!])
+      | (?P<punctuation>[(){}\[\],])
+      | (?P<number>[0-9]+(?:\.[0-9]*)?|\.[0-9]+)
+      | (?P<dot>\.)
+      | (?P<string>"[^"\\]*(?:\\.[^"\\]*)*")
+      | (?P<comment>\#[^\n]*)
+      | (?P<other>.)
+      | $
+    )
+''', re.VERBOSE | re.DOTALL)
+
+_NEWLINE = _TOKEN_PATTERN.groupindex['newline']
+_IDENTIFIER = _TOKEN_PATTERN.groupindex['identifier']
+_OPERATOR = _TOKEN_PATTERN.groupindex['operator']
+_PUNCTUATION = _TOKEN_PATTERN.groupindex['punctuation']
+_NUMBER = _TOKEN_PATTERN.groupindex['number']
+_DOT = _TOKEN_PATTERN.groupindex['dot']
+_STRING = _TOKEN_PATTERN.groupindex['string']
+_OTHER = _TOKEN_PATTERN.groupindex['other']
+
+_ESCAPE_PATTERN = re.compile(r'\\(.)', re.DOTALL)
+
+_ESCAPES = {'n': '\n', 't': '\t', '"': '"', '\\': '\\'}
+
+def _unescape(match):
+    #Replace one escape sequence; unknown escapes are kept verbatim.
+    char = match.group(1)
+    return _ESCAPES.get(char, '\\' + char)
+
+def _scan_unicode(code, i, line_num):
+    #Scan one token at a position the master pattern cannot handle alone.
+    #Returns the token's code and value (None for whitespace) and the
+    #position after it.
+    char = code[i]
+
+    if char.isspace():
+        return None, i + 1
+
+    if char == '"':
+        raise ValueError(f"Line {line_num + code.count(chr(10), i)}: Unterminated string literal")
+
+    # Numbers may continue with non-ASCII digits
+    if char.isdigit() or (char == '.' and i + 1 < len(code) and code[i+1].isdigit()):
+        start = i
+        has_decimal = char == '.'
+        i += 1
+        while i < len(code) and (code[i].isdigit() or (code[i] == '.' and not has_decimal)):
+            if code[i] == '.':
+                has_decimal = True
             i += 1
-            continue
+        return (TOKEN_NUMBER, float(code[start:i])), i
 
-        # Skip whitespace
-        if char.isspace():
+    # Identifiers may contain non-ASCII letters
+    if char.isalpha() or char == '_':
+        start = i
+        i += 1
+        while i < len(code) and (code[i].isalnum() or code[i] == '_'):
             i += 1
-            continue
+        identifier = code[start:i]
+        if identifier in _WORD_TOKENS:
+            return _WORD_TOKENS[identifier], i
+        return (TOKEN_IDENTIFIER, identifier), i
+
+    # Unrecognized character
+    raise ValueError(f"Line {line_num}: Unrecognized character: {char}")
+
+class TokenStream:
+    #The tokens of some source code, stored in columns instead of one dict
+    #per token: the token codes (TOKEN_NUMBER, TOKEN_PLUS, ...) in an
+    #array('B'), the line numbers in an array('l') and the values in a
+    #parallel list. parse() reads the columns directly. For callers that
+    #want the old view, indexing and iterating give token dicts -
+    #{'type': 'operator', 'value': '+', 'line': 3} - and a stream compares
+    #equal to the equivalent list of dicts.
+    __slots__ = ('types', 'values', 'lines')
+
+    def __init__(self, types=None, values=None, lines=None):
+        self.types = array.array('B') if types is None else types
+        self.values = [] if values is None else values
+        self.lines = array.array('l') if lines is None else lines
+
+    @classmethod
+    def from_dicts(cls, tokens):
+        #Build a stream from token dicts, such as the lists tokenize() used
+        #to return.
+        stream = cls()
+        for token in tokens:
+            stream.append(token)
+        return stream
+
+    def append(self, token):
+        #Add a token given as a dict.
+        token_type, value = token['type'], token['value']
+        if token_type in ('keyword', 'operator', 'punctuation'):
+            code = TOKEN_CODES.get(value) if isinstance(value, str) else None
+            if code is None or FIXED_TOKENS[code][0] != token_type:
+                raise ValueError(f"Not a token: {token}")
+            value = FIXED_TOKENS[code][1]
+        elif token_type in TOKEN_TYPES:
+            code = TOKEN_TYPES.index(token_type)
+        else:
+            raise ValueError(f"Not a token: {token}")
+        self.types.append(code)
+        self.values.append(value)
+        self.lines.append(token['line'])
+
+    def extend(self, tokens):
+        #Add the tokens of another stream (or token dicts) to the end.
+        if not isinstance(tokens, TokenStream):
+            tokens = TokenStream.from_dicts(tokens)
+        self.types.extend(tokens.types)
+        self.values.extend(tokens.values)
+        self.lines.extend(tokens.lines)
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return TokenStream(self.types[index], self.values[index], self.lines[index])
+        return {'type': TOKEN_TYPES[self.types[index]], 'value': self.values[index], 'line': self.lines[index]}
+
+    def __iter__(self):
+        for code, value, line in zip(self.types, self.values, self.lines):
+            yield {'type': TOKEN_TYPES[code], 'value': value, 'line': line}
+
+    def __eq__(self, other):
+        if isinstance(other, TokenStream):
+            return self.types == other.types and self.values == other.values and self.lines == other.lines
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"TokenStream({list(self)!r})"
+
+def _token_stream(tokens):
+    #Return tokens as a TokenStream, converting a list of token dicts.
+    return tokens if isinstance(tokens, TokenStream) else TokenStream.from_dicts(tokens)
+
+def tokenize(code, line_num=1):
+    #Convert source code into a TokenStream.
+    #line_num is the line number of the first line of code.
+    tokens = TokenStream()
+    add_type = tokens.types.append
+    add_value = tokens.values.append
+    add_line = tokens.lines.append
+    finditer = _TOKEN_PATTERN.finditer
+    words = _WORD_TOKENS
+    symbols = _SYMBOL_TOKENS
+    newline, identifier, operator, punctuation = _NEWLINE, _IDENTIFIER, _OPERATOR, _PUNCTUATION
+    number, dot, string, other = _NUMBER, _DOT, _STRING, _OTHER
+    # Only non-ASCII source can have words that run on past the ASCII rules
+    ascii_only = code.isascii()
+    position = 0
 
-        # Skip comments
-        if char == '#':
-            while i < len(code) and code[i] != '\n':
-                i += 1
-            continue
+    while True:
+        for m in finditer(code, position):
+            kind = m.lastindex
 
-        # Handle string literals
-        if char == '"':
-            string_value = ""
-            i += 1  # Skip opening quote
-
-            while i < len(code) and code[i] != '"':
-                # Handle escape sequences
-                if code[i] == '\\' and i + 1 < len(code):
-                    i += 1
-                    if code[i] == 'n':
-                        string_value += '\n'
-                    elif code[i] == 't':
-                        string_value += '\t'
-                    elif code[i] == '"':
-                        string_value += '"'
-                    elif code[i] == '\\':
-                        string_value += '\\'
-                    else:
-                        string_value += '\\' + code[i]
+            if kind == identifier:
+                text = m.group(identifier)
+                if not ascii_only and code[m.end():m.end() + 1] >= '\x80':
+                    position = m.start(identifier)
+                    break
+                if text in words:
+                    token_code, value = words[text]
+                    add_type(token_code)
+                    add_value(value)
                 else:
-                    string_value += code[i]
-
-                # Track line numbers in strings
-                if code[i] == '\n':
-                    line_num += 1
-                i += 1
-
-            if i >= len(code):
-                raise ValueError(f"Line {line_num}: Unterminated string literal")
-
-            i += 1  # Skip closing quote
-            tokens.append({'type': 'string', 'value': string_value, 'line': line_num})
-            continue
-
-        # Handle numbers (including decimals) - improved handling
-        if char.isdigit() or (char == '.' and i + 1 < len(code) and code[i+1].isdigit()):
-            num_str = char
-            i += 1
-            # Allow only one decimal point
-            has_decimal = char == '.'
-
-            while i < len(code) and (code[i].isdigit() or (code[i] == '.' and not has_decimal)):
-                if code[i] == '.':
-                    has_decimal = True
-                num_str += code[i]
-                i += 1
-
-            tokens.append({'type': 'number', 'value': float(num_str), 'line': line_num})
-            continue
-
-        # Check for two-character operators
-        if i + 1 < len(code):
-            two_chars = code[i:i+2]
-            if two_chars in two_char_ops:
-                token = two_char_ops[two_chars].copy()
-                token['line'] = line_num
-                tokens.append(token)
-                i += 2
-                continue
-
-        # Check for identifiers and keywords
-        if char.isalpha() or char == '_':
-            identifier = char
-            i += 1
-            while i < len(code) and (code[i].isalnum() or code[i] == '_'):
-                identifier += code[i]
-                i += 1
-
-            # Check if it's a keyword
-            if identifier in keywords:
-                token = keywords[identifier].copy()
-                token['line'] = line_num
-                tokens.append(token)
+                    add_type(TOKEN_IDENTIFIER)
+                    add_value(text)
+                add_line(line_num)
+            elif kind == newline:
+                line_num += 1
+            elif kind == operator or kind == punctuation:
+                token_code, value = symbols[m.group(kind)]
+                add_type(token_code)
+                add_value(value)
+                add_line(line_num)
+            elif kind == number:
+                if not ascii_only and code[m.end():m.end() + 1] >= '\x80':
+                    position = m.start(number)
+                    break
+                add_type(TOKEN_NUMBER)
+                add_value(float(m.group(number)))
+                add_line(line_num)
+            elif kind == dot:
+                # ASCII digits would have made this a number already
+                if not ascii_only and code[m.end():m.end() + 1].isdigit():
+                    position = m.start(dot)
+                    break
+                add_type(TOKEN_DOT)
+                add_value('.')
+                add_line(line_num)
+            elif kind == string:
+                value = m.group(string)
+                # The token carries the line its closing quote is on
+                line_num += value.count('\n')
+                value = value[1:-1]
+                if '\\' in value:
+                    value = _ESCAPE_PATTERN.sub(_unescape, value)
+                add_type(TOKEN_STRING)
+                add_value(value)
+                add_line(line_num)
+            elif kind == other:
+                position = m.start(other)
+                break
+        else:
+            return tokens
+
+        token, position = _scan_unicode(code, position, line_num)
+        if token is not None:
+            add_type(token[0])
+            add_value(token[1])
+            add_line(line_num)
+
+# Integer kind tags for syntax tree nodes
+KIND_PROGRAM = 0
+KIND_EXPRESSION = 1
+KIND_PRINT = 2
+KIND_ASSIGNMENT = 3
+KIND_LIST_APPEND = 4
+KIND_LIST_SET = 5
+KIND_IF = 6
+KIND_WHILE = 7
+KIND_NUMBER = 8
+KIND_BOOLEAN = 9
+KIND_STRING = 10
+KIND_VARIABLE = 11
+KIND_BINARY = 12
+KIND_UNARY = 13
+KIND_LIST_LITERAL = 14
+KIND_LIST_ACCESS = 15
+KIND_LEN = 16
+KIND_INPUT = 17
+
+# Kind tags for nodes that infer_types() has proven need no runtime type checks
+KIND_UNCHECKED_IF = 18
+KIND_UNCHECKED_WHILE = 19
+KIND_UNCHECKED_VARIABLE = 20
+KIND_UNCHECKED_BINARY = 21
+KIND_UNCHECKED_UNARY = 22
+KIND_UNCHECKED_LEN = 23
+
+# Kind tags for nodes that interpret() has specialized for the operand types
+# it keeps seeing (quickening)
+KIND_QUICK_BINARY = 24
+KIND_QUICK_LIST_ACCESS = 25
+KIND_QUICK_LEN = 26
+
+# Kind tags for 'name = name + ...' assignments that may build a string, and
+# for reads of the variables they assign
+KIND_STRING_APPEND = 27
+KIND_BUILDER_VARIABLE = 28
+
+# Kind tag for expression nodes nested too deeply to evaluate by recursion
+KIND_DEEP = 29
+
+class Node:
+    #Base class for syntax tree nodes.
+    #Each node class keeps its fields in __slots__ and carries an integer
+    #kind tag. Nodes can still be read like the dicts parse() used to
+    #return - node['type'], node['left'], 'prompt' in node, node.get(),
+    #dict(node) - and compare equal to the equivalent dict.
+    #node.line is the source line of the statement the node belongs to
+    #(None if unknown). It is not a field, so the dict view and equality
+    #ignore it.
+    __slots__ = ()
+    kind = None
+    type = None
+    fields = ()
+
+    def __getitem__(self, key):
+        if key == 'type':
+            return self.type
+        if key in self.fields:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.fields:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key == 'type' or key in self.fields
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.fields) + 1
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def keys(self):
+        return ('type',) + self.fields
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_dict(self):
+        #Convert this node and everything below it into plain dicts.
+        return _reduce_tree(self, _node_dict)
+
+    def __eq__(self, other):
+        if isinstance(other, (Node, dict)):
+            return _nodes_equal(self, other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return _reduce_tree(self, _node_repr)
+
+def _node_to_dict(value):
+    #Convert a node field value, converting nodes and statement lists.
+    if isinstance(value, Node):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [_node_to_dict(item) for item in value]
+    return value
+
+def _node_dict(node, results):
+    #Combine function for Node.to_dict(): the dict of a node, given those of
+    #its child nodes.
+    children = iter(results)
+    data = {'type': node.type}
+    for field in node.fields:
+        value = getattr(node, field)
+        if isinstance(value, Node):
+            value = next(children)
+        elif isinstance(value, list):
+            value = [next(children) if isinstance(item, Node) else item for item in value]
+        data[field] = value
+    return data
+
+def _node_repr(node, results):
+    #Combine function for Node.__repr__(): the repr of a node's dict, given
+    #those of its child nodes.
+    children = iter(results)
+    parts = [f"'type': {node.type!r}"]
+    for field in node.fields:
+        value = getattr(node, field)
+        if isinstance(value, Node):
+            text = next(children)
+        elif isinstance(value, list):
+            text = "[" + ", ".join(next(children) if isinstance(item, Node) else repr(item)
+                                   for item in value) + "]"
+        else:
+            text = repr(value)
+        parts.append(f"{field!r}: {text}")
+    return "{" + ", ".join(parts) + "}"
+
+def _nodes_equal(left, right):
+    #Compare a node with another node or a dict-shaped tree on an explicit
+    #stack. Nodes are equal if they have the same type and equal fields; a
+    #dict must have exactly the keys of the node's dict view.
+    stack = [(left, right)]
+    while stack:
+        left, right = stack.pop()
+        if isinstance(left, Node) and isinstance(right, (Node, dict)):
+            if isinstance(right, Node):
+                if left.type != right.type:
+                    return False
+                right_values = [getattr(right, field) for field in right.fields]
             else:
-                tokens.append({'type': 'identifier', 'value': identifier, 'line': line_num})
-            continue
-
-        # Handle single-character operators and punctuation
-        if char in single_char_ops:
-            token = single_char_ops[char].copy()
-            token['line'] = line_num
-            tokens.append(token)
-            i += 1
+                if len(right) != len(left.fields) + 1 or right.get('type') != left.type:
+                    return False
+                if any(field not in right for field in left.fields):
+                    return False
+                right_values = [right[field] for field in left.fields]
+            left_values = [getattr(left, field) for field in left.fields]
+            if len(left_values) != len(right_values):
+                return False
+            stack.extend(zip(left_values, right_values))
+        elif isinstance(left, list) and isinstance(right, list):
+            if len(left) != len(right):
+                return False
+            stack.extend(zip(left, right))
+        elif isinstance(right, Node):
+            stack.append((right, left))
+        elif left != right:
+            return False
+    return True
+
+class Program(Node):
+    fields = ('body',)
+    __slots__ = fields + ('line',)
+    kind = KIND_PROGRAM
+    type = 'program'
+
+    def __init__(self, body):
+        self.body = body
+        self.line = None
+
+class Expression(Node):
+    fields = ('expression',)
+    __slots__ = fields + ('line',)
+    kind = KIND_EXPRESSION
+    type = 'expression'
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.line = None
+
+class Print(Node):
+    fields = ('expression',)
+    __slots__ = fields + ('line',)
+    kind = KIND_PRINT
+    type = 'print'
+
+    def __init__(self, expression):
+        self.expression = expression
+        self.line = None
+
+class Assignment(Node):
+    fields = ('name', 'value')
+    __slots__ = fields + ('slot', 'line')
+    kind = KIND_ASSIGNMENT
+    type = 'assignment'
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+        self.slot = None
+        self.line = None
+
+class ListAppend(Node):
+    fields = ('list', 'value')
+    __slots__ = fields + ('slot', 'line')
+    kind = KIND_LIST_APPEND
+    type = 'list_append'
+
+    def __init__(self, list, value):
+        self.list = list
+        self.value = value
+        self.slot = None
+        self.line = None
+
+class ListSet(Node):
+    fields = ('list', 'index', 'value')
+    __slots__ = fields + ('slot', 'line')
+    kind = KIND_LIST_SET
+    type = 'list_set'
+
+    def __init__(self, list, index, value):
+        self.list = list
+        self.index = index
+        self.value = value
+        self.slot = None
+        self.line = None
+
+class If(Node):
+    fields = ('condition', 'if_body', 'else_body')
+    __slots__ = fields + ('line',)
+    kind = KIND_IF
+    type = 'if'
+
+    def __init__(self, condition, if_body, else_body):
+        self.condition = condition
+        self.if_body = if_body
+        self.else_body = else_body
+        self.line = None
+
+class While(Node):
+    fields = ('condition', 'body')
+    __slots__ = fields + ('line',)
+    kind = KIND_WHILE
+    type = 'while'
+
+    def __init__(self, condition, body):
+        self.condition = condition
+        self.body = body
+        self.line = None
+
+class Number(Node):
+    fields = ('value',)
+    __slots__ = fields + ('line',)
+    kind = KIND_NUMBER
+    type = 'number'
+
+    def __init__(self, value):
+        self.value = value
+        self.line = None
+
+class Boolean(Node):
+    fields = ('value',)
+    __slots__ = fields + ('line',)
+    kind = KIND_BOOLEAN
+    type = 'boolean'
+
+    def __init__(self, value):
+        self.value = value
+        self.line = None
+
+class String(Node):
+    fields = ('value',)
+    __slots__ = fields + ('line',)
+    kind = KIND_STRING
+    type = 'string'
+
+    def __init__(self, value):
+        self.value = value
+        self.line = None
+
+class Variable(Node):
+    fields = ('name',)
+    __slots__ = fields + ('slot', 'line')
+    kind = KIND_VARIABLE
+    type = 'variable'
+
+    def __init__(self, name):
+        self.name = name
+        self.slot = None
+        self.line = None
+
+class Binary(Node):
+    fields = ('op', 'left', 'right')
+    __slots__ = fields + ('line',)
+    kind = KIND_BINARY
+    type = 'binary'
+
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+        self.line = None
+
+class Unary(Node):
+    fields = ('op', 'expr')
+    __slots__ = fields + ('line',)
+    kind = KIND_UNARY
+    type = 'unary'
+
+    def __init__(self, op, expr):
+        self.op = op
+        self.expr = expr
+        self.line = None
+
+class ListLiteral(Node):
+    fields = ('elements',)
+    __slots__ = fields + ('line',)
+    kind = KIND_LIST_LITERAL
+    type = 'list_literal'
+
+    def __init__(self, elements):
+        self.elements = elements
+        self.line = None
+
+class ListAccess(Node):
+    fields = ('list', 'index')
+    __slots__ = fields + ('line',)
+    kind = KIND_LIST_ACCESS
+    type = 'list_access'
+
+    def __init__(self, list, index):
+        self.list = list
+        self.index = index
+        self.line = None
+
+class Len(Node):
+    fields = ('argument',)
+    __slots__ = fields + ('line',)
+    kind = KIND_LEN
+    type = 'len'
+
+    def __init__(self, argument):
+        self.argument = argument
+        self.line = None
+
+class Input(Node):
+    fields = ('prompt',)
+    __slots__ = fields + ('line',)
+    kind = KIND_INPUT
+    type = 'input'
+
+    def __init__(self, prompt):
+        self.prompt = prompt
+        self.line = None
+
+# Node class for every 'type' name
+NODE_CLASSES = {cls.type: cls for cls in (
+    Program, Expression, Print, Assignment, ListAppend, ListSet, If, While,
+    Number, Boolean, String, Variable, Binary, Unary, ListLiteral, ListAccess,
+    Len, Input
+)}
+
+# Checked nodes are switched to these classes in place (they have the same
+# slots) once their operand types are known. Only the kind tag differs, so
+# they still read and compare like the node they replace.
+class UncheckedIf(If):
+    __slots__ = ()
+    kind = KIND_UNCHECKED_IF
+
+class UncheckedWhile(While):
+    __slots__ = ()
+    kind = KIND_UNCHECKED_WHILE
+
+class UncheckedVariable(Variable):
+    __slots__ = ()
+    kind = KIND_UNCHECKED_VARIABLE
+
+class UncheckedBinary(Binary):
+    __slots__ = ()
+    kind = KIND_UNCHECKED_BINARY
+
+class UncheckedUnary(Unary):
+    __slots__ = ()
+    kind = KIND_UNCHECKED_UNARY
+
+class UncheckedLen(Len):
+    __slots__ = ()
+    kind = KIND_UNCHECKED_LEN
+
+# Quickened nodes: the tree-walker switches a checked node to one of these
+# after seeing the same operand types QUICKEN_THRESHOLD times in a row. Each
+# guards on the operand types (the guard attribute) and switches the node
+# back if the guard fails.
+class QuickBinary(Binary):
+    __slots__ = ()
+    kind = KIND_QUICK_BINARY
+    guard = None
+
+class QuickNumberBinary(QuickBinary):
+    __slots__ = ()
+    guard = float
+
+class QuickBooleanBinary(QuickBinary):
+    __slots__ = ()
+    guard = bool
+
+class QuickStringBinary(QuickBinary):
+    __slots__ = ()
+    guard = str
+
+class QuickListBinary(QuickBinary):
+    __slots__ = ()
+    guard = list
+
+class QuickListAccess(ListAccess):
+    __slots__ = ()
+    kind = KIND_QUICK_LIST_ACCESS
+
+class QuickLen(Len):
+    __slots__ = ()
+    kind = KIND_QUICK_LEN
+    guard = None
+
+class QuickStringLen(QuickLen):
+    __slots__ = ()
+    guard = str
+
+class QuickListLen(QuickLen):
+    __slots__ = ()
+    guard = list
+
+# 'name = name + a + b ...' assignments whose target may be a string. While
+# the variable holds a string the tree-walker appends the pieces to a
+# StringBuilder instead of copying the text; reads of the variable switched
+# to BuilderVariable join it again.
+class StringAppend(Assignment):
+    __slots__ = ()
+    kind = KIND_STRING_APPEND
+
+class BuilderVariable(Variable):
+    __slots__ = ()
+    kind = KIND_BUILDER_VARIABLE
+
+# Operators more than RECURSION_DEPTH levels down an expression, as in a
+# generated 'a + b + c + ...' chain, are switched to these classes by
+# mark_deep_expressions(). The tree-walker evaluates them on an explicit
+# stack instead of recursing once per level.
+class DeepBinary(Binary):
+    __slots__ = ()
+    kind = KIND_DEEP
+
+class DeepUnary(Unary):
+    __slots__ = ()
+    kind = KIND_DEEP
+
+class DeepListLiteral(ListLiteral):
+    __slots__ = ()
+    kind = KIND_DEEP
+
+class DeepListAccess(ListAccess):
+    __slots__ = ()
+    kind = KIND_DEEP
+
+class DeepLen(Len):
+    __slots__ = ()
+    kind = KIND_DEEP
+
+class DeepInput(Input):
+    __slots__ = ()
+    kind = KIND_DEEP
+
+DEEP_CLASSES = {cls.type: cls for cls in (
+    DeepBinary, DeepUnary, DeepListLiteral, DeepListAccess, DeepLen, DeepInput)}
+
+# Levels of an expression that tree passes and the tree-walker handle by
+# recursion, which is fastest; deeper levels go on with an explicit stack
+RECURSION_DEPTH = 100
+
+# Quickened class for each operand type
+QUICK_BINARY_CLASSES = {cls.guard: cls for cls in (
+    QuickNumberBinary, QuickBooleanBinary, QuickStringBinary, QuickListBinary)}
+QUICK_LEN_CLASSES = {cls.guard: cls for cls in (QuickStringLen, QuickListLen)}
+
+# Evaluations with the same operand types before a node is quickened
+QUICKEN_THRESHOLD = 8
+
+# Failed guards after which a node is left on the generic path for good
+QUICKEN_MAX_DEOPTS = 4
+
+# Node classes indexed by their kind tag
+NODE_KINDS = tuple(sorted(NODE_CLASSES.values(), key=lambda cls: cls.kind))
+
+def node_from_dict(data):
+    #Build node objects from a dict-shaped syntax tree. The dicts are
+    #converted on an explicit stack, so trees of any height fit.
+    if isinstance(data, list):
+        return [node_from_dict(item) for item in data]
+    if not isinstance(data, dict):
+        return data
+
+    results = []
+    stack = [data]
+    while stack:
+        data = stack.pop()
+        if type(data) is tuple:
+            # All child dicts done: their nodes start at index start
+            node_class, data, start = data
+            children = iter(results[start:])
+            del results[start:]
+            arguments = []
+            for field in node_class.fields:
+                value = data[field]
+                if isinstance(value, dict):
+                    value = next(children)
+                elif isinstance(value, list):
+                    value = [next(children) if isinstance(item, dict) else item for item in value]
+                arguments.append(value)
+            node = node_class(*arguments)
+            node.line = data.get('line')
+            results.append(node)
             continue
 
-        # Unrecognized character
-        raise ValueError(f"Line {line_num}: Unrecognized character: {char}")
-
-    return tokens
-
-def parse(tokens):
-    #Parse tokens into an abstract syntax tree.
+        node_class = NODE_CLASSES.get(data.get('type'))
+        if node_class is None:
+            raise ValueError(f"Unknown node type: {data.get('type')}")
+        stack.append((node_class, data, len(results)))
+        children = []
+        for field in node_class.fields:
+            value = data[field]
+            if isinstance(value, dict):
+                children.append(value)
+            elif isinstance(value, list):
+                children.extend(item for item in value if isinstance(item, dict))
+        stack.extend(reversed(children))
+    return results[0]
+
+# The direct child nodes of each node type, in source order
+_CHILD_NODES = {
+    'program': lambda node: node.body,
+    'expression': lambda node: (node.expression,),
+    'print': lambda node: (node.expression,),
+    'assignment': lambda node: (node.value,),
+    'list_append': lambda node: (node.value,),
+    'list_set': lambda node: (node.index, node.value),
+    'if': lambda node: [node.condition] + node.if_body + node.else_body,
+    'while': lambda node: [node.condition] + node.body,
+    'number': lambda node: (),
+    'boolean': lambda node: (),
+    'string': lambda node: (),
+    'variable': lambda node: (),
+    'binary': lambda node: (node.left, node.right),
+    'unary': lambda node: (node.expr,),
+    'list_literal': lambda node: node.elements,
+    'list_access': lambda node: (node.list, node.index),
+    'len': lambda node: (node.argument,),
+    'input': lambda node: () if node.prompt is None else (node.prompt,)
+}
+
+def child_nodes(node):
+    #Return the direct child nodes of a node, including statement lists,
+    #as a sequence the caller must not change.
+    return _CHILD_NODES[node.type](node)
+
+def _fill_lines(node, line):
+    #Give a node and the nodes below it that have no line yet the given
+    #line, stopping at nodes that have one (statements of nested blocks).
+    #Returns the node.
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if current.line is None:
+            current.line = line
+            stack.extend(child_nodes(current))
+    return node
+
+def count_nodes(node):
+    #Return the number of nodes in a tree.
+    count = 0
+    stack = [node]
+    while stack:
+        count += 1
+        stack.extend(child_nodes(stack.pop()))
+    return count
+
+def _reduce_tree(root, combine, expand=None, depth=None):
+    #Return combine(root, results), where results lists what combine
+    #returned for each child node of root, in order. Children are done
+    #first. The top depth levels are walked by recursion, which is fastest,
+    #and anything deeper on an explicit stack, so trees of any height fit
+    #in the Python stack. Nodes for which expand(node) is false are
+    #combined with no results and their children are not visited. depth
+    #defaults to RECURSION_DEPTH.
+    if depth is None:
+        depth = RECURSION_DEPTH
+
+    def reduce(node, level):
+        if expand is not None and not expand(node):
+            return combine(node, ())
+        if level >= depth:
+            return walk(node)
+        return combine(node, [reduce(child, level + 1) for child in child_nodes(node)])
+
+    def walk(top):
+        results = []
+        stack = [top]
+        while stack:
+            node = stack.pop()
+            if type(node) is tuple:
+                # All children done: their results start at index start
+                node, start = node
+                value = combine(node, results[start:])
+                del results[start:]
+                results.append(value)
+            elif expand is None or expand(node):
+                stack.append((node, len(results)))
+                stack.extend(reversed(child_nodes(node)))
+            else:
+                results.append(combine(node, ()))
+        return results[0]
+
+    return reduce(root, 0)
+
+class IncompleteInputError(ValueError):
+    #Raised by parse() when the tokens stop in the middle of a statement.
+    pass
+
+# Change in bracket nesting caused by each punctuation token
+BRACKET_DEPTH = {TOKEN_LEFT_PAREN: 1, TOKEN_LEFT_BRACKET: 1, TOKEN_LEFT_BRACE: 1,
+                 TOKEN_RIGHT_PAREN: -1, TOKEN_RIGHT_BRACKET: -1, TOKEN_RIGHT_BRACE: -1}
+
+# Binding powers of the expression operators, from loosest to tightest. A
+# binary operator binds the operand on its left with the first power and
+# the one on its right with the second; a higher right power makes it
+# left-associative, as all of these are. Adding an operator to the grammar
+# takes one entry here (and its meaning in the backends).
+BINARY_OPERATORS = {
+    'or': (1, 2),
+    'and': (3, 4),
+    '==': (5, 6), '!=': (5, 6),
+    '<': (7, 8), '>': (7, 8), '<=': (7, 8), '>=': (7, 8),
+    '+': (9, 10), '-': (9, 10),
+    '*': (11, 12), '/': (11, 12)
+}
+
+# Prefix operators bind their operand more tightly than any binary operator.
+# Postfix indexing binds tightest of all: it applies to the operand before
+# any pending operator does.
+PREFIX_OPERATORS = {'-': 13, '!': 13}
+
+# Node classes for the tokens that form an operand on their own, by token code
+OPERAND_NODES = {TOKEN_NUMBER: Number, TOKEN_BOOLEAN: Boolean, TOKEN_STRING: String, TOKEN_IDENTIFIER: Variable}
+
+def bracket_depth(tokens, depth=0):
+    #Return the bracket nesting level after a run of tokens.
+    for code in _token_stream(tokens).types:
+        depth += BRACKET_DEPTH.get(code, 0)
+    return depth
+
+def parse(tokens, resume=None):
+    #Parse tokens - a TokenStream, or a list of token dicts - into an
+    #abstract syntax tree.
+    #resume is for input that arrives line by line, like a block typed at
+    #the REPL: pass the same dict each time the tokens have grown, and the
+    #statements an earlier call parsed completely are reused instead of
+    #being parsed again.
+    tokens = _token_stream(tokens)
+    types = tokens.types
+    values = tokens.values
+    lines = tokens.lines
+    count = len(types)
     i = [0]  # Current token index (as a mutable list)
 
+    # The operator tables by token code
+    binary_operators = {TOKEN_CODES[op]: powers for op, powers in BINARY_OPERATORS.items()}
+    prefix_operators = {TOKEN_CODES[op]: power for op, power in PREFIX_OPERATORS.items()}
+
     def peek():
-        #Look at the current token without consuming it.
-        if i[0] >= len(tokens):
+        #Look at the current token (as a dict) without consuming it.
+        if i[0] >= count:
             return None
         return tokens[i[0]]
 
     def advance():
-        #Consume the current token and return it.
-        token = peek()
+        #Consume the current token and return its value.
+        value = values[i[0]]
         i[0] += 1
-        return token
-
-    def check(type, value=None):
-        #Check if the current token matches the given type and value.
-        token = peek()
-        if token is None:
-            return False
-        if token['type'] != type:
-            return False
-        if value is not None and token['value'] != value:
-            return False
-        return True
-
-    def match(type, value=None):
-        #Consume the current token if it matches the given type and value.
-        if check(type, value):
-            return advance()
-        return None
-
-    def expect(type, value=None, message=None):
-        #Expect the current token to match the given type and value.
-        token = match(type, value)
-        if token is None:
+        return value
+
+    def check(code):
+        #Check if the current token has the given code.
+        return i[0] < count and types[i[0]] == code
+
+    def match(code):
+        #Consume the current token if it has the given code.
+        position = i[0]
+        if position < count and types[position] == code:
+            i[0] = position + 1
+            return True
+        return False
+
+    def expect(code, message):
+        #Expect the current token to have the given code.
+        if not match(code):
             current = peek()
-            line = current['line'] if current else "end of file"
-            if message is None:
-                if value is not None:
-                    message = f"Expected {type} '{value}'"
-                else:
-                    message = f"Expected {type}"
-            raise ValueError(f"Line {line}: {message}, got {current}")
-        return token
+            if current is None:
+                # Input that stops before a closing bracket may go on on the
+                # next line
+                error = IncompleteInputError if BRACKET_DEPTH.get(code) == -1 else ValueError
+                raise error(f"Line end of file: {message}, got None")
+            raise ValueError(f"Line {current['line']}: {message}, got {current}")
+
+    def resumed_statements(key):
+        #Return the statements of the program or block starting at key that
+        #an earlier call parsed completely, moving past them.
+        saved = resume.get(key) if resume is not None else None
+        if saved is None:
+            return []
+        statements, kept, position = saved
+        del statements[kept:]
+        i[0] = position
+        return statements
+
+    def add_statement(key, statements):
+        #Parse a statement onto the statements of the program or block
+        #starting at key. A statement looks at most one token past its end,
+        #so if that token was there it parses the same once more tokens
+        #arrive and can be resumed after.
+        line = lines[i[0]]
+        statements.append(_fill_lines(parse_statement(), line))
+        if resume is not None and i[0] + 1 < count:
+            resume[key] = (statements, len(statements), i[0])
 
     def parse_program():
         #Parse a complete program.
-        statements = []
-        while peek() is not None:
-            statements.append(parse_statement())
-        return {'type': 'program', 'body': statements}
+        statements = resumed_statements(0)
+        while i[0] < count:
+            add_statement(0, statements)
+        return Program(statements)
 
     def parse_statement():
         #Parse a statement.
         # Print statement
-        if match('keyword', 'print'):
+        if match(TOKEN_PRINT):
             expr = parse_expression()
-            return {'type': 'print', 'expression': expr}
+            return Print(expr)
 
         # If statement
-        if match('keyword', 'if'):
+        if match(TOKEN_IF):
             return parse_if_statement()
 
         # While statement
-        if match('keyword', 'while'):
+        if match(TOKEN_WHILE):
             return parse_while_statement()
 
         # Variable assignment
-        if check('identifier'):
-            name = advance()['value']
+        if check(TOKEN_IDENTIFIER):
+            name = advance()
 
             # Check for list indexing in assignment: list[index] = value
-            if match('punctuation', '['):
+            if match(TOKEN_LEFT_BRACKET):
                 index = parse_expression()
-                expect('punctuation', ']', "Expected ']' after index")
+                expect(TOKEN_RIGHT_BRACKET, "Expected ']' after index")
 
-                if match('operator', '='):
+                if match(TOKEN_ASSIGN):
                     value = parse_expression()
-                    return {'type': 'list_set', 'list': name, 'index': index, 'value': value}
+                    return ListSet(name, index, value)
                 else:
                     # Rewind for normal expression
                     i[0] -= 3  # Go back to before '['
 
-            if match('operator', '='):
+            if match(TOKEN_ASSIGN):
                 value = parse_expression()
-                return {'type': 'assignment', 'name': name, 'value': value}
+                return Assignment(name, value)
 
             # Append method: list.append(value)
-            if match('punctuation', '.'):
-                if match('keyword', 'append'):
-                    expect('punctuation', '(', "Expected '(' after append")
+            if match(TOKEN_DOT):
+                if match(TOKEN_APPEND):
+                    expect(TOKEN_LEFT_PAREN, "Expected '(' after append")
                     value = parse_expression()
-                    expect('punctuation', ')', "Expected ')' after append argument")
-                    return {'type': 'list_append', 'list': name, 'value': value}
+                    expect(TOKEN_RIGHT_PAREN, "Expected ')' after append argument")
+                    return ListAppend(name, value)
                 else:
                     i[0] -= 2  # Rewind if not a method call
 
@@ -261,598 +1154,3705 @@ def parse(tokens):
 
         # Expression statement
         expr = parse_expression()
-        return {'type': 'expression', 'expression': expr}
+        return Expression(expr)
 
     def parse_block():
         #Parse a block of statements.
-        statements = []
-
         # Check for opening brace
-        expect('punctuation', '{', "Expected '{' to start block")
+        expect(TOKEN_LEFT_BRACE, "Expected '{' to start block")
+        key = i[0]
+        statements = resumed_statements(key)
 
         # Parse statements until closing brace
-        while not match('punctuation', '}'):
-            if peek() is None:
-                raise ValueError("Unexpected end of file, missing '}'")
-            statements.append(parse_statement())
+        while not match(TOKEN_RIGHT_BRACE):
+            if i[0] >= count:
+                raise IncompleteInputError("Unexpected end of file, missing '}'")
+            add_statement(key, statements)
 
         return statements
 
     def parse_if_statement():
         #Parse an if statement.
         # Parse condition
-        expect('punctuation', '(', "Expected '(' after 'if'")
+        expect(TOKEN_LEFT_PAREN, "Expected '(' after 'if'")
         condition = parse_expression()
-        expect('punctuation', ')', "Expected ')' after condition")
+        expect(TOKEN_RIGHT_PAREN, "Expected ')' after condition")
 
         # Parse if body
         if_body = parse_block()
 
         # Check for else clause
         else_body = []
-        if match('keyword', 'else'):
+        if match(TOKEN_ELSE):
             else_body = parse_block()
 
-        return {
-            'type': 'if',
-            'condition': condition,
-            'if_body': if_body,
-            'else_body': else_body
-        }
+        return If(condition, if_body, else_body)
 
     def parse_while_statement():
         #Parse a while loop.
         # Parse condition
-        expect('punctuation', '(', "Expected '(' after 'while'")
+        expect(TOKEN_LEFT_PAREN, "Expected '(' after 'while'")
         condition = parse_expression()
-        expect('punctuation', ')', "Expected ')' after condition")
+        expect(TOKEN_RIGHT_PAREN, "Expected ')' after condition")
 
         # Parse body
         body = parse_block()
 
-        return {
-            'type': 'while',
-            'condition': condition,
-            'body': body
-        }
+        return While(condition, body)
+
+    def expect_at(position, code, message):
+        #Return the position after the token expected at position; raise
+        #the same error as expect() if it is missing.
+        if position >= count or types[position] != code:
+            i[0] = position
+            expect(code, message)
+        return position + 1
+
+    def reduce(operators, operands, power):
+        #Apply the pending operators that bind their right operand more
+        #tightly than power to the operands they were given.
+        while operators and operators[-1][0] > power:
+            _, op, prefix = operators.pop()
+            if prefix:
+                operands.append(Unary(op, operands.pop()))
+            else:
+                right = operands.pop()
+                operands.append(Binary(op, operands.pop(), right))
 
     def parse_expression():
-        #Parse an expression.
-        return parse_logical_or()
-
-    def parse_logical_or():
-        #Parse a logical OR expression.
-        expr = parse_logical_and()
-
-        while match('operator', 'or'):
-            right = parse_logical_and()
-            expr = {
-                'type': 'binary',
-                'op': 'or',
-                'left': expr,
-                'right': right
-            }
-
-        return expr
-
-    def parse_logical_and():
-        #Parse a logical AND expression.
-        expr = parse_equality()
-
-        while match('operator', 'and'):
-            right = parse_equality()
-            expr = {
-                'type': 'binary',
-                'op': 'and',
-                'left': expr,
-                'right': right
-            }
-
-        return expr
-
-    def parse_equality():
-        #Parse an equality expression.
-        expr = parse_comparison()
+        #Parse an expression by precedence climbing over the operator
+        #tables. Operators wait on an explicit stack until one that binds
+        #less tightly (or the end) arrives, instead of one Python call per
+        #precedence level. Brackets that hold an inner expression -
+        #grouping, list literals, indexes, len() and input() - push a frame
+        #saving the outer stacks, and closing them makes the inner
+        #expression an operand of the outer one, so long operator chains
+        #and deep nesting do not use up the Python stack. Tokens are read
+        #by position here rather than through check() and match().
+        frames = []
+        operators = []
+        operands = []
+        position = i[0]
+        expecting = True  # Whether an operand comes next
 
         while True:
-            if match('operator', '=='):
-                right = parse_comparison()
-                expr = {
-                    'type': 'binary',
-                    'op': '==',
-                    'left': expr,
-                    'right': right
-                }
-            elif match('operator', '!='):
-                right = parse_comparison()
-                expr = {
-                    'type': 'binary',
-                    'op': '!=',
-                    'left': expr,
-                    'right': right
-                }
-            else:
-                break
+            code = types[position] if position < count else None
+
+            if expecting:
+                # Prefix operators, then a primary expression
+                if code is None:
+                    i[0] = position
+                    raise IncompleteInputError("Unexpected end of file")
+
+                node_class = OPERAND_NODES.get(code)
+                if node_class is not None:
+                    operands.append(node_class(values[position]))
+                    position += 1
+                    expecting = False
+                    continue
 
-        return expr
+                opened = None
+                if code in prefix_operators:
+                    operators.append((prefix_operators[code], values[position], True))
+                    position += 1
+                    continue
+                elif code == TOKEN_LEFT_BRACKET:
+                    # List literal: [1, 2, 3]
+                    position += 1
+                    if position < count and types[position] == TOKEN_RIGHT_BRACKET:
+                        position += 1
+                        operands.append(ListLiteral([]))
+                    else:
+                        opened = ('list', [])
+                elif code == TOKEN_LEFT_PAREN:
+                    # Grouping
+                    position += 1
+                    opened = ('group', None)
+                elif code == TOKEN_INPUT:
+                    # Input function
+                    position = expect_at(position + 1, TOKEN_LEFT_PAREN, "Expected '(' after 'input'")
+                    if position < count and types[position] == TOKEN_RIGHT_PAREN:
+                        position += 1
+                        operands.append(Input(None))
+                    else:
+                        opened = ('input', None)
+                elif code == TOKEN_LEN:
+                    # Length function
+                    position = expect_at(position + 1, TOKEN_LEFT_PAREN, "Expected '(' after 'len'")
+                    opened = ('len', None)
+                else:
+                    i[0] = position
+                    token = tokens[position]
+                    raise ValueError(f"Line {token['line']}: Unexpected token: {token}")
+
+                if opened is not None:
+                    frames.append((opened, operators, operands))
+                    operators = []
+                    operands = []
+                else:
+                    expecting = False
+                continue
 
-    def parse_comparison():
-        #Parse a comparison expression.
-        expr = parse_addition()
+            # Binary operator
+            if code in binary_operators:
+                left_power, right_power = binary_operators[code]
+                if operators and operators[-1][0] > left_power:
+                    reduce(operators, operands, left_power)
+                operators.append((right_power, values[position], False))
+                position += 1
+                expecting = True
+                continue
 
-        while True:
-            if match('operator', '<'):
-                right = parse_addition()
-                expr = {
-                    'type': 'binary',
-                    'op': '<',
-                    'left': expr,
-                    'right': right
-                }
-            elif match('operator', '>'):
-                right = parse_addition()
-                expr = {
-                    'type': 'binary',
-                    'op': '>',
-                    'left': expr,
-                    'right': right
-                }
-            elif match('operator', '<='):
-                right = parse_addition()
-                expr = {
-                    'type': 'binary',
-                    'op': '<=',
-                    'left': expr,
-                    'right': right
-                }
-            elif match('operator', '>='):
-                right = parse_addition()
-                expr = {
-                    'type': 'binary',
-                    'op': '>=',
-                    'left': expr,
-                    'right': right
-                }
+            # Parse list indexing: list[index]
+            if code == TOKEN_LEFT_BRACKET:
+                frames.append((('index', operands.pop()), operators, operands))
+                operators = []
+                operands = []
+                position += 1
+                expecting = True
+                continue
+
+            # Parse function calls like len(list), which replace the operand
+            if code == TOKEN_LEN:
+                position = expect_at(position + 1, TOKEN_LEFT_PAREN, "Expected '(' after len")
+                operands.pop()
+                frames.append((('len', None), operators, operands))
+                operators = []
+                operands = []
+                expecting = True
+                continue
+
+            # End of the expression, or of the one inside the innermost brackets
+            if operators:
+                reduce(operators, operands, 0)
+            expr = operands.pop()
+            if not frames:
+                i[0] = position
+                return expr
+
+            (kind, payload), operators, operands = frames.pop()
+            if kind == 'group':
+                position = expect_at(position, TOKEN_RIGHT_PAREN, "Expected ')'")
+                operands.append(expr)
+            elif kind == 'list':
+                payload.append(expr)
+                if code == TOKEN_COMMA:
+                    frames.append(((kind, payload), operators, operands))
+                    operators = []
+                    operands = []
+                    position += 1
+                    expecting = True
+                else:
+                    position = expect_at(position, TOKEN_RIGHT_BRACKET, "Expected ']' to close list literal")
+                    operands.append(ListLiteral(payload))
+            elif kind == 'index':
+                position = expect_at(position, TOKEN_RIGHT_BRACKET, "Expected ']' after index")
+                operands.append(ListAccess(payload, expr))
+            elif kind == 'len':
+                position = expect_at(position, TOKEN_RIGHT_PAREN, "Expected ')' after len argument")
+                operands.append(Len(expr))
             else:
-                break
+                position = expect_at(position, TOKEN_RIGHT_PAREN, "Expected ')' after input parameters")
+                operands.append(Input(expr))
+
+    # Start parsing from the program level
+    return parse_program()
 
-        return expr
+# Offset of the byte holding the sign and top exponent bits of a double
+_HIGH_BYTE = 7 if sys.byteorder == 'little' else 0
+
+class NumberList:
+    #A Sigil list that stores its elements in an array('d') while they are
+    #all numbers, instead of one boxed float per element. Storing any other
+    #value (a string, boolean or list) converts the storage to a plain list
+    #in place, so every variable holding the list sees the change. The
+    #storage is the items attribute; the interpreter reads it directly.
+    #NumberLists print, compare and concatenate like plain lists.
+    __slots__ = ('items',)
+
+    def __init__(self, items=None):
+        self.items = array.array('d') if items is None else items
+
+    def generalize(self):
+        #Switch the storage to a plain list so it can hold any value.
+        items = self.items
+        if type(items) is not list:
+            items = self.items = items.tolist()
+        return items
+
+    def append(self, value):
+        items = self.items
+        if type(value) is not float and type(items) is not list:
+            items = self.generalize()
+        items.append(value)
+
+    def __setitem__(self, index, value):
+        items = self.items
+        if type(value) is not float and type(items) is not list:
+            items = self.generalize()
+        items[index] = value
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def copy(self):
+        return NumberList(self.items[:])
+
+    def tolist(self):
+        #Return the elements as a plain list.
+        items = self.items
+        return items[:] if type(items) is list else items.tolist()
+
+    def __add__(self, other):
+        if type(other) is NumberList:
+            if type(self.items) is not list and type(other.items) is not list:
+                return NumberList(self.items + other.items)
+            return self.tolist() + other.tolist()
+        if type(other) is list:
+            return self.tolist() + other
+        return NotImplemented
+
+    def __radd__(self, other):
+        if type(other) is list:
+            return other + self.tolist()
+        return NotImplemented
+
+    def __eq__(self, other):
+        if type(other) is NumberList:
+            first, second = self.items, other.items
+            if type(first) is list or type(second) is list:
+                return self.tolist() == other.tolist()
+            if len(first) != len(second):
+                return False
+            # Identical bytes mean equal elements unless one of them is NaN.
+            # NaNs (like infinities and numbers above 2**1009) have the top
+            # exponent bits set, making their high byte 0x7f or 0xff. Anything
+            # else is compared element-wise, which treats 0.0 and -0.0 as equal.
+            data = first.tobytes()
+            if data == second.tobytes():
+                high = data[_HIGH_BYTE::8]
+                if b'\x7f' not in high and b'\xff' not in high:
+                    return True
+            return first == second
+        if type(other) is list:
+            return self.tolist() == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    @reprlib.recursive_repr('[...]')
+    def __repr__(self):
+        return repr(self.tolist())
+
+# Types a Sigil list value can have
+_LIST_TYPES = (list, NumberList)
+
+def _plain_list(value):
+    #Return a copy of a Sigil list as a plain list, with the lists nested in
+    #it copied the same way, so no NumberList shows through. A list nested
+    #in itself is copied once, keeping the cycle.
+    if type(value) is NumberList and type(value.items) is not list:
+        return value.items.tolist()
+    root = []
+    copies = {id(value): root}
+    stack = [(value, root)]
+    while stack:
+        source, target = stack.pop()
+        for item in source:
+            if type(item) is list or type(item) is NumberList:
+                copied = copies.get(id(item))
+                if copied is None:
+                    copied = copies[id(item)] = []
+                    stack.append((item, copied))
+                item = copied
+            target.append(item)
+    return root
+
+# Whether 'name = name + ...' on strings appends to a StringBuilder
+STRING_BUILDERS = True
+
+class StringBuilder:
+    #A string being built by repeated appends. The pieces are joined only
+    #when the text is read; build() caches the result as the single piece,
+    #so appending after a read does not copy the earlier pieces again.
+    #length is the length of the text. StringBuilders only live in the
+    #tree-walker's variable slots.
+    __slots__ = ('parts', 'length')
+
+    def __init__(self, text):
+        self.parts = [text]
+        self.length = len(text)
+
+    def build(self):
+        #Return the text, joining the pending pieces.
+        parts = self.parts
+        if len(parts) > 1:
+            text = "".join(parts)
+            self.parts = parts = [text]
+        return parts[0]
+
+# Whether list literals of numbers are stored as NumberLists (tree backend)
+NUMBER_LISTS = True
+
+def _format_list(value):
+    #Format a list the way string concatenation displays it.
+    return "[" + ", ".join(str(item) for item in value) + "]"
+
+def _add(left, right):
+    #Apply '+' to two values: string/list concatenation or numeric addition.
+    # String concatenation
+    if isinstance(left, str):
+        if isinstance(right, _LIST_TYPES):
+            # Convert list to a readable string format
+            return left + _format_list(right)
+        return left + str(right)
+    if isinstance(right, str):
+        if isinstance(left, _LIST_TYPES):
+            # Convert list to a readable string format
+            return _format_list(left) + right
+        return str(left) + right
+    # List concatenation
+    if isinstance(left, _LIST_TYPES) and isinstance(right, _LIST_TYPES):
+        return left + right
+    # Regular addition for numbers
+    if isinstance(left, bool) or isinstance(right, bool) or isinstance(left, _LIST_TYPES) or isinstance(right, _LIST_TYPES):
+        raise TypeError("Cannot add boolean or mix list with non-list values")
+    return left + right
+
+def _subtract(left, right):
+    #Apply '-' to two numbers.
+    if isinstance(left, bool) or isinstance(right, bool) or isinstance(left, str) or isinstance(right, str) or isinstance(left, _LIST_TYPES) or isinstance(right, _LIST_TYPES):
+        raise TypeError("Cannot subtract boolean, string, or list values")
+    return left - right
+
+def _multiply(left, right):
+    #Apply '*' to two numbers.
+    if isinstance(left, bool) or isinstance(right, bool) or isinstance(left, str) or isinstance(right, str) or isinstance(left, _LIST_TYPES) or isinstance(right, _LIST_TYPES):
+        raise TypeError("Cannot multiply boolean, string, or list values")
+    return left * right
+
+def _divide(left, right):
+    #Apply '/' to two numbers.
+    if isinstance(left, bool) or isinstance(right, bool) or isinstance(left, str) or isinstance(right, str) or isinstance(left, _LIST_TYPES) or isinstance(right, _LIST_TYPES):
+        raise TypeError("Cannot divide boolean, string, or list values")
+    return left / right
+
+def _less(left, right):
+    #Apply '<' to two numbers.
+    if isinstance(left, bool) or isinstance(right, bool) or isinstance(left, str) or isinstance(right, str) or isinstance(left, _LIST_TYPES) or isinstance(right, _LIST_TYPES):
+        raise TypeError("Cannot compare boolean, string, or list values with '<'")
+    return left < right
+
+def _greater(left, right):
+    #Apply '>' to two numbers.
+    if isinstance(left, bool) or isinstance(right, bool) or isinstance(left, str) or isinstance(right, str) or isinstance(left, _LIST_TYPES) or isinstance(right, _LIST_TYPES):
+        raise TypeError("Cannot compare boolean, string, or list values with '>'")
+    return left > right
+
+def _less_equal(left, right):
+    #Apply '<=' to two numbers.
+    if isinstance(left, bool) or isinstance(right, bool) or isinstance(left, str) or isinstance(right, str) or isinstance(left, _LIST_TYPES) or isinstance(right, _LIST_TYPES):
+        raise TypeError("Cannot compare boolean, string, or list values with '<='")
+    return left <= right
+
+def _greater_equal(left, right):
+    #Apply '>=' to two numbers.
+    if isinstance(left, bool) or isinstance(right, bool) or isinstance(left, str) or isinstance(right, str) or isinstance(left, _LIST_TYPES) or isinstance(right, _LIST_TYPES):
+        raise TypeError("Cannot compare boolean, string, or list values with '>='")
+    return left >= right
+
+def _equal(left, right):
+    #Apply '=='; values of different types are never equal.
+    if type(left) != type(right) and not (isinstance(left, _LIST_TYPES) and isinstance(right, _LIST_TYPES)):
+        return False
+    return left == right
+
+def _not_equal(left, right):
+    #Apply '!='; values of different types are always unequal.
+    if type(left) != type(right) and not (isinstance(left, _LIST_TYPES) and isinstance(right, _LIST_TYPES)):
+        return True
+    return left != right
+
+def _logical_and(left, right):
+    #Apply 'and' to two booleans.
+    if not isinstance(left, bool) or not isinstance(right, bool):
+        raise TypeError("Logical 'and' requires boolean operands")
+    return left and right
+
+def _logical_or(left, right):
+    #Apply 'or' to two booleans.
+    if not isinstance(left, bool) or not isinstance(right, bool):
+        raise TypeError("Logical 'or' requires boolean operands")
+    return left or right
+
+def _negate(value):
+    #Apply unary '-' to a number.
+    if isinstance(value, bool) or isinstance(value, str) or isinstance(value, _LIST_TYPES):
+        raise TypeError("Cannot apply unary '-' to a boolean, string, or list value")
+    return -value
+
+def _logical_not(value):
+    #Apply unary '!' to a boolean.
+    if isinstance(value, float) or isinstance(value, str) or isinstance(value, _LIST_TYPES):
+        raise TypeError("Cannot apply unary '!' to a numeric, string, or list value")
+    return not value
+
+# The binary operators. Each entry holds the function applying the operator
+# with the type checks and errors of evaluate(), which every backend shares;
+# the Python function applying it to operands that need no checks; and the
+# operand types for which that is the case (both operands of one type).
+# The Python spelling of each operator is the Sigil one, except for 'and'
+# and 'or', which must evaluate both operands.
+OPERATORS = {
+    '+': (_add, operator.add, (float, str, list)),
+    '-': (_subtract, operator.sub, (float,)),
+    '*': (_multiply, operator.mul, (float,)),
+    '/': (_divide, operator.truediv, (float,)),
+    '<': (_less, operator.lt, (float,)),
+    '>': (_greater, operator.gt, (float,)),
+    '<=': (_less_equal, operator.le, (float,)),
+    '>=': (_greater_equal, operator.ge, (float,)),
+    '==': (_equal, operator.eq, (float, bool, str, list)),
+    '!=': (_not_equal, operator.ne, (float, bool, str, list)),
+    'and': (_logical_and, operator.and_, (bool,)),
+    'or': (_logical_or, operator.or_, (bool,))
+}
+
+# Operator semantics shared by every execution backend
+BINARY_OPERATIONS = {op: checked for op, (checked, unchecked, types) in OPERATORS.items()}
+
+# Operators of nodes marked by infer_types(), applied without type checks
+UNCHECKED_OPERATIONS = {op: unchecked for op, (checked, unchecked, types) in OPERATORS.items()}
+
+# Operand types for which each binary operator is applied without checks
+_UNCHECKED_BINARY_TYPES = {op: types for op, (checked, unchecked, types) in OPERATORS.items()}
+
+# Fast paths for the operators that compute a result from two numbers (not
+# those that compare values of any type or combine booleans)
+NUMERIC_OPERATIONS = {op: unchecked for op, (checked, unchecked, types) in OPERATORS.items()
+                      if float in types and bool not in types}
+
+UNARY_OPERATIONS = {
+    '-': _negate,
+    '!': _logical_not
+}
+
+def _check_index(lst, index):
+    #Validate a list index and return it as an int.
+    if not isinstance(index, float) or int(index) != index:
+        raise TypeError("List index must be an integer")
+
+    index = int(index)
+    if index < 0 or index >= len(lst):
+        raise IndexError("List index out of range")
+    return index
+
+def _list_access(lst, index):
+    #Read an element from a list.
+    if not isinstance(lst, _LIST_TYPES):
+        raise TypeError("Cannot index a non-list value")
+    return lst[_check_index(lst, index)]
+
+def _length(value):
+    #Return the length of a list or string as a number.
+    if not isinstance(value, _LIST_TYPES) and not isinstance(value, str):
+        raise TypeError("len() only works on lists and strings")
+    return float(len(value))
+
+# Literal node kinds, whose value is known before the program runs
+LITERAL_KINDS = (KIND_NUMBER, KIND_BOOLEAN, KIND_STRING)
+
+def _literal(value):
+    #Build the literal node for a folded value, or None if there is none.
+    if type(value) is float:
+        return Number(value)
+    if type(value) is bool:
+        return Boolean(value)
+    if type(value) is str:
+        return String(value)
+    return None
+
+def _literal_list(node):
+    #Return the values of a list literal made only of literals, else None.
+    if node.kind != KIND_LIST_LITERAL:
+        return None
+    if any(elem.kind not in LITERAL_KINDS for elem in node.elements):
+        return None
+    return [elem.value for elem in node.elements]
+
+def fold_constants(ast):
+    #Return a copy of a tree with constant subexpressions folded and branches
+    #whose condition is a known boolean removed. Folding applies the same
+    #operator functions evaluate() uses; anything that would raise (such as
+    #"a" - 1 or 1 / 0) is left in place so the error happens at run time.
+
+    def fold(node):
+        #Fold an expression node.
+        return _reduce_tree(node, fold_node)
+
+    def fold_node(node, children):
+        #Fold an expression node whose child expressions were folded into
+        #children.
+        kind = node.kind
+
+        if kind == KIND_BINARY:
+            left, right = children
+            operation = BINARY_OPERATIONS.get(node.op)
+            if operation is not None and left.kind in LITERAL_KINDS and right.kind in LITERAL_KINDS:
+                try:
+                    folded = _literal(operation(left.value, right.value))
+                except Exception:
+                    folded = None
+                if folded is not None:
+                    return folded
+            return Binary(node.op, left, right)
+
+        if kind == KIND_UNARY:
+            expr = children[0]
+            operation = UNARY_OPERATIONS.get(node.op)
+            if operation is not None and expr.kind in LITERAL_KINDS:
+                try:
+                    folded = _literal(operation(expr.value))
+                except Exception:
+                    folded = None
+                if folded is not None:
+                    return folded
+            return Unary(node.op, expr)
+
+        if kind == KIND_LEN:
+            argument = children[0]
+            if argument.kind == KIND_STRING:
+                return Number(float(len(argument.value)))
+            values = _literal_list(argument)
+            if values is not None:
+                return Number(float(len(values)))
+            return Len(argument)
+
+        if kind == KIND_LIST_ACCESS:
+            lst, index = children
+            values = _literal_list(lst)
+            if values is not None and index.kind in LITERAL_KINDS:
+                try:
+                    return _literal(_list_access(values, index.value))
+                except Exception:
+                    pass
+            return ListAccess(lst, index)
+
+        if kind == KIND_LIST_LITERAL:
+            return ListLiteral(children)
+
+        if kind == KIND_INPUT:
+            return Input(children[0] if children else node.prompt)
+
+        # Literals and variables
+        return node
+
+    def fold_block(statements):
+        #Fold a statement list, splicing in the live branch of constant ifs.
+        folded = []
+        for position, statement in enumerate(statements):
+            for replacement in fold_statement(statement, position == len(statements) - 1):
+                folded.append(_fill_lines(replacement, statement.line))
+        return folded
+
+    def fold_statement(node, last):
+        #Fold a statement into the list of statements that replace it.
+        #A removed statement that was last in its block is kept in an empty
+        #form, so the block still produces None as its result.
+        kind = node.kind
+
+        if kind == KIND_IF:
+            condition = fold(node.condition)
+            if condition.kind == KIND_BOOLEAN:
+                branch = fold_block(node.if_body if condition.value else node.else_body)
+                if branch or not last:
+                    return branch
+                return [If(condition, [], [])]
+            return [If(condition, fold_block(node.if_body), fold_block(node.else_body))]
+
+        if kind == KIND_WHILE:
+            condition = fold(node.condition)
+            if condition.kind == KIND_BOOLEAN and not condition.value:
+                return [] if not last else [While(condition, [])]
+            return [While(condition, fold_block(node.body))]
+
+        if kind == KIND_ASSIGNMENT:
+            return [Assignment(node.name, fold(node.value))]
+        if kind == KIND_PRINT:
+            return [Print(fold(node.expression))]
+        if kind == KIND_EXPRESSION:
+            return [Expression(fold(node.expression))]
+        if kind == KIND_LIST_APPEND:
+            return [ListAppend(node.list, fold(node.value))]
+        if kind == KIND_LIST_SET:
+            return [ListSet(node.list, fold(node.index), fold(node.value))]
+        if kind == KIND_PROGRAM:
+            return [Program(fold_block(node.body))]
+        return [node]
+
+    if isinstance(ast, dict):
+        ast = node_from_dict(ast)
+    if ast.kind == KIND_PROGRAM:
+        return Program(fold_block(ast.body))
+    return Program(fold_block([ast]))
+
+def optimize_program(ast, report=None):
+    #Fold constants in a parsed program. If report is a file, the node counts
+    #before and after folding are written to it.
+    optimized = fold_constants(ast)
+    if report is not None:
+        before, after = count_nodes(ast), count_nodes(optimized)
+        print(f"Nodes: {before} before folding, {after} after ({before - after} removed)", file=report)
+    return optimized
+
+def _join_types(state, first, second):
+    #Merge the variable types of two control flow paths into state. Each
+    #path recorded its assignments in its own layer (a ChainMap) over
+    #state, so only the names a path assigned need joining. Only names
+    #assigned on both paths stay known to be defined.
+    for name in first.maps[0].keys() | second.maps[0].keys():
+        if name in first and name in second:
+            kind = first[name]
+            state[name] = kind if second[name] is kind else None
+
+def _append_operands(node):
+    #Return [a, b, ...] for an assignment 'name = name + a + b ...', else None.
+    operands = []
+    value = node.value
+    while value.type == 'binary' and value.op == '+':
+        operands.append(value.right)
+        value = value.left
+    if not operands or value.type != 'variable' or value.name != node.name:
+        return None
+    operands.reverse()
+    return operands
+
+def infer_types(ast):
+    #Mark the nodes of a program whose operands have known types.
+    #The pass tracks the Python type (float, bool, str or list) of each
+    #variable through assignments, if and while bodies, starting with nothing
+    #known. Variables that are assigned on every path to a read, operators
+    #whose operands are proven to have the types they accept, len() of a
+    #string or list and conditions proven boolean are switched to their
+    #Unchecked* classes, which interpret() runs without type checks. Every
+    #other node keeps its checks, so errors are raised exactly as before.
+    #Assignments 'name = name + ...' whose target is not known to be
+    #something other than a string become StringAppend nodes.
+    #The tree is changed in place and returned.
+
+    def expression(node, state, mark, depth=0):
+        #Return the type of an expression (None if unknown). Below
+        #RECURSION_DEPTH levels the types are left unknown, so the pass
+        #does not recurse without limit.
+        if depth >= RECURSION_DEPTH:
+            return None
 
-    def parse_addition():
-        #Parse an addition expression.
-        expr = parse_multiplication()
+        node_type = node.type
+        depth += 1
+
+        if node_type == 'number':
+            return float
+        if node_type == 'boolean':
+            return bool
+        if node_type == 'string':
+            return str
+
+        if node_type == 'variable':
+            if node.name not in state:
+                return None
+            if mark:
+                node.__class__ = UncheckedVariable
+            return state[node.name]
+
+        if node_type == 'binary':
+            left = expression(node.left, state, mark, depth)
+            right = expression(node.right, state, mark, depth)
+            op = node.op
+            if left is right and left in _UNCHECKED_BINARY_TYPES.get(op, ()):
+                if mark:
+                    node.__class__ = UncheckedBinary
+                return bool if op not in ('+', '-', '*', '/') else left
+            if op == '+' and (left is str or right is str):
+                return str
+            if op in ('and', 'or') or (op in ('==', '!=') and left and right):
+                return bool
+            return None
 
-        while True:
-            if match('operator', '+'):
-                right = parse_multiplication()
-                expr = {
-                    'type': 'binary',
-                    'op': '+',
-                    'left': expr,
-                    'right': right
-                }
-            elif match('operator', '-'):
-                right = parse_multiplication()
-                expr = {
-                    'type': 'binary',
-                    'op': '-',
-                    'left': expr,
-                    'right': right
-                }
-            else:
-                break
+        if node_type == 'unary':
+            operand = expression(node.expr, state, mark, depth)
+            expected = float if node.op == '-' else bool
+            if operand is expected and mark:
+                node.__class__ = UncheckedUnary
+            if node.op == '!':
+                return bool
+            return operand if operand is float else None
+
+        if node_type == 'len':
+            if expression(node.argument, state, mark, depth) in (str, list) and mark:
+                node.__class__ = UncheckedLen
+            return float
+
+        if node_type == 'list_literal':
+            for elem in node.elements:
+                expression(elem, state, mark, depth)
+            return list
+
+        if node_type == 'list_access':
+            expression(node.list, state, mark, depth)
+            expression(node.index, state, mark, depth)
+            return None
 
-        return expr
+        if node_type == 'input':
+            if node.prompt:
+                expression(node.prompt, state, mark, depth)
+            return str
 
-    def parse_multiplication():
-        #Parse a multiplication expression.
-        expr = parse_unary()
+        return None
 
-        while True:
-            if match('operator', '*'):
-                right = parse_unary()
-                expr = {
-                    'type': 'binary',
-                    'op': '*',
-                    'left': expr,
-                    'right': right
-                }
-            elif match('operator', '/'):
-                right = parse_unary()
-                expr = {
-                    'type': 'binary',
-                    'op': '/',
-                    'left': expr,
-                    'right': right
-                }
-            else:
+    def block(statements, state, mark):
+        #Infer the types through a statement list, updating state.
+        for node in statements:
+            statement(node, state, mark)
+
+    def statement(node, state, mark):
+        #Infer the types through a statement, updating state.
+        node_type = node.type
+
+        if node_type == 'assignment':
+            appending = (mark and STRING_BUILDERS and state.get(node.name) in (str, None)
+                         and _append_operands(node) is not None)
+            state[node.name] = expression(node.value, state, mark)
+            if appending:
+                node.__class__ = StringAppend
+                builders.add(node.name)
+
+        elif node_type == 'if':
+            if expression(node.condition, state, mark) is bool and mark:
+                node.__class__ = UncheckedIf
+            if_state = collections.ChainMap({}, state)
+            else_state = collections.ChainMap({}, state)
+            block(node.if_body, if_state, mark)
+            block(node.else_body, else_state, mark)
+            _join_types(state, if_state, else_state)
+
+        elif node_type == 'while':
+            # The body may run any number of times, so the state at the top
+            # of the loop is widened until it stops changing before marking
+            head = collections.ChainMap({}, state)
+            while True:
+                body_state = collections.ChainMap({}, head)
+                expression(node.condition, body_state, False)
+                block(node.body, body_state, False)
+                changed = False
+                for name, kind in body_state.maps[0].items():
+                    if name in head and head[name] is not kind and head[name] is not None:
+                        head[name] = None
+                        changed = True
+                if not changed:
+                    break
+            if mark:
+                body_state = collections.ChainMap({}, head)
+                if expression(node.condition, body_state, True) is bool:
+                    node.__class__ = UncheckedWhile
+                block(node.body, body_state, True)
+            state.update(head.maps[0])
+
+        elif node_type in ('print', 'expression'):
+            expression(node.expression, state, mark)
+
+        elif node_type == 'list_append':
+            expression(node.value, state, mark)
+
+        elif node_type == 'list_set':
+            expression(node.index, state, mark)
+            expression(node.value, state, mark)
+
+        elif node_type == 'program':
+            block(node.body, state, mark)
+
+    # Names assigned by StringAppend nodes; every read of them must join
+    # the text the variable may be building
+    builders = set()
+    statement(ast, {}, True)
+    if builders:
+        stack = [ast]
+        while stack:
+            node = stack.pop()
+            if node.type == 'variable' and node.name in builders:
+                node.__class__ = BuilderVariable
+            stack.extend(child_nodes(node))
+    return ast
+
+def mark_deep_expressions(ast):
+    #Switch the operators more than RECURSION_DEPTH levels down an
+    #expression to their Deep* classes, which the tree-walker evaluates on
+    #an explicit stack instead of recursing once per level. The tree is
+    #changed in place and returned.
+    # Nodes with their level in the expression they belong to; None for
+    # statements
+    stack = [(ast, None)]
+    while stack:
+        node, depth = stack.pop()
+        if depth is None:
+            depth = None if node.type in STATEMENT_TYPES else 0
+        elif depth >= RECURSION_DEPTH:
+            deep_class = DEEP_CLASSES.get(node.type)
+            if deep_class is not None:
+                node.__class__ = deep_class
+        if depth is not None:
+            depth += 1
+        for child in child_nodes(node):
+            stack.append((child, depth))
+    return ast
+
+def report_quickening(environment, file):
+    #Write how often the tree-walker installed and removed each quickened
+    #handler. Handlers specialized more often than deoptimized stayed in use.
+    stats = environment.get('quickening') or {}
+    handlers = sorted({handler for event, handler in stats})
+    if not handlers:
+        print("Quickening: no nodes were specialized", file=file)
+    for handler in handlers:
+        print(f"Quickening: {handler} specialized {stats['specialized', handler]} times, "
+              f"deoptimized {stats['deoptimized', handler]} times", file=file)
+
+# Whether the tree-walker compiles hot while loops to Python functions
+TRACE_LOOPS = True
+
+# Iterations of a while loop (over all its runs) before it is compiled
+TRACE_THRESHOLD = 1000
+
+# Compiled versions per loop, one per set of variable types, before the
+# loop is left to the tree-walker for good
+TRACE_MAX_COMPILES = 4
+
+class LoopTrace:
+    #Tracing state of one while loop in a run of the tree-walker.
+    #countdown is the number of interpreted iterations left before the
+    #compiled loop is (re)entered; it is -1 once the loop is not compiled.
+    #compiled maps the recorded variable types to the compiled loop.
+    __slots__ = ('node', 'slots', 'compiled', 'countdown', 'interpreted_time', 'interpreted_iterations',
+                 'compile_time', 'compiled_time', 'compiled_iterations', 'side_exits', 'failed')
+
+    def __init__(self, node):
+        self.node = node
+        self.slots = {}
+        self.compiled = {}
+        self.countdown = TRACE_THRESHOLD
+        self.interpreted_time = 0.0
+        self.interpreted_iterations = 0
+        self.compile_time = 0.0
+        self.compiled_time = 0.0
+        self.compiled_iterations = 0
+        self.side_exits = 0
+        self.failed = False
+
+        # Slots of every variable the loop reads or writes
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current.type in ('variable', 'assignment'):
+                self.slots[current.name] = current.slot
+            elif current.type in ('list_append', 'list_set'):
+                self.slots[current.list] = current.slot
+            stack.extend(child_nodes(current))
+
+    def saved_time(self):
+        #Estimate the time saved by running the compiled loop: its
+        #iterations at the interpreted cost per iteration, less its run
+        #and compile time.
+        if not self.interpreted_iterations:
+            return -self.compile_time
+        per_iteration = self.interpreted_time / self.interpreted_iterations
+        return self.compiled_iterations * per_iteration - self.compiled_time - self.compile_time
+
+def format_expression(node):
+    #Render an expression node as Sigil source, for reports.
+    return _reduce_tree(node, _format_node)
+
+def _format_node(node, texts):
+    #Render an expression node given the rendered text of its children.
+    def operand(child, text):
+        return f"({text})" if child.type == 'binary' else text
+
+    node_type = node.type
+    if node_type == 'number':
+        return str(int(node.value)) if node.value.is_integer() else repr(node.value)
+    if node_type == 'boolean':
+        return 'true' if node.value else 'false'
+    if node_type == 'string':
+        return '"' + node.value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+    if node_type == 'variable':
+        return node.name
+    if node_type == 'binary':
+        return f"{operand(node.left, texts[0])} {node.op} {operand(node.right, texts[1])}"
+    if node_type == 'unary':
+        return node.op + operand(node.expr, texts[0])
+    if node_type == 'list_literal':
+        return "[" + ", ".join(texts) + "]"
+    if node_type == 'list_access':
+        return f"{texts[0]}[{texts[1]}]"
+    if node_type == 'len':
+        return f"len({texts[0]})"
+    if node_type == 'input':
+        return f"input({texts[0] if texts else ''})"
+    return f"<{node_type}>"
+
+def report_traces(environment, file):
+    #Write which while loops the tree-walker compiled, how many iterations
+    #ran compiled, how often a type check sent a loop back to the
+    #tree-walker, and the estimated time the compiled loops saved.
+    traces = environment.get('traces') or []
+    if not traces:
+        print("Tracing: no loops were compiled", file=file)
+    for trace in traces:
+        description = f"while ({format_expression(trace.node.condition)})"
+        if trace.failed:
+            print(f"Tracing: {description} could not be compiled", file=file)
+            continue
+        print(f"Tracing: {description}: versions {len(trace.compiled)}, "
+              f"compiled iterations {trace.compiled_iterations}, side exits {trace.side_exits}, "
+              f"about {trace.saved_time():.3f}s saved", file=file)
+
+# Statement node types; the profiler counts their runs as line hits
+STATEMENT_TYPES = frozenset(('program', 'expression', 'print', 'assignment', 'list_append', 'list_set',
+                             'if', 'while'))
+
+def describe_node(node):
+    #Render a node as a one-line summary of its source, for reports.
+    node_type = node.type
+    if node_type in ('if', 'while'):
+        return f"{node_type} ({format_expression(node.condition)})"
+    if node_type == 'assignment':
+        return f"{node.name} = {format_expression(node.value)}"
+    if node_type == 'print':
+        return f"print {format_expression(node.expression)}"
+    if node_type == 'expression':
+        return format_expression(node.expression)
+    if node_type == 'list_append':
+        return f"{node.list}.append({format_expression(node.value)})"
+    if node_type == 'list_set':
+        return f"{node.list}[{format_expression(node.index)}] = {format_expression(node.value)}"
+    if node_type == 'program':
+        return "program"
+    return format_expression(node)
+
+class Profile:
+    #Call counts and times collected by interpret(..., profile=Profile()).
+    #nodes maps id(node) to [node, calls, total, self] and lines maps a
+    #source line to [hits, total, self], with times in seconds. A node's
+    #total time includes the nodes it ran, its self time does not. A line's
+    #hits count the statements run on it and its total time is that of its
+    #outermost nodes, so nested nodes on one line are not counted twice.
+    __slots__ = ('nodes', 'lines', 'stack')
+
+    def __init__(self):
+        self.nodes = {}
+        self.lines = {}
+        # [node, time spent in its children] for each node being run
+        self.stack = []
+
+    def wrap(self, function):
+        #Return a version of function (interpret()'s evaluate or execute)
+        #that records the time spent on each node.
+        nodes = self.nodes
+        lines = self.lines
+        stack = self.stack
+        clock = time.perf_counter
+
+        def profiled(node):
+            frame = [node, 0.0]
+            stack.append(frame)
+            start = clock()
+            try:
+                return function(node)
+            finally:
+                elapsed = clock() - start
+                stack.pop()
+                own = elapsed - frame[1]
+
+                record = nodes.get(id(node))
+                if record is None:
+                    record = nodes[id(node)] = [node, 0, 0.0, 0.0]
+                record[1] += 1
+                record[2] += elapsed
+                record[3] += own
+
+                if stack:
+                    parent = stack[-1]
+                    parent[1] += elapsed
+                else:
+                    parent = None
+
+                # The program node spans every line
+                if node.type != 'program':
+                    line = lines.get(node.line)
+                    if line is None:
+                        line = lines[node.line] = [0, 0.0, 0.0]
+                    if node.type in STATEMENT_TYPES:
+                        line[0] += 1
+                    line[2] += own
+                    if parent is None or parent[0].line != node.line:
+                        line[1] += elapsed
+
+        return profiled
+
+    def to_dict(self):
+        #Return the profile as plain data, hottest lines and nodes first.
+        lines = [{'line': line, 'hits': hits, 'total': total, 'self': own}
+                 for line, (hits, total, own) in self.lines.items()]
+        nodes = [{'line': node.line, 'type': node.type, 'source': describe_node(node),
+                  'calls': calls, 'total': total, 'self': own}
+                 for node, calls, total, own in self.nodes.values()]
+        lines.sort(key=lambda entry: entry['self'], reverse=True)
+        nodes.sort(key=lambda entry: entry['self'], reverse=True)
+        return {'lines': lines, 'nodes': nodes}
+
+def report_profile(profile, file, source=None, limit=15):
+    #Write the hottest lines and nodes of a profile, by self time. With the
+    #program's source, each line is shown next to its numbers.
+    data = profile.to_dict()
+    source_lines = source.split('\n') if source is not None else []
+    overall = sum(entry['self'] for entry in data['lines']) or 1.0
+
+    print(f"{'line':>6}{'hits':>10}{'self ms':>10}{'total ms':>10}{'self %':>8}  source", file=file)
+    for entry in data['lines'][:limit]:
+        line = entry['line']
+        text = source_lines[line - 1].strip() if line and line <= len(source_lines) else ""
+        print(f"{line if line is not None else '?':>6}{entry['hits']:>10}{entry['self'] * 1000:>10.1f}"
+              f"{entry['total'] * 1000:>10.1f}{entry['self'] / overall:>8.1%}  {text[:60]}", file=file)
+
+    print(file=file)
+    print(f"{'line':>6}{'calls':>10}{'self ms':>10}{'total ms':>10}  node", file=file)
+    for entry in data['nodes'][:limit]:
+        line = entry['line']
+        print(f"{line if line is not None else '?':>6}{entry['calls']:>10}{entry['self'] * 1000:>10.1f}"
+              f"{entry['total'] * 1000:>10.1f}  {entry['source'][:60]}", file=file)
+
+class LimitError(RuntimeError):
+    #Raised when a program exceeds one of the limits given to interpret().
+    pass
+
+class StepLimitError(LimitError):
+    #The program ran more statements and loop iterations than max_steps.
+    pass
+
+class TimeLimitError(LimitError):
+    #The program ran longer than timeout seconds.
+    pass
+
+class SizeLimitError(LimitError):
+    #A variable or list held a value larger than max_size.
+    pass
+
+# Steps run between two checks of the time limit
+METER_INTERVAL = 1000
+
+class Limits:
+    #Execution limits for interpret(..., limits=Limits(...)); None means
+    #unlimited. max_steps caps the steps a run takes: one per statement
+    #executed and one per loop iteration. timeout is the wall-clock seconds
+    #a run may take; it is checked every METER_INTERVAL steps, so a single
+    #input() prompt can outlast it. max_size caps the size of any value
+    #stored in a variable or list: the characters of a string, or the
+    #elements of a list counting those of every nested list and string (see
+    #_value_size). Exceeding a limit raises StepLimitError, TimeLimitError or
+    #SizeLimitError.
+    __slots__ = ('max_steps', 'timeout', 'max_size')
+
+    def __init__(self, max_steps=None, timeout=None, max_size=None):
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.max_size = max_size
+
+def _value_size(value, limit):
+    #Return the size of a value: the characters of a string, or the
+    #elements of a list plus the size of every list and string nested in it,
+    #each counted once however often it is referenced. Numbers have size 0.
+    #Counting stops once the size passes limit, so a check costs at most
+    #limit steps.
+    value_type = type(value)
+    if value_type is str:
+        return len(value)
+    if value_type is StringBuilder:
+        return value.length
+    if value_type is NumberList:
+        if type(value.items) is not list:
+            return len(value.items)
+    elif value_type is not list:
+        return 0
+
+    size = 0
+    seen = set()
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        value_type = type(value)
+        if value_type is str:
+            size += len(value)
+        else:
+            items = value.items if value_type is NumberList else value
+            size += len(items)
+            if size > limit:
                 break
+            if type(items) is list:
+                for item in items:
+                    item_type = type(item)
+                    if item_type is str or item_type is list or item_type is NumberList:
+                        stack.append(item)
+        if size > limit:
+            break
+    return size
+
+def _steps_exceeded(limit):
+    raise StepLimitError(f"Step limit exceeded: more than {limit} steps")
+
+def _time_exceeded(limit):
+    raise TimeLimitError(f"Time limit exceeded: ran longer than {limit} seconds")
+
+def _size_exceeded(size, limit):
+    raise SizeLimitError(f"Size limit exceeded: a value of size {size} is larger than {limit}")
+
+class OutputSink:
+    #Destination for the values a program prints.
+    #Backends call write() once per print statement; interpret() calls
+    #flush() when the program ends and before input() prompts.
+    def write(self, value):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+class CaptureSink(OutputSink):
+    #Print every value and keep a copy of it in a list (the default).
+    def __init__(self, values=None):
+        self.values = [] if values is None else values
+
+    def write(self, value):
+        print(value)
+
+        # Copy list values to plain lists, so the output stays consistent
+        self.values.append(_plain_list(value) if isinstance(value, _LIST_TYPES) else value)
+
+# Buffered stdout sinks holding unwritten output, flushed before input()
+_PENDING_STDOUT = weakref.WeakSet()
+
+class BufferedStdoutSink(OutputSink):
+    #Write values to stdout in batches instead of one print() per value.
+    def __init__(self, batch_size=1024):
+        self.batch_size = batch_size
+        self.pending = []
+
+    def write(self, value):
+        pending = self.pending
+        if not pending:
+            _PENDING_STDOUT.add(self)
+        pending.append(f"{value}\n")
+        if len(pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            sys.stdout.write("".join(self.pending))
+            self.pending.clear()
+        _PENDING_STDOUT.discard(self)
+
+class RingBufferSink(OutputSink):
+    #Keep only the most recent printed values, without echoing them.
+    def __init__(self, capacity=1000):
+        self.values = collections.deque(maxlen=capacity)
+
+    def write(self, value):
+        self.values.append(_plain_list(value) if isinstance(value, _LIST_TYPES) else value)
+
+class FileSink(OutputSink):
+    #Stream printed values to a file, one per line.
+    #Accepts a path (opened and owned by the sink) or an open text file.
+    def __init__(self, file):
+        self.owned = isinstance(file, (str, os.PathLike))
+        self.file = open(file, 'w', encoding='utf-8') if self.owned else file
+
+    def write(self, value):
+        self.file.write(f"{value}\n")
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if self.owned:
+            self.file.close()
+        else:
+            self.file.flush()
+
+class DiscardSink(OutputSink):
+    #Drop everything a program prints.
+    def write(self, value):
+        pass
+
+class AsyncOutputSink:
+    #Destination for the values printed by interpret_async(), for sinks
+    #that have to wait (on a socket, say). write() and flush() are
+    #coroutines; a program waits for each write before it goes on.
+    async def write(self, value):
+        raise NotImplementedError
+
+    async def flush(self):
+        pass
+
+def make_sink(spec):
+    #Create a sink from a name: capture, buffered[:BATCH], ring[:SIZE],
+    #file:PATH or discard.
+    name, _, argument = spec.partition(':')
+    if name == 'capture' and not argument:
+        return CaptureSink()
+    if name == 'buffered':
+        return BufferedStdoutSink(int(argument)) if argument else BufferedStdoutSink()
+    if name == 'ring':
+        return RingBufferSink(int(argument)) if argument else RingBufferSink()
+    if name == 'file' and argument:
+        return FileSink(argument)
+    if name == 'discard' and not argument:
+        return DiscardSink()
+    raise ValueError(f"Unknown output sink: {spec}")
+
+def output_sink(environment):
+    #Return the environment's sink, installing the default capture sink.
+    #The capture sink records into environment['output'].
+    sink = environment.get('sink')
+    if sink is None:
+        sink = environment['sink'] = CaptureSink(environment.setdefault('output', []))
+    return sink
+
+def _read_input(prompt):
+    #Read a line for input(), first writing out any buffered program output.
+    for sink in list(_PENDING_STDOUT):
+        sink.flush()
+    return input(prompt)
+
+# Marks a Sigil variable that has not been assigned yet
+_UNSET = object()
+
+class VariableSlots(collections.abc.MutableMapping):
+    #Global variables stored in a flat list, one slot per name.
+    #resolve_slots() gives every name in a program its slot index, so the
+    #tree-walker reads and writes values[index] instead of hashing the name.
+    #A slot whose name has not been assigned holds _UNSET. The object is
+    #also a mapping of the assigned names to their values.
+    __slots__ = ('indexes', 'values')
+
+    def __init__(self, variables=()):
+        self.indexes = {}
+        self.values = []
+        self.update(variables)
+
+    def slot(self, name):
+        #Return the slot index of a name, adding an unset slot if it is new.
+        index = self.indexes.get(name)
+        if index is None:
+            index = self.indexes[name] = len(self.values)
+            self.values.append(_UNSET)
+        return index
+
+    def __getitem__(self, name):
+        value = self.values[self.indexes[name]]
+        if value is _UNSET:
+            raise KeyError(name)
+        return value
+
+    def __setitem__(self, name, value):
+        self.values[self.slot(name)] = value
+
+    def __delitem__(self, name):
+        self[name]
+        self.values[self.indexes[name]] = _UNSET
+
+    def __contains__(self, name):
+        index = self.indexes.get(name)
+        return index is not None and self.values[index] is not _UNSET
+
+    def __iter__(self):
+        values = self.values
+        return (name for name, index in list(self.indexes.items()) if values[index] is not _UNSET)
+
+    def __len__(self):
+        return sum(value is not _UNSET for value in self.values)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+def resolve_slots(ast, variables):
+    #Store the slot index of every variable name used in a program on its
+    #nodes (variable reads, assignments, appends and index assignments).
+    #New names get unset slots in variables, a VariableSlots.
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        node_type = node.type
+        if node_type == 'variable' or node_type == 'assignment':
+            node.slot = variables.slot(node.name)
+        elif node_type == 'list_append' or node_type == 'list_set':
+            node.slot = variables.slot(node.list)
+        # Visit the children in source order so slots follow first use
+        stack.extend(reversed(child_nodes(node)))
+
+def interpret(ast, environment=None, backend='tree', output=None, profile=None, prepared=False, limits=None,
+              traces=None):
+    #Interpret an abstract syntax tree.
+    #output selects where printed values go: an OutputSink or a make_sink()
+    #name. By default they are printed and captured in environment['output'].
+    #Given a Profile, the tree-walker records the calls and time of every
+    #node in it; loops are then not compiled, so every node is seen.
+    #Given Limits, the run stops with a LimitError once it exceeds them,
+    #and environment['steps'] holds the number of steps taken, also after
+    #a LimitError.
+    #The tree-walker keeps variables in slots: a plain dict in
+    #environment['variables'] is copied into a VariableSlots for the run,
+    #and the variables are written back to it when the run ends (also on
+    #errors), so the caller's dict is updated in place as before.
+    #prepared says the tree's types were inferred, its deep expressions
+    #marked and its slots resolved for the layout of
+    #environment['variables'] already (CompiledProgram reuses trees this
+    #way), so the tree-walker skips these steps.
+    #traces maps while node ids to the LoopTraces of the tree-walker. Given
+    #the dict of an earlier run of the same tree with the same max_size
+    #(or both without limits), hot loops start out compiled; the run adds
+    #its own loops to it.
+    if environment is None:
+        environment = {'variables': {}, 'output': []}
+
+    if output is not None:
+        environment['sink'] = make_sink(output) if isinstance(output, str) else output
+    sink = output_sink(environment)
 
-        return expr
-
-    def parse_unary():
-        #Parse a unary expression.
-        if match('operator', '-'):
-            expr = parse_unary()
-            return {
-                'type': 'unary',
-                'op': '-',
-                'expr': expr
-            }
-        elif match('operator', '!'):
-            expr = parse_unary()
-            return {
-                'type': 'unary',
-                'op': '!',
-                'expr': expr
-            }
-        return parse_call_or_access()
-
-    def parse_call_or_access():
-        #Parse function calls or list access.
-        expr = parse_primary()
+    if isinstance(ast, dict):
+        ast = node_from_dict(ast)
 
+    if backend != 'tree':
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}")
+        if profile is not None:
+            raise ValueError("Profiling is only supported by the tree backend")
+        if limits is not None and backend != 'bytecode':
+            raise ValueError("Limits are only supported by the tree and bytecode backends")
+        try:
+            if limits is not None:
+                return _interpret_bytecode(ast, environment, limits)
+            return BACKENDS[backend](ast, environment)
+        finally:
+            sink.flush()
+
+    variables = environment['variables']
+    caller_variables = None
+    if not prepared:
+        infer_types(ast)
+        mark_deep_expressions(ast)
+        if not isinstance(variables, VariableSlots):
+            caller_variables = variables
+            variables = VariableSlots(variables)
+        resolve_slots(ast, variables)
+    values = variables.values
+    write = sink.write
+    number_lists = NUMBER_LISTS
+    unchecked = UNCHECKED_OPERATIONS
+
+    # Quickening state: consecutive evaluations with the same operand type
+    # and failed guards, by node id; stats counts (event, handler) pairs
+    warmup = {}
+    deopts = {}
+    stats = environment.setdefault('quickening', collections.Counter())
+
+    def quicken(node, quick_class):
+        #Count an evaluation of a generic node whose operands suit
+        #quick_class, and switch the node to it once it is warm.
+        key = id(node)
+        last_class, count = warmup.get(key, (None, 0))
+        count = count + 1 if last_class is quick_class else 1
+        if count < QUICKEN_THRESHOLD:
+            warmup[key] = (quick_class, count)
+            return
+        warmup.pop(key, None)
+        if deopts.get(key, 0) < QUICKEN_MAX_DEOPTS:
+            node.__class__ = quick_class
+            stats['specialized', quick_class.__name__] += 1
+
+    def deoptimize(node, generic_class):
+        #Switch a quickened node whose guard failed back to the generic path.
+        key = id(node)
+        stats['deoptimized', type(node).__name__] += 1
+        deopts[key] = deopts.get(key, 0) + 1
+        node.__class__ = generic_class
+
+    # Loop tracing state, by while node id
+    tracing = TRACE_LOOPS and profile is None
+    if traces is None or not tracing:
+        traces = {}
+
+    # Limits: fuel counts down the steps left until the next check of the
+    # step and time limits, and spent counts the steps taken before the
+    # current fuel was granted. Metered loops run in traced_while()
+    metered = limits is not None
+    looping = tracing or metered
+    spent = grant = 0
+    if metered:
+        max_steps = limits.max_steps
+        max_size = limits.max_size
+        deadline = None if limits.timeout is None else time.perf_counter() + limits.timeout
+
+    def refuel(left, pending=0):
+        #Account for the steps taken since the last check, enforce the
+        #step and time limits and return the fuel for the next interval.
+        #pending steps are taken off left but not run yet: a compiled loop
+        #stops before a body that would pass the step limit.
+        nonlocal spent, grant
+        spent += grant - left - pending
+        # Until the new grant, the steps taken are all in spent
+        grant = left
+        if max_steps is not None and spent + pending > max_steps:
+            _steps_exceeded(max_steps)
+        if deadline is not None and time.perf_counter() > deadline:
+            _time_exceeded(limits.timeout)
+        grant = METER_INTERVAL if max_steps is None else min(METER_INTERVAL, max_steps - spent)
+        return grant
+
+    fuel = refuel(0) if metered else 0
+
+    def set_fuel(left):
+        #Take back the fuel left by a compiled loop, also when it raised.
+        nonlocal fuel
+        fuel = left
+
+    def read_metered(prompt):
+        #input() under limits: waiting for the line does not count towards
+        #the time limit.
+        nonlocal deadline
+        waited = time.perf_counter()
+        try:
+            return _read_input(prompt)
+        finally:
+            if deadline is not None:
+                deadline += time.perf_counter() - waited
+
+    def run_trace(trace, result):
+        #Run a hot loop as compiled Python from the top of an iteration,
+        #compiling it for the current variable types first if needed.
+        #Returns whether the loop still has to be finished by the
+        #tree-walker, and the loop's result so far.
+        nonlocal fuel
+        types = {}
+        for name, slot in trace.slots.items():
+            value = values[slot]
+            if type(value) is StringBuilder:
+                value = values[slot] = value.build()
+            if value is not _UNSET:
+                types[name] = type(value) if type(value) in TRACE_TYPE_NAMES else None
+
+        key = tuple(types.items())
+        loop = trace.compiled.get(key)
+        if loop is None:
+            if len(trace.compiled) >= TRACE_MAX_COMPILES:
+                trace.countdown = -1
+                return True, result
+            start = time.perf_counter()
+            try:
+                loop = trace.compiled[key] = compile_loop(trace.node, trace.slots, types, limits)
+            except (SyntaxError, RecursionError, MemoryError):
+                # Too deeply nested for the Python compiler
+                trace.failed = True
+                trace.countdown = -1
+                return True, result
+            finally:
+                trace.compile_time += time.perf_counter() - start
+
+        if type(result) is StringBuilder:
+            result = result.build()
+        start = time.perf_counter()
+        if metered:
+            exited, result, iterations = loop(values, write, result, refuel, fuel, set_fuel, read_metered)
+        else:
+            exited, result, iterations = loop(values, write, result)
+        trace.compiled_time += time.perf_counter() - start
+        trace.compiled_iterations += iterations
+        if exited:
+            # A variable changed type: interpret for a while, then retry
+            trace.side_exits += 1
+            trace.countdown = TRACE_THRESHOLD
+        return exited, result
+
+    def traced_while(node):
+        #Execute a while loop, counting its iterations. Once the loop is
+        #hot, the remaining iterations run compiled; a failed type check
+        #hands the loop back at the top of an iteration. Under limits,
+        #every iteration is a step, also when loops are not compiled.
+        nonlocal fuel
+        trace = traces.get(id(node))
+        if trace is None:
+            trace = traces[id(node)] = LoopTrace(node)
+            if not tracing:
+                trace.countdown = -1
+        checked = node.kind == KIND_WHILE
+        condition = node.condition
+        body = node.body
+        result = None
+        iterations = 0
+        start = time.perf_counter()
         while True:
-            # Parse list indexing: list[index]
-            if match('punctuation', '['):
-                index = parse_expression()
-                expect('punctuation', ']', "Expected ']' after index")
-                expr = {
-                    'type': 'list_access',
-                    'list': expr,
-                    'index': index
-                }
-            # Parse function calls like len(list)
-            elif check('keyword', 'len') and peek()['value'] == 'len':
-                advance()  # Consume 'len'
-                expect('punctuation', '(', "Expected '(' after len")
-                arg = parse_expression()
-                expect('punctuation', ')', "Expected ')' after len argument")
-                expr = {
-                    'type': 'len',
-                    'argument': arg
-                }
-            else:
+            if not trace.countdown:
+                trace.interpreted_time += time.perf_counter() - start
+                trace.interpreted_iterations += iterations
+                exited, result = run_trace(trace, result)
+                if not exited:
+                    return result
+                iterations = 0
+                start = time.perf_counter()
+
+            value = evaluate(condition)
+            if checked and not isinstance(value, bool):
+                raise TypeError("Condition must be a boolean expression")
+            if not value:
                 break
 
-        return expr
+            if metered:
+                fuel -= 1
+                if fuel < 0:
+                    fuel = refuel(fuel)
+            for statement in body:
+                result = execute(statement)
+            iterations += 1
+            trace.countdown -= 1
 
-    def parse_primary():
-        #Parse a primary expression.
-        # List literal: [1, 2, 3]
-        if match('punctuation', '['):
-            elements = []
+        trace.interpreted_time += time.perf_counter() - start
+        trace.interpreted_iterations += iterations
+        return result
 
-            # Empty list
-            if match('punctuation', ']'):
-                return {'type': 'list_literal', 'elements': elements}
+    def evaluate(node):
+        #Evaluate an expression node.
+        kind = node.kind
+
+        # Nodes proven safe by infer_types() skip the type checks
+        if kind == KIND_UNCHECKED_VARIABLE:
+            return values[node.slot]
+
+        if kind == KIND_UNCHECKED_BINARY:
+            return unchecked[node.op](evaluate(node.left), evaluate(node.right))
+
+        if kind == KIND_NUMBER or kind == KIND_BOOLEAN or kind == KIND_STRING:
+            return node.value
+
+        if kind == KIND_QUICK_BINARY:
+            left = evaluate(node.left)
+            right = evaluate(node.right)
+            guard = node.guard
+            if type(left) is guard and type(right) is guard:
+                return unchecked[node.op](left, right)
+            deoptimize(node, Binary)
+            return BINARY_OPERATIONS[node.op](left, right)
+
+        if kind == KIND_VARIABLE:
+            value = values[node.slot]
+            if value is _UNSET:
+                raise ValueError(f"Undefined variable: {node.name}")
+            return value
 
-            # List with elements
-            elements.append(parse_expression())
+        if kind == KIND_BUILDER_VARIABLE:
+            value = values[node.slot]
+            if type(value) is StringBuilder:
+                return value.build()
+            if value is _UNSET:
+                raise ValueError(f"Undefined variable: {node.name}")
+            return value
 
-            while match('punctuation', ','):
-                elements.append(parse_expression())
+        if kind == KIND_BINARY:
+            left = evaluate(node.left)
+            right = evaluate(node.right)
+            operation = BINARY_OPERATIONS.get(node.op)
+            if operation is not None:
+                value = operation(left, right)
+                operand_type = type(left)
+                if operand_type is type(right) and operand_type in _UNCHECKED_BINARY_TYPES[node.op]:
+                    quicken(node, QUICK_BINARY_CLASSES[operand_type])
+                return value
+
+        elif kind == KIND_QUICK_LIST_ACCESS:
+            lst = evaluate(node.list)
+            index = evaluate(node.index)
+            if type(index) is float and (type(lst) is list or type(lst) is NumberList):
+                items = lst if type(lst) is list else lst.items
+                position = int(index)
+                if position == index and 0 <= position < len(items):
+                    return items[position]
+                return _list_access(lst, index)
+            deoptimize(node, ListAccess)
+            return _list_access(lst, index)
+
+        elif kind == KIND_LIST_ACCESS:
+            lst = evaluate(node.list)
+            index = evaluate(node.index)
+            value = _list_access(lst, index)
+            if type(index) is float and (type(lst) is list or type(lst) is NumberList):
+                quicken(node, QuickListAccess)
+            return value
 
-            expect('punctuation', ']', "Expected ']' to close list literal")
+        elif kind == KIND_QUICK_LEN:
+            value = evaluate(node.argument)
+            if type(value) is node.guard:
+                return float(len(value))
+            deoptimize(node, Len)
+            return _length(value)
+
+        elif kind == KIND_UNARY:
+            expr_value = evaluate(node.expr)
+            operation = UNARY_OPERATIONS.get(node.op)
+            if operation is not None:
+                return operation(expr_value)
+
+        elif kind == KIND_LEN:
+            value = evaluate(node.argument)
+            length = _length(value)
+            quick_class = QUICK_LEN_CLASSES.get(type(value))
+            if quick_class is not None:
+                quicken(node, quick_class)
+            return length
+
+        elif kind == KIND_UNCHECKED_UNARY:
+            value = evaluate(node.expr)
+            return -value if node.op == '-' else not value
+
+        elif kind == KIND_UNCHECKED_LEN:
+            value = evaluate(node.argument)
+            return float(len(value.items if type(value) is NumberList else value))
+
+        elif kind == KIND_LIST_LITERAL:
+            return make_list([evaluate(elem) for elem in node.elements])
+
+        elif kind == KIND_INPUT:
+            prompt = ""
+            if node.prompt:
+                prompt = str(evaluate(node.prompt))
+            if metered:
+                return read_metered(prompt)
+            return _read_input(prompt)
 
-            return {'type': 'list_literal', 'elements': elements}
+        elif kind == KIND_DEEP:
+            return _reduce_tree(node, evaluate_deep, is_deep, 0)
 
-        # Literals
-        if check('number'):
-            return {'type': 'number', 'value': advance()['value']}
+        raise ValueError(f"Unknown node type or operation: {node}")
 
-        if check('boolean'):
-            return {'type': 'boolean', 'value': advance()['value']}
+    def make_list(elements):
+        #Return the Sigil list holding the values of a list literal.
+        if number_lists:
+            for element in elements:
+                if type(element) is not float:
+                    return elements
+            return NumberList(array.array('d', elements))
+        return elements
+
+    def is_deep(node):
+        #Whether evaluate() must not recurse into an expression node.
+        return node.kind == KIND_DEEP
+
+    def evaluate_deep(node, operands):
+        #Evaluate a node of an expression too deep for evaluate() to recurse
+        #through, given the values of its children. Deep* nodes are taken
+        #apart on the explicit stack of _reduce_tree(), and the literals
+        #and variables below them go to evaluate(). The operations and
+        #errors are those of the generic nodes.
+        if node.kind != KIND_DEEP:
+            return evaluate(node)
+
+        node_type = node.type
+        if node_type == 'binary':
+            operation = BINARY_OPERATIONS.get(node.op)
+            if operation is not None:
+                return operation(operands[0], operands[1])
+        elif node_type == 'unary':
+            operation = UNARY_OPERATIONS.get(node.op)
+            if operation is not None:
+                return operation(operands[0])
+        elif node_type == 'list_access':
+            return _list_access(operands[0], operands[1])
+        elif node_type == 'len':
+            return _length(operands[0])
+        elif node_type == 'list_literal':
+            return make_list(operands)
+        elif node_type == 'input':
+            prompt = str(operands[0]) if operands else ""
+            if metered:
+                return read_metered(prompt)
+            return _read_input(prompt)
 
-        if check('string'):
-            return {'type': 'string', 'value': advance()['value']}
+        raise ValueError(f"Unknown node type or operation: {node}")
 
-        # Variable
-        if check('identifier'):
-            return {'type': 'variable', 'name': advance()['value']}
+    def execute(node):
+        #Execute a statement node.
+        kind = node.kind
 
-        # Input function
-        if match('keyword', 'input'):
-            expect('punctuation', '(', "Expected '(' after 'input'")
-            prompt = None
-            if not check('punctuation', ')'):
-                prompt = parse_expression()
-            expect('punctuation', ')', "Expected ')' after input parameters")
-            return {'type': 'input', 'prompt': prompt}
+        if kind == KIND_ASSIGNMENT:
+            value = evaluate(node.value)
+            values[node.slot] = value
+            return value
 
-        # Length function
-        if match('keyword', 'len'):
-            expect('punctuation', '(', "Expected '(' after 'len'")
-            arg = parse_expression()
-            expect('punctuation', ')', "Expected ')' after len argument")
-            return {'type': 'len', 'argument': arg}
+        if kind == KIND_STRING_APPEND:
+            # name = name + a + b ...: while name holds text, add the pieces
+            # to its StringBuilder. Each piece is what '+' on a string would
+            # append; all are evaluated first, as the copying version would
+            current = values[node.slot]
+            if type(current) is StringBuilder or type(current) is str:
+                pieces = []
+                for operand in _append_operands(node):
+                    value = evaluate(operand)
+                    pieces.append(_format_list(value) if isinstance(value, _LIST_TYPES) else str(value))
+                if type(current) is str:
+                    current = values[node.slot] = StringBuilder(current)
+                current.parts.extend(pieces)
+                current.length += sum(map(len, pieces))
+                return current
+            # Not text (a number accumulator, say): make this a plain
+            # assignment from now on
+            node.__class__ = Assignment
+            value = evaluate(node.value)
+            values[node.slot] = value
+            return value
 
-        # Grouping
-        if match('punctuation', '('):
-            expr = parse_expression()
-            expect('punctuation', ')', "Expected ')'")
-            return expr
+        if kind == KIND_UNCHECKED_IF:
+            result = None
+            for statement in (node.if_body if evaluate(node.condition) else node.else_body):
+                result = execute(statement)
+            return result
 
-        # Error
-        token = peek()
-        if token:
-            raise ValueError(f"Line {token['line']}: Unexpected token: {token}")
-        else:
-            raise ValueError("Unexpected end of file")
+        if kind == KIND_UNCHECKED_WHILE:
+            if looping:
+                return traced_while(node)
+            result = None
+            condition = node.condition
+            body = node.body
+            while evaluate(condition):
+                for statement in body:
+                    result = execute(statement)
+            return result
 
-    # Start parsing from the program level
-    return parse_program()
+        if kind == KIND_IF:
+            condition = evaluate(node.condition)
+            if not isinstance(condition, bool):
+                raise TypeError("Condition must be a boolean expression")
 
-def interpret(ast, environment=None):
-    #Interpret an abstract syntax tree.
-    if environment is None:
-        environment = {'variables': {}, 'output': []}
+            result = None
+            if condition:
+                for statement in node.if_body:
+                    result = execute(statement)
+            else:
+                for statement in node.else_body:
+                    result = execute(statement)
+            return result
 
-    def evaluate(node):
-        #Evaluate an expression node.
-        if node['type'] == 'number':
-            return node['value']
+        if kind == KIND_WHILE:
+            if looping:
+                return traced_while(node)
+            result = None
+            while True:
+                condition = evaluate(node.condition)
+                if not isinstance(condition, bool):
+                    raise TypeError("Condition must be a boolean expression")
+
+                if not condition:
+                    break
 
-        if node['type'] == 'boolean':
-            return node['value']
+                for statement in node.body:
+                    result = execute(statement)
 
-        if node['type'] == 'string':
-            return node['value']
+            return result
 
-        if node['type'] == 'list_literal':
-            elements = [evaluate(elem) for elem in node['elements']]
-            return elements
+        if kind == KIND_PRINT:
+            value = evaluate(node.expression)
+            write(value)
+            return value
 
-        if node['type'] == 'list_access':
-            lst = evaluate(node['list'])
-            index = evaluate(node['index'])
+        if kind == KIND_LIST_APPEND:
+            lst = values[node.slot]
+            if lst is _UNSET:
+                raise ValueError(f"Undefined variable: {node.list}")
 
-            if not isinstance(lst, list):
-                raise TypeError("Cannot index a non-list value")
+            if not isinstance(lst, _LIST_TYPES):
+                raise TypeError("Cannot append to a non-list value")
 
-            if not isinstance(index, float) or int(index) != index:
-                raise TypeError("List index must be an integer")
+            value = evaluate(node.value)
+            if type(lst) is NumberList:
+                # Append to the storage, switching it to a plain list first
+                # if the value is not a number
+                items = lst.items
+                if type(value) is not float and type(items) is not list:
+                    items = lst.generalize()
+                items.append(value)
+            else:
+                lst.append(value)
+            return value
 
-            index = int(index)
-            if index < 0 or index >= len(lst):
-                raise IndexError("List index out of range")
+        if kind == KIND_LIST_SET:
+            lst = values[node.slot]
+            if lst is _UNSET:
+                raise ValueError(f"Undefined variable: {node.list}")
 
-            return lst[index]
+            if not isinstance(lst, _LIST_TYPES):
+                raise TypeError("Cannot index-assign to a non-list value")
 
-        if node['type'] == 'len':
-            value = evaluate(node['argument'])
+            index = _check_index(lst, evaluate(node.index))
+            value = evaluate(node.value)
+            if type(lst) is NumberList:
+                items = lst.items
+                if type(value) is not float and type(items) is not list:
+                    items = lst.generalize()
+                items[index] = value
+            else:
+                lst[index] = value
+            return value
 
-            if not isinstance(value, list) and not isinstance(value, str):
-                raise TypeError("len() only works on lists and strings")
+        if kind == KIND_EXPRESSION:
+            return evaluate(node.expression)
 
-            return float(len(value))
+        if kind == KIND_PROGRAM:
+            result = None
+            for statement in node.body:
+                result = execute(statement)
+            return result
 
-        if node['type'] == 'variable':
-            name = node['name']
-            if name not in environment['variables']:
-                raise ValueError(f"Undefined variable: {name}")
-            return environment['variables'][name]
+        raise ValueError(f"Unknown node type: {node.type}")
+
+    if metered:
+        run_statement = execute
+
+        def execute(node):
+            #Count a step for a statement, run it and check the size of the
+            #value it stored.
+            nonlocal fuel
+            fuel -= 1
+            if fuel < 0:
+                fuel = refuel(fuel)
+            result = run_statement(node)
+            if max_size is not None:
+                kind = node.kind
+                if kind == KIND_LIST_APPEND:
+                    # The whole list, with what it already held
+                    size = _value_size(values[node.slot], max_size)
+                elif kind == KIND_ASSIGNMENT or kind == KIND_STRING_APPEND or kind == KIND_LIST_SET:
+                    size = _value_size(result, max_size)
+                else:
+                    return result
+                if size > max_size:
+                    _size_exceeded(size, max_size)
+            return result
 
-        if node['type'] == 'input':
-            prompt = ""
-            if node['prompt']:
-                prompt = str(evaluate(node['prompt']))
-            return input(prompt)
+    if profile is not None:
+        evaluate = profile.wrap(evaluate)
+        execute = profile.wrap(execute)
 
-        if node['type'] == 'unary':
-            expr_value = evaluate(node['expr'])
+    try:
+        result = execute(ast)
+        if type(result) is StringBuilder:
+            result = result.build()
+        return result, environment
+    finally:
+        # Variables never hold a StringBuilder outside this function
+        for index, value in enumerate(values):
+            if type(value) is StringBuilder:
+                values[index] = value.build()
+        if caller_variables is not None:
+            caller_variables.update(variables)
+        environment.setdefault('traces', []).extend(
+            trace for trace in traces.values() if trace.compiled or trace.failed)
+        if metered:
+            environment['steps'] = spent + grant - fuel
+        sink.flush()
+
+def compile_closures(ast):
+    #Compile an abstract syntax tree into a tree of pre-bound closures.
+    #Expression closures take the variables dict, statement closures take the
+    #environment. The returned function runs the program against an environment.
+
+    def compile_expression(node, depth=0):
+        #Compile an expression node into a closure over the variables dict.
+        #Operators below RECURSION_DEPTH levels are compiled by
+        #compile_deep() instead, with what is below them.
+        if depth >= RECURSION_DEPTH and is_operator(node):
+            return compile_deep(node)
+        depth += 1
+        node_type = node['type']
+
+        if node_type in ('number', 'boolean', 'string'):
+            value = node['value']
+            return lambda variables: value
+
+        if node_type == 'variable':
+            name = node['name']
 
+            def evaluate_variable(variables):
+                try:
+                    return variables[name]
+                except KeyError:
+                    raise ValueError(f"Undefined variable: {name}") from None
+            return evaluate_variable
+
+        if node_type == 'list_literal':
+            elements = [compile_expression(elem, depth) for elem in node['elements']]
+            return lambda variables: [element(variables) for element in elements]
+
+        if node_type == 'list_access':
+            lst = compile_expression(node['list'], depth)
+            index = compile_expression(node['index'], depth)
+            return lambda variables: _list_access(lst(variables), index(variables))
+
+        if node_type == 'len':
+            argument = compile_expression(node['argument'], depth)
+            return lambda variables: _length(argument(variables))
+
+        if node_type == 'input':
+            if not node['prompt']:
+                return lambda variables: _read_input("")
+            prompt = compile_expression(node['prompt'], depth)
+            return lambda variables: _read_input(str(prompt(variables)))
+
+        if node_type == 'unary' and node['op'] in UNARY_OPERATIONS:
+            operation = UNARY_OPERATIONS[node['op']]
+            operand = compile_expression(node['expr'], depth)
             if node['op'] == '-':
-                if isinstance(expr_value, bool) or isinstance(expr_value, str) or isinstance(expr_value, list):
-                    raise TypeError("Cannot apply unary '-' to a boolean, string, or list value")
-                return -expr_value
-
-            if node['op'] == '!':
-                if isinstance(expr_value, float) or isinstance(expr_value, str) or isinstance(expr_value, list):
-                    raise TypeError("Cannot apply unary '!' to a numeric, string, or list value")
-                return not expr_value
-
-        if node['type'] == 'binary':
-            left = evaluate(node['left'])
-            right = evaluate(node['right'])
-            op = node['op']
-            
-            
-            
-
-
-            # Arithmetic operations
-            if op == '+':
-                # String concatenation
-                if isinstance(left, str):
-                    if isinstance(right, list):
-                        # Convert list to a readable string format
-                        formatted_list = "[" + ", ".join(str(item) for item in right) + "]"
-                        return left + formatted_list
-                    return left + str(right)
-                if isinstance(right, str):
-                    if isinstance(left, list):
-                        # Convert list to a readable string format
-                        formatted_list = "[" + ", ".join(str(item) for item in left) + "]"
-                        return formatted_list + right
-                    return str(left) + right
-                # List concatenation
-                if isinstance(left, list) and isinstance(right, list):
-                    return left + right
-                # Regular addition for numbers
-                if isinstance(left, bool) or isinstance(right, bool) or isinstance(left, list) or isinstance(right, list):
-                    raise TypeError("Cannot add boolean or mix list with non-list values")
-                return left + right
-
-            if op == '-':
-                if isinstance(left, bool) or isinstance(right, bool) or isinstance(left, str) or isinstance(right, str) or isinstance(left, list) or isinstance(right, list):
-                    raise TypeError("Cannot subtract boolean, string, or list values")
-                return left - right
-
-            if op == '*':
-                if isinstance(left, bool) or isinstance(right, bool) or isinstance(left, str) or isinstance(right, str) or isinstance(left, list) or isinstance(right, list):
-                    raise TypeError("Cannot multiply boolean, string, or list values")
-                return left * right
-
-            if op == '/':
-                if isinstance(left, bool) or isinstance(right, bool) or isinstance(left, str) or isinstance(right, str) or isinstance(left, list) or isinstance(right, list):
-                    raise TypeError("Cannot divide boolean, string, or list values")
-                return left / right
-
-            # Comparison operations
-            if op == '<':
-                if isinstance(left, bool) or isinstance(right, bool) or isinstance(left, str) or isinstance(right, str) or isinstance(left, list) or isinstance(right, list):
-                    raise TypeError("Cannot compare boolean, string, or list values with '<'")
-                return left < right
-
-            if op == '>':
-                if isinstance(left, bool) or isinstance(right, bool) or isinstance(left, str) or isinstance(right, str) or isinstance(left, list) or isinstance(right, list):
-                    raise TypeError("Cannot compare boolean, string, or list values with '>'")
-                return left > right
-
-            if op == '<=':
-                if isinstance(left, bool) or isinstance(right, bool) or isinstance(left, str) or isinstance(right, str) or isinstance(left, list) or isinstance(right, list):
-                    raise TypeError("Cannot compare boolean, string, or list values with '<='")
-                return left <= right
-
-            if op == '>=':
-                if isinstance(left, bool) or isinstance(right, bool) or isinstance(left, str) or isinstance(right, str) or isinstance(left, list) or isinstance(right, list):
-                    raise TypeError("Cannot compare boolean, string, or list values with '>='")
-                return left >= right
-
-            # Equality operations
-            if op == '==':
-                # Only allow comparison between same types
-                if type(left) != type(right):
-                    return False
-                return left == right
-
-            if op == '!=':
-                # Only allow comparison between same types
-                if type(left) != type(right):
-                    return True
-                return left != right
+                def evaluate_negate(variables):
+                    value = operand(variables)
+                    if type(value) is float:
+                        return -value
+                    return operation(value)
+                return evaluate_negate
+            return lambda variables: operation(operand(variables))
+
+        if node_type == 'binary' and node['op'] in BINARY_OPERATIONS:
+            return compile_binary(node, depth)
+
+        def unknown(variables):
+            raise ValueError(f"Unknown node type or operation: {node}")
+        return unknown
+
+    def compile_binary(node, depth):
+        #Compile a binary operation, resolving the operator ahead of time.
+        operation = BINARY_OPERATIONS[node['op']]
+        numeric = NUMERIC_OPERATIONS.get(node['op'])
+        left = compile_expression(node['left'], depth)
+        right = compile_expression(node['right'], depth)
+
+        if numeric is None:
+            return lambda variables: operation(left(variables), right(variables))
+
+        # Common loop shapes: 'name op number' and 'expr op number'
+        if node['right']['type'] == 'number':
+            constant = node['right']['value']
+            if node['left']['type'] == 'variable':
+                name = node['left']['name']
+
+                def evaluate_variable_constant(variables):
+                    try:
+                        value = variables[name]
+                    except KeyError:
+                        raise ValueError(f"Undefined variable: {name}") from None
+                    if type(value) is float:
+                        return numeric(value, constant)
+                    return operation(value, constant)
+                return evaluate_variable_constant
+
+            def evaluate_constant(variables):
+                value = left(variables)
+                if type(value) is float:
+                    return numeric(value, constant)
+                return operation(value, constant)
+            return evaluate_constant
+
+        def evaluate_binary(variables):
+            left_value = left(variables)
+            right_value = right(variables)
+            if type(left_value) is float and type(right_value) is float:
+                return numeric(left_value, right_value)
+            return operation(left_value, right_value)
+        return evaluate_binary
+
+    def is_operator(node):
+        #Whether an expression node computes its value from child nodes.
+        node_type = node['type']
+        if node_type == 'binary':
+            return node['op'] in BINARY_OPERATIONS
+        if node_type == 'unary':
+            return node['op'] in UNARY_OPERATIONS
+        if node_type == 'input':
+            return bool(node['prompt'])
+        return node_type in ('list_literal', 'list_access', 'len')
+
+    def compile_deep(root):
+        #Compile an expression too deep for nested closures, which would
+        #recurse once per level when run. Its operators are listed in the
+        #order evaluation finishes them, with the literals, variables and
+        #unknown operations below them compiled as closures, and the list is
+        #run on an explicit stack of values.
+        steps = []
+
+        def add_step(node, operands):
+            #Append the step for a node; operands are ignored.
+            node_type = node['type']
+            if not is_operator(node):
+                steps.append((None, compile_expression(node)))
+            elif node_type == 'binary':
+                steps.append((2, BINARY_OPERATIONS[node['op']]))
+            elif node_type == 'unary':
+                steps.append((1, UNARY_OPERATIONS[node['op']]))
+            elif node_type == 'list_access':
+                steps.append((2, _list_access))
+            elif node_type == 'len':
+                steps.append((1, _length))
+            elif node_type == 'input':
+                steps.append((1, lambda prompt: _read_input(str(prompt))))
+            else:
+                steps.append((len(node['elements']), lambda *elements: list(elements)))
+
+        _reduce_tree(root, add_step, is_operator)
+
+        def evaluate_deep(variables):
+            values = []
+            for count, function in steps:
+                if count is None:
+                    values.append(function(variables))
+                elif count:
+                    operands = values[-count:]
+                    del values[-count:]
+                    values.append(function(*operands))
+                else:
+                    values.append(function())
+            return values[-1]
+        return evaluate_deep
 
-            # Logical operations
-            if op == 'and':
-                if not isinstance(left, bool) or not isinstance(right, bool):
-                    raise TypeError("Logical 'and' requires boolean operands")
-                return left and right
+    def compile_block(statements):
+        #Compile a statement list into a closure returning the last result.
+        compiled = [compile_statement(statement) for statement in statements]
 
-            if op == 'or':
-                if not isinstance(left, bool) or not isinstance(right, bool):
-                    raise TypeError("Logical 'or' requires boolean operands")
-                return left or right
+        if not compiled:
+            return lambda environment: None
 
-        raise ValueError(f"Unknown node type or operation: {node}")
+        if len(compiled) == 1:
+            return compiled[0]
 
-    def execute(node):
-        #Execute a statement node.
-        if node['type'] == 'program':
+        def run_block(environment):
             result = None
-            for statement in node['body']:
-                result = execute(statement)
+            for statement in compiled:
+                result = statement(environment)
             return result
+        return run_block
 
-        if node['type'] == 'expression':
-            return evaluate(node['expression'])
-        
-        
-        
+    def compile_statement(node):
+        #Compile a statement node into a closure over the environment.
+        node_type = node['type']
 
+        if node_type == 'expression':
+            expression = compile_expression(node['expression'])
+            return lambda environment: expression(environment['variables'])
 
-        if node['type'] == 'print':
-            value = evaluate(node['expression'])
-            print(value)
+        if node_type == 'print':
+            expression = compile_expression(node['expression'])
 
-            # Make a deep copy of list values to ensure the output stays consistent
-            if isinstance(value, list):
-                output_value = value.copy()
-            else:
-                output_value = value
+            def run_print(environment):
+                value = expression(environment['variables'])
+                environment['sink'].write(value)
+                return value
+            return run_print
 
-            environment['output'].append(output_value)
-            return value
+        if node_type == 'assignment':
+            name = node['name']
+            expression = compile_expression(node['value'])
 
-        if node['type'] == 'assignment':
-            value = evaluate(node['value'])
-            environment['variables'][node['name']] = value
-            return value
+            def run_assignment(environment):
+                variables = environment['variables']
+                value = variables[name] = expression(variables)
+                return value
+            return run_assignment
 
-        if node['type'] == 'list_append':
+        if node_type == 'list_append':
             list_name = node['list']
-            if list_name not in environment['variables']:
-                raise ValueError(f"Undefined variable: {list_name}")
+            expression = compile_expression(node['value'])
 
-            lst = environment['variables'][list_name]
-            if not isinstance(lst, list):
-                raise TypeError("Cannot append to a non-list value")
+            def run_append(environment):
+                variables = environment['variables']
+                if list_name not in variables:
+                    raise ValueError(f"Undefined variable: {list_name}")
 
-            value = evaluate(node['value'])
-            lst.append(value)
-            return value
+                lst = variables[list_name]
+                if not isinstance(lst, _LIST_TYPES):
+                    raise TypeError("Cannot append to a non-list value")
+
+                value = expression(variables)
+                lst.append(value)
+                return value
+            return run_append
 
-        if node['type'] == 'list_set':
+        if node_type == 'list_set':
             list_name = node['list']
-            if list_name not in environment['variables']:
-                raise ValueError(f"Undefined variable: {list_name}")
+            index = compile_expression(node['index'])
+            expression = compile_expression(node['value'])
+
+            def run_list_set(environment):
+                variables = environment['variables']
+                if list_name not in variables:
+                    raise ValueError(f"Undefined variable: {list_name}")
+
+                lst = variables[list_name]
+                if not isinstance(lst, _LIST_TYPES):
+                    raise TypeError("Cannot index-assign to a non-list value")
+
+                position = _check_index(lst, index(variables))
+                value = expression(variables)
+                lst[position] = value
+                return value
+            return run_list_set
+
+        if node_type == 'if':
+            condition = compile_expression(node['condition'])
+            if_body = compile_block(node['if_body'])
+            else_body = compile_block(node['else_body'])
+
+            def run_if(environment):
+                value = condition(environment['variables'])
+                if value is True:
+                    return if_body(environment)
+                if value is False:
+                    return else_body(environment)
+                raise TypeError("Condition must be a boolean expression")
+            return run_if
+
+        if node_type == 'while':
+            condition = compile_expression(node['condition'])
+            body = compile_block(node['body'])
+
+            def run_while(environment):
+                variables = environment['variables']
+                result = None
+                while True:
+                    value = condition(variables)
+                    if value is not True:
+                        if value is False:
+                            break
+                        raise TypeError("Condition must be a boolean expression")
+                    result = body(environment)
+                return result
+            return run_while
+
+        def unknown(environment):
+            raise ValueError(f"Unknown node type: {node_type}")
+        return unknown
+
+    if ast['type'] != 'program':
+        program = compile_statement(ast)
+    else:
+        program = compile_block(ast['body'])
+
+    def run(environment):
+        output_sink(environment)
+        return program(environment)
+    return run
+
+def _interpret_closures(ast, environment):
+    #Run a program with the closure-compiling backend.
+    return compile_closures(ast)(environment), environment
+
+def _undefined(name):
+    #Raise the error for reading an unassigned variable.
+    raise ValueError(f"Undefined variable: {name}")
+
+def _unknown_expression(node):
+    #Raise the error for an expression node no backend understands.
+    raise ValueError(f"Unknown node type or operation: {node}")
+
+def _unknown_statement(node_type):
+    #Raise the error for a statement node no backend understands.
+    raise ValueError(f"Unknown node type: {node_type}")
+
+def _string_piece(value):
+    #Return the text '+' appends to a string for a value.
+    return _format_list(value) if isinstance(value, _LIST_TYPES) else str(value)
+
+# Guards for the variable types a traced loop was compiled for
+TRACE_TYPE_NAMES = {float: '_float', bool: '_bool', str: '_str', list: '_list', NumberList: '_number_list'}
+
+def _assigned_names(statements):
+    #Return the names assigned anywhere in a statement list.
+    names = set()
+    stack = list(statements)
+    while stack:
+        node = stack.pop()
+        if node.type == 'assignment':
+            names.add(node.name)
+        stack.extend(child_nodes(node))
+    return names
+
+def translate_to_python(ast, slots=None, types=None, limits=None):
+    #Translate an abstract syntax tree into the source of a Python function.
+    #Sigil variables become locals of the generated function: they are read
+    #from the environment on entry and written back on exit. Every operator
+    #gets an inline type guard for its fast path and falls back to the shared
+    #operator functions, so errors are raised exactly where evaluate() raises.
+    #Operators whose operand types are known (from literals and assignments
+    #earlier in the same block) need no guard.
+    #Given slots (name -> slot index), ast is a while loop for the loop
+    #tracer instead: _sigil_loop(_values, _write, _result) loads the loop's
+    #variables from the slot list _values and checks at the top of every
+    #iteration that the variables in types still have the recorded type
+    #(a key of TRACE_TYPE_NAMES, or None for no check). It returns
+    #(exited, result, iterations), with exited True if a check failed
+    #before the loop finished. Given Limits as well, the loop takes the
+    #tree-walker's refuel function and fuel as _meter and _fuel, counts
+    #steps like the tree-walker and refuels at the top of iterations; when
+    #it returns or raises, it hands the fuel left to _set_fuel. input()
+    #calls the run's _read_input, the last argument, and stored values are
+    #checked against max_size.
+    #Returns the source and the constant pool it refers to.
+    lines = []
+    constants = []
+    names = {}
+    assigned = set()
+    counter = [0]
+    loop_mode = slots is not None
+    metered = loop_mode and limits is not None
+    max_size = limits.max_size if metered else None
+
+    def emit(depth, line):
+        lines.append('    ' * depth + line)
+
+    def temporary():
+        counter[0] += 1
+        return f"_t{counter[0]}"
+
+    def constant(value):
+        constants.append(value)
+        return f"_constants[{len(constants) - 1}]"
+
+    def literal(value):
+        if isinstance(value, float) and not math.isfinite(value):
+            return constant(value)
+        return repr(value)
+
+    def local(name):
+        #Map a Sigil name to a Python local that cannot clash with helpers.
+        if name not in names:
+            candidate = 'v_' + name
+            if not (candidate.isidentifier() and candidate.isascii()):
+                candidate = f"v{len(names)}"
+            names[name] = candidate
+        return names[name]
+
+    def variable(name, defined):
+        #Read a variable, guarding against it being unassigned.
+        python_name = local(name)
+        if name in defined:
+            return python_name
+        return f"({python_name} if {python_name} is not _UNSET else _undefined({name!r}))"
+
+    def expression(node, defined):
+        #Translate an expression node into a Python expression.
+        return typed_expression(node, defined)[0]
+
+    def typed_expression(node, defined):
+        #Translate an expression node, returning the Python expression and
+        #the type of its value (None if unknown). defined maps the names
+        #known to be assigned to their type.
+        node_type = node['type']
+
+        if node_type in ('number', 'boolean', 'string'):
+            return literal(node['value']), type(node['value'])
+
+        if node_type == 'variable':
+            return variable(node['name'], defined), defined.get(node['name'])
+
+        if node_type == 'list_literal':
+            return "[" + ", ".join(expression(elem, defined) for elem in node['elements']) + "]", list
+
+        if node_type == 'list_access':
+            target = node['list']
+            target_type = defined.get(target['name']) if target['type'] == 'variable' else None
+            if target_type is list or target_type is NumberList:
+                # A variable known to hold a list: index its storage directly
+                lst = variable(target['name'], defined)
+                items = lst if target_type is list else f"{lst}.items"
+                index, position = temporary(), temporary()
+                return (f"({items}[{position}] if type({index} := {expression(node['index'], defined)}) is _float"
+                        f" and ({position} := int({index})) == {index} and 0 <= {position} < len({items})"
+                        f" else _list_access({lst}, {index}))"), None
+            lst, index, position = temporary(), temporary(), temporary()
+            return (f"({lst}[{position}] if (type({lst} := {expression(node['list'], defined)}) is _list)"
+                    f" & (type({index} := {expression(node['index'], defined)}) is _float)"
+                    f" and ({position} := int({index})) == {index} and 0 <= {position} < len({lst})"
+                    f" else _list_access({lst}, {index}))"), None
+
+        if node_type == 'len':
+            argument, argument_type = typed_expression(node['argument'], defined)
+            if argument_type is str or argument_type is list:
+                return f"float(len({argument}))", float
+            if argument_type is NumberList:
+                return f"float(len({argument}.items))", float
+            value = temporary()
+            return (f"(float(len({value})) if type({value} := {argument}) is _list"
+                    f" or type({value}) is _str else _length({value}))"), float
+
+        if node_type == 'input':
+            if not node['prompt']:
+                return '_read_input("")', str
+            return f"_read_input(str({expression(node['prompt'], defined)}))", str
+
+        if node_type == 'unary' and node['op'] in UNARY_OPERATIONS:
+            operand, operand_type = typed_expression(node['expr'], defined)
+            if node['op'] == '-':
+                if operand_type is float:
+                    return f"(-{operand})", float
+                value = temporary()
+                return f"(-{value} if type({value} := {operand}) is _float else _negate({value}))", None
+            if operand_type is bool:
+                return f"(not {operand})", bool
+            value = temporary()
+            return f"(not {value} if type({value} := {operand}) is _bool else _logical_not({value}))", bool
+
+        if node_type == 'binary' and node['op'] in BINARY_OPERATIONS:
+            op = node['op']
+            left_expression, left_type = typed_expression(node['left'], defined)
+            right_expression, right_type = typed_expression(node['right'], defined)
+            arithmetic = op in ('+', '-', '*', '/')
+
+            # Both operand types known and accepted by the operator
+            if left_type is right_type and left_type in _UNCHECKED_BINARY_TYPES[op] and left_type is not list:
+                if op in ('==', '!='):
+                    return f"({left_expression} {op} {right_expression})", bool
+                if op in ('and', 'or'):
+                    # & and | evaluate both operands, like the operator functions
+                    return f"({left_expression} {'&' if op == 'and' else '|'} {right_expression})", bool
+                return (f"({left_expression} {op} {right_expression})",
+                        left_type if arithmetic else bool)
+            if op == '+' and left_type is str and right_type in (float, bool):
+                return f"({left_expression} + str({right_expression}))", str
+            if op == '+' and right_type is str and left_type in (float, bool):
+                return f"(str({left_expression}) + {right_expression})", str
+
+            if op == '+' and (left_type is str or right_type is str):
+                result_type = str
+            elif op in ('and', 'or') or (op in ('==', '!=') and left_type and right_type):
+                result_type = bool
+            else:
+                result_type = None
+
+            left, right = temporary(), temporary()
+            left_code = f"{left} := {left_expression}"
+            right_code = f"{right} := {right_expression}"
+
+            if op in ('==', '!='):
+                # Values of different types may still both be lists (a list
+                # and a NumberList in a traced loop)
+                return (f"({left} {op} {right} if type({left_code}) is type({right_code})"
+                        f" else {BINARY_OPERATIONS[op].__name__}({left}, {right}))"), result_type
+
+            fallback = BINARY_OPERATIONS[op].__name__
+            if op in ('and', 'or'):
+                return (f"({left} {op} {right} if type({left_code}) is type({right_code}) is _bool"
+                        f" else {fallback}({left}, {right}))"), result_type
+            return (f"({left} {op} {right} if type({left_code}) is type({right_code}) is _float"
+                    f" else {fallback}({left}, {right}))"), result_type
+
+        return f"_unknown_expression({constant(node)})", None
+
+    def block(statements, depth, defined, iteration=False):
+        #Translate a statement list; an empty block still yields None.
+        #When metered, the block counts its statements as steps, plus one
+        #for the iteration if it is a loop body, which also refuels.
+        if metered and (statements or iteration):
+            emit(depth, f"_fuel -= {len(statements) + iteration}")
+            if iteration:
+                # The statements are taken off already but have not run
+                emit(depth, "if _fuel < 0:")
+                if statements:
+                    emit(depth + 1, f"_fuel = _meter(_fuel, {len(statements)}) - {len(statements)}")
+                else:
+                    emit(depth + 1, "_fuel = _meter(_fuel)")
+        if not statements:
+            emit(depth, "_result = None")
+        for statement in statements:
+            translate_statement(statement, depth, defined)
+
+    def check_size(depth, value, value_type, lst=None):
+        #Emit a check of a stored value against the size limit. If the value
+        #was appended to lst, the whole list is measured instead.
+        if max_size is None:
+            return
+        if lst is not None:
+            size = f"_value_size({lst}, {max_size!r})"
+        elif value_type is float or value_type is bool:
+            return
+        elif value_type is str:
+            size = f"len({value})"
+        else:
+            size = f"_value_size({value}, {max_size!r})"
+        if value_type is None and lst is None:
+            # Most values of unknown type are numbers; skip the call for them
+            emit(depth, f"if type({value}) is not _float and {size} > {max_size!r}:")
+        else:
+            emit(depth, f"if {size} > {max_size!r}:")
+        emit(depth + 1, f"_size_exceeded({size}, {max_size!r})")
 
-            lst = environment['variables'][list_name]
-            if not isinstance(lst, list):
-                raise TypeError("Cannot index-assign to a non-list value")
+    def translate_statement(node, depth, defined):
+        #Translate a statement node, adding names it assigns to defined.
+        node_type = node['type']
 
-            index = evaluate(node['index'])
-            if not isinstance(index, float) or int(index) != index:
-                raise TypeError("List index must be an integer")
+        if node_type == 'expression':
+            emit(depth, f"_result = {expression(node['expression'], defined)}")
 
-            index = int(index)
-            if index < 0 or index >= len(lst):
-                raise IndexError("List index out of range")
+        elif node_type == 'print':
+            emit(depth, f"_result = {expression(node['expression'], defined)}")
+            emit(depth, "_write(_result)")
 
-            value = evaluate(node['value'])
-            lst[index] = value
-            return value
+        elif node_type == 'assignment':
+            name = node['name']
+            operands = _append_operands(node)
+            if operands is not None and defined.get(name) is str:
+                # name = name + a + b ...: evaluate every piece, then append
+                # them with +=, which CPython can do in place
+                pieces = []
+                for operand in operands:
+                    piece, piece_type = typed_expression(operand, defined)
+                    if piece_type is not str:
+                        piece = f"str({piece})" if piece_type in (float, bool) else f"_string_piece({piece})"
+                    pieces.append(temporary())
+                    emit(depth, f"{pieces[-1]} = {piece}")
+                # Drop the reference held by _result so += can extend in place
+                emit(depth, "_result = None")
+                for piece in pieces:
+                    emit(depth, f"{local(name)} += {piece}")
+                emit(depth, f"_result = {local(name)}")
+                value_type = str
+            else:
+                value, value_type = typed_expression(node['value'], defined)
+                emit(depth, f"_result = {local(name)} = {value}")
+            check_size(depth, local(name), value_type)
+            assigned.add(name)
+            defined[name] = value_type
+
+        elif node_type == 'list_append':
+            lst = temporary()
+            emit(depth, f"{lst} = {variable(node['list'], defined)}")
+            emit(depth, f"if not isinstance({lst}, _list_types):")
+            emit(depth + 1, 'raise TypeError("Cannot append to a non-list value")')
+            value, value_type = typed_expression(node['value'], defined)
+            emit(depth, f"_result = {value}")
+            emit(depth, f"{lst}.append(_result)")
+            check_size(depth, "_result", value_type, lst)
+
+        elif node_type == 'list_set':
+            lst, position = temporary(), temporary()
+            emit(depth, f"{lst} = {variable(node['list'], defined)}")
+            emit(depth, f"if not isinstance({lst}, _list_types):")
+            emit(depth + 1, 'raise TypeError("Cannot index-assign to a non-list value")')
+            emit(depth, f"{position} = _check_index({lst}, {expression(node['index'], defined)})")
+            emit(depth, f"{lst}[{position}] = _result = {expression(node['value'], defined)}")
+            check_size(depth, "_result", None)
+
+        elif node_type == 'if':
+            condition, condition_type = typed_expression(node['condition'], defined)
+            if_defined = collections.ChainMap({}, defined)
+            else_defined = collections.ChainMap({}, defined)
+            if condition_type is bool:
+                emit(depth, f"if {condition}:")
+                block(node['if_body'], depth + 1, if_defined)
+                emit(depth, "else:")
+                block(node['else_body'], depth + 1, else_defined)
+            else:
+                value = temporary()
+                emit(depth, f"if ({value} := {condition}) is True:")
+                block(node['if_body'], depth + 1, if_defined)
+                emit(depth, "else:")
+                emit(depth + 1, f"if {value} is not False:")
+                emit(depth + 2, 'raise TypeError("Condition must be a boolean expression")')
+                block(node['else_body'], depth + 1, else_defined)
+            _join_types(defined, if_defined, else_defined)
+
+        elif node_type == 'while':
+            # The body may change the types of the names it assigns, so
+            # they are unknown at the top of every iteration
+            for name in _assigned_names(node['body']):
+                if name in defined:
+                    defined[name] = None
+            condition = temporary()
+            emit(depth, "_result = None")
+            emit(depth, f"while ({condition} := {expression(node['condition'], defined)}) is True:")
+            body = node['body']
+            if body or metered:
+                block(body, depth + 1, collections.ChainMap({}, defined), iteration=True)
+            else:
+                emit(depth + 1, "pass")
+            emit(depth, f"if {condition} is not False:")
+            emit(depth + 1, 'raise TypeError("Condition must be a boolean expression")')
 
-        if node['type'] == 'if':
-            condition = evaluate(node['condition'])
-            if not isinstance(condition, bool):
-                raise TypeError("Condition must be a boolean expression")
+        else:
+            emit(depth, f"_unknown_statement({constant(node_type)})")
+
+    if loop_mode:
+        # Types are checked at the top of each iteration; names holding a
+        # value on entry stay assigned
+        defined = dict(types)
+        exit_values = "_result, _iterations"
+        condition = temporary()
+        emit(3, f"if ({condition} := {expression(ast['condition'], defined)}) is not True:")
+        emit(4, f"if {condition} is not False:")
+        emit(5, 'raise TypeError("Condition must be a boolean expression")')
+        emit(4, f"return False, {exit_values}")
+        block(ast['body'], 3, defined, iteration=True)
+        emit(3, "_iterations += 1")
+        body = lines
+
+        lines = []
+        emit(0, "def _sigil_loop(_values, _write, _result"
+                f"{', _meter, _fuel, _set_fuel, _read_input' if metered else ''}):")
+        for name, slot in slots.items():
+            emit(1, f"{local(name)} = _values[{slot}]")
+        emit(1, "_iterations = 0")
+        emit(1, "try:")
+        emit(2, "while True:")
+        guards = [f"type({local(name)}) is not {TRACE_TYPE_NAMES[kind]}"
+                  for name, kind in sorted(types.items()) if kind is not None]
+        if guards:
+            emit(3, f"if {' or '.join(guards)}:")
+            emit(4, f"return True, {exit_values}")
+        lines.extend(body)
+        emit(1, "finally:")
+        if metered:
+            emit(2, "_set_fuel(_fuel)")
+        elif not assigned:
+            emit(2, "pass")
+        for name in sorted(assigned):
+            python_name = names[name]
+            emit(2, f"if {python_name} is not _UNSET:")
+            emit(3, f"_values[{slots[name]}] = {python_name}")
+        return "\n".join(lines) + "\n", constants
+
+    statements = ast['body'] if ast['type'] == 'program' else [ast]
+    block(statements, 2, {})
+    body = lines
+
+    lines = []
+    emit(0, "def _sigil_program(_environment):")
+    emit(1, "_variables = _environment['variables']")
+    emit(1, "_write = _output_sink(_environment).write")
+    for name, python_name in names.items():
+        emit(1, f"{python_name} = _variables.get({name!r}, _UNSET)")
+    emit(1, "_result = None")
+    emit(1, "try:")
+    lines.extend(body)
+    emit(1, "finally:")
+    if not assigned:
+        emit(2, "pass")
+    for name in sorted(assigned):
+        python_name = names[name]
+        emit(2, f"if {python_name} is not _UNSET:")
+        emit(3, f"_variables[{name!r}] = {python_name}")
+    emit(1, "return _result")
+    return "\n".join(lines) + "\n", constants
+
+# Globals visible to code generated by translate_to_python()
+PYTHON_RUNTIME = {
+    '_UNSET': _UNSET,
+    '_float': float,
+    '_bool': bool,
+    '_list': list,
+    '_number_list': NumberList,
+    '_list_types': _LIST_TYPES,
+    '_str': str,
+    '_undefined': _undefined,
+    '_output_sink': output_sink,
+    '_read_input': _read_input,
+    '_unknown_expression': _unknown_expression,
+    '_unknown_statement': _unknown_statement,
+    '_string_piece': _string_piece,
+    '_value_size': _value_size,
+    '_size_exceeded': _size_exceeded,
+    '_list_access': _list_access,
+    '_check_index': _check_index,
+    '_length': _length,
+    '_negate': _negate,
+    '_logical_not': _logical_not
+}
+PYTHON_RUNTIME.update((operation.__name__, operation) for operation in BINARY_OPERATIONS.values())
+
+def compile_python(ast):
+    #Compile an abstract syntax tree into a Python function of the environment.
+    source, constants = translate_to_python(ast)
+    namespace = dict(PYTHON_RUNTIME, _constants=constants)
+    exec(compile(source, '<sigil>', 'exec'), namespace)
+    return namespace['_sigil_program']
+
+def compile_loop(node, slots, types, limits=None):
+    #Compile a while loop for the loop tracer; see translate_to_python().
+    #The loop does not depend on the run, so later runs of the same tree
+    #can reuse it.
+    source, constants = translate_to_python(node, slots, types, limits)
+    namespace = dict(PYTHON_RUNTIME, _constants=constants)
+    exec(compile(source, '<sigil loop>', 'exec'), namespace)
+    return namespace['_sigil_loop']
+
+def _interpret_python(ast, environment):
+    #Run a program with the Python source backend.
+    try:
+        program = compile_python(ast)
+    except (SyntaxError, RecursionError, MemoryError):
+        # Too deeply nested for the Python compiler; closures have no such limit
+        return _interpret_closures(ast, environment)
+    return program(environment), environment
+
+# Bytecode opcodes. Every instruction is two words: opcode and argument.
+# Arithmetic and comparison opcodes take their right operand from the stack
+# when the argument is 0 and from constant argument - 1 otherwise.
+OP_LOAD_CONST = 0
+OP_LOAD_VAR = 1
+OP_STORE_VAR = 2
+OP_ADD = 3
+OP_SUBTRACT = 4
+OP_MULTIPLY = 5
+OP_DIVIDE = 6
+OP_LESS = 7
+OP_GREATER = 8
+OP_LESS_EQUAL = 9
+OP_GREATER_EQUAL = 10
+OP_BINARY = 11
+OP_UNARY = 12
+OP_JUMP = 13
+OP_JUMP_IF_FALSE = 14
+OP_RESULT = 15
+OP_CLEAR_RESULT = 16
+OP_PRINT = 17
+OP_BUILD_LIST = 18
+OP_LIST_ACCESS = 19
+OP_LEN = 20
+OP_INPUT = 21
+OP_LOAD_APPEND_TARGET = 22
+OP_LOAD_SET_TARGET = 23
+OP_APPEND = 24
+OP_CHECK_INDEX = 25
+OP_STORE_INDEX = 26
+OP_UNKNOWN_EXPRESSION = 27
+OP_UNKNOWN_STATEMENT = 28
+# Only in programs compiled with limits
+OP_STEP = 29
+OP_CHECK_SIZE = 30
+
+OPCODE_NAMES = {value: name[3:] for name, value in globals().items() if name.startswith('OP_')}
+
+# Operators with a dedicated opcode; the rest go through OP_BINARY
+ARITHMETIC_OPCODES = {
+    '+': OP_ADD,
+    '-': OP_SUBTRACT,
+    '*': OP_MULTIPLY,
+    '/': OP_DIVIDE,
+    '<': OP_LESS,
+    '>': OP_GREATER,
+    '<=': OP_LESS_EQUAL,
+    '>=': OP_GREATER_EQUAL
+}
+
+# Operand tables for OP_BINARY and OP_UNARY, indexed by the instruction argument
+BYTECODE_BINARY = ['==', '!=', 'and', 'or']
+BYTECODE_UNARY = ['-', '!']
+
+BYTECODE_MAGIC = b'SGBC'
+BYTECODE_VERSION = 1
+
+def compile_bytecode(ast, limits=None):
+    #Compile an abstract syntax tree into a flat bytecode program.
+    #The result is a dict holding the instruction stream ('code', an array of
+    #opcode/argument pairs), the constant pool and the variable names.
+    #Given Limits, STEP instructions count the steps the tree-walker would
+    #(one per statement and loop iteration) and CHECK_SIZE instructions
+    #follow stores if there is a max_size; the program must then be run
+    #with the same limits.
+    code = array.array('i')
+    constants = []
+    constant_index = {}
+    names = []
+    name_index = {}
+
+    def emit(opcode, argument=0):
+        #Append an instruction and return its position.
+        code.append(opcode)
+        code.append(argument)
+        return len(code) - 2
+
+    def patch(position, target):
+        #Point a jump instruction at a target position.
+        code[position + 1] = target
+
+    def constant(value):
+        # bool and float compare equal, so key on the type as well
+        key = (type(value), value)
+        if key not in constant_index:
+            constant_index[key] = len(constants)
+            constants.append(value)
+        return constant_index[key]
+
+    def name(value):
+        if value not in name_index:
+            name_index[value] = len(names)
+            names.append(value)
+        return name_index[value]
+
+    def compile_expression(root):
+        #Emit code that leaves the value of an expression on the stack.
+        #Pending work sits on an explicit stack, nodes to compile and
+        #(opcode, argument) instructions to emit after them, so deeply
+        #nested expressions compile without recursion. An argument that is
+        #a literal node stands for its constant, added to the pool in order.
+        work = [root]
+        while work:
+            node = work.pop()
+            if type(node) is tuple:
+                opcode, argument = node
+                if type(argument) is not int:
+                    argument = constant(argument['value']) + 1
+                emit(opcode, argument)
+                continue
+            node_type = node['type']
+
+            if node_type in ('number', 'boolean', 'string'):
+                emit(OP_LOAD_CONST, constant(node['value']))
+
+            elif node_type == 'variable':
+                emit(OP_LOAD_VAR, name(node['name']))
+
+            elif node_type == 'list_literal':
+                work.append((OP_BUILD_LIST, len(node['elements'])))
+                work.extend(reversed(node['elements']))
+
+            elif node_type == 'list_access':
+                work.append((OP_LIST_ACCESS, 0))
+                work.append(node['index'])
+                work.append(node['list'])
+
+            elif node_type == 'len':
+                work.append((OP_LEN, 0))
+                work.append(node['argument'])
+
+            elif node_type == 'input':
+                if node['prompt']:
+                    work.append((OP_INPUT, 1))
+                    work.append(node['prompt'])
+                else:
+                    emit(OP_INPUT, 0)
+
+            elif node_type == 'unary' and node['op'] in BYTECODE_UNARY:
+                work.append((OP_UNARY, BYTECODE_UNARY.index(node['op'])))
+                work.append(node['expr'])
+
+            elif node_type == 'binary' and node['op'] in BINARY_OPERATIONS:
+                right = node['right']
+                if node['op'] in ARITHMETIC_OPCODES:
+                    if right['type'] in ('number', 'boolean', 'string'):
+                        work.append((ARITHMETIC_OPCODES[node['op']], right))
+                    else:
+                        work.append((ARITHMETIC_OPCODES[node['op']], 0))
+                        work.append(right)
+                else:
+                    work.append((OP_BINARY, BYTECODE_BINARY.index(node['op'])))
+                    work.append(right)
+                work.append(node['left'])
 
-            result = None
-            if condition:
-                for statement in node['if_body']:
-                    result = execute(statement)
             else:
-                for statement in node['else_body']:
-                    result = execute(statement)
-            return result
+                # Stored as plain dicts so the constant pool stays serializable
+                constants.append(_node_to_dict(node))
+                emit(OP_UNKNOWN_EXPRESSION, len(constants) - 1)
+
+    def compile_block(statements):
+        #Emit a statement list; an empty block still yields None.
+        if not statements:
+            emit(OP_CLEAR_RESULT)
+        for statement in statements:
+            compile_statement(statement)
+
+    def check_size(list_name=None):
+        #Check the value just stored, or the whole list it was appended to.
+        if limits is not None and limits.max_size is not None:
+            emit(OP_CHECK_SIZE, 0 if list_name is None else name(list_name) + 1)
+
+    def compile_statement(node):
+        #Emit code for a statement, leaving its value in the result register.
+        node_type = node['type']
+        if limits is not None:
+            emit(OP_STEP, 1)
+
+        if node_type == 'expression':
+            compile_expression(node['expression'])
+            emit(OP_RESULT)
+
+        elif node_type == 'print':
+            compile_expression(node['expression'])
+            emit(OP_PRINT)
+
+        elif node_type == 'assignment':
+            compile_expression(node['value'])
+            emit(OP_STORE_VAR, name(node['name']))
+            check_size()
+
+        elif node_type == 'list_append':
+            emit(OP_LOAD_APPEND_TARGET, name(node['list']))
+            compile_expression(node['value'])
+            emit(OP_APPEND)
+            check_size(node['list'])
+
+        elif node_type == 'list_set':
+            emit(OP_LOAD_SET_TARGET, name(node['list']))
+            compile_expression(node['index'])
+            emit(OP_CHECK_INDEX)
+            compile_expression(node['value'])
+            emit(OP_STORE_INDEX)
+            check_size()
+
+        elif node_type == 'if':
+            compile_expression(node['condition'])
+            jump_to_else = emit(OP_JUMP_IF_FALSE)
+            compile_block(node['if_body'])
+            jump_to_end = emit(OP_JUMP)
+            patch(jump_to_else, len(code))
+            compile_block(node['else_body'])
+            patch(jump_to_end, len(code))
+
+        elif node_type == 'while':
+            emit(OP_CLEAR_RESULT)
+            start = len(code)
+            compile_expression(node['condition'])
+            jump_to_end = emit(OP_JUMP_IF_FALSE)
+            if limits is not None:
+                emit(OP_STEP, 1)
+            for statement in node['body']:
+                compile_statement(statement)
+            emit(OP_JUMP, start)
+            patch(jump_to_end, len(code))
 
-        if node['type'] == 'while':
-            result = None
-            while True:
-                condition = evaluate(node['condition'])
-                if not isinstance(condition, bool):
+        else:
+            constants.append(node_type)
+            emit(OP_UNKNOWN_STATEMENT, len(constants) - 1)
+
+    if ast['type'] == 'program':
+        if limits is not None:
+            emit(OP_STEP, 1)
+        for statement in ast['body']:
+            compile_statement(statement)
+    else:
+        compile_statement(ast)
+
+    return {'code': code, 'constants': constants, 'names': names}
+
+def disassemble(bytecode):
+    #Return a readable listing of a bytecode program.
+    code = bytecode['code']
+    lines = []
+    for pc in range(0, len(code), 2):
+        opcode, argument = code[pc], code[pc + 1]
+        detail = ""
+        if opcode == OP_LOAD_CONST:
+            detail = f" ({bytecode['constants'][argument]!r})"
+        elif opcode in (OP_LOAD_VAR, OP_STORE_VAR, OP_LOAD_APPEND_TARGET, OP_LOAD_SET_TARGET):
+            detail = f" ({bytecode['names'][argument]})"
+        elif opcode in ARITHMETIC_OPCODES.values() and argument:
+            detail = f" ({bytecode['constants'][argument - 1]!r})"
+        elif opcode == OP_BINARY:
+            detail = f" ({BYTECODE_BINARY[argument]})"
+        elif opcode == OP_UNARY:
+            detail = f" ({BYTECODE_UNARY[argument]})"
+        lines.append(f"{pc:>6} {OPCODE_NAMES[opcode]:<20} {argument}{detail}")
+    return "\n".join(lines)
+
+def dump_bytecode(bytecode):
+    #Serialize a bytecode program to bytes.
+    code = array.array('i', bytecode['code'])
+    if sys.byteorder != 'little':
+        code.byteswap()
+    payload = (BYTECODE_VERSION, code.tobytes(), tuple(bytecode['constants']), tuple(bytecode['names']))
+    return BYTECODE_MAGIC + marshal.dumps(payload)
+
+def load_bytecode(data):
+    #Deserialize a bytecode program written by dump_bytecode().
+    if not data.startswith(BYTECODE_MAGIC):
+        raise ValueError("Not a Sigil bytecode file")
+    try:
+        version, raw_code, constants, names = marshal.loads(data[len(BYTECODE_MAGIC):])
+    except (EOFError, ValueError, TypeError):
+        raise ValueError("Corrupt Sigil bytecode") from None
+    if version != BYTECODE_VERSION:
+        raise ValueError(f"Unsupported bytecode version: {version}")
+
+    code = array.array('i')
+    code.frombytes(raw_code)
+    if sys.byteorder != 'little':
+        code.byteswap()
+    return {'code': code, 'constants': list(constants), 'names': list(names)}
+
+def run_bytecode(bytecode, environment, limits=None):
+    #Execute a bytecode program and return the value of its last statement.
+    #limits are those the program was compiled with, if any.
+    machine = _bytecode_machine(bytecode, environment, output_sink(environment).write, limits=limits)
+    try:
+        request, prompt = next(machine)
+        while True:
+            request, prompt = machine.send(_read_input(prompt))
+    except StopIteration as stop:
+        return stop.value
+
+def _bytecode_machine(bytecode, environment, write=None, yield_every=0, limits=None):
+    #Execute a bytecode program as a generator, which returns the value of
+    #the last statement. The machine keeps all its state in the generator,
+    #so it can stop between instructions for its driver:
+    #  ('input', prompt): an input() call; send the line that was read
+    #  ('print', value): a print, if write is None
+    #  ('tick', None): every yield_every jumps (if not 0), so a driver in
+    #  an event loop can let other tasks run during long loops
+    #With limits, STEP instructions use up fuel like the tree-walker does,
+    #and time spent waiting for input does not count towards the timeout.
+    #The program is decoded into one closure per instruction, with its
+    #argument bound, which the loop calls in turn. An instruction returns a
+    #request to yield to the driver, or None; the reply to an input request
+    #is pushed.
+    constants = bytecode['constants']
+    names = bytecode['names']
+    variables = environment['variables']
+    countdown = yield_every
+    max_steps = max_size = deadline = None
+    if limits is not None:
+        max_steps = limits.max_steps
+        max_size = limits.max_size
+        deadline = None if limits.timeout is None else time.perf_counter() + limits.timeout
+    spent = grant = fuel = 0
+
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    result = None
+    pc = 0
+
+    def load_const(argument):
+        value = constants[argument]
+        def load_const():
+            push(value)
+        return load_const
+
+    def load_var(argument):
+        name = names[argument]
+        def load_var():
+            try:
+                push(variables[name])
+            except KeyError:
+                raise ValueError(f"Undefined variable: {name}") from None
+        return load_var
+
+    def store_var(argument):
+        name = names[argument]
+        def store_var():
+            nonlocal result
+            result = variables[name] = pop()
+        return store_var
+
+    # Arithmetic and comparison: the right operand is constant argument - 1,
+    # or popped from the stack if the argument is 0
+    def add(argument):
+        if argument:
+            right = constants[argument - 1]
+            def add_constant():
+                left = stack[-1]
+                if type(left) is float and type(right) is float:
+                    stack[-1] = left + right
+                else:
+                    stack[-1] = _add(left, right)
+            return add_constant
+        def add():
+            right = pop()
+            left = stack[-1]
+            if type(left) is float and type(right) is float:
+                stack[-1] = left + right
+            else:
+                stack[-1] = _add(left, right)
+        return add
+
+    def subtract(argument):
+        if argument:
+            right = constants[argument - 1]
+            def subtract_constant():
+                left = stack[-1]
+                if type(left) is float and type(right) is float:
+                    stack[-1] = left - right
+                else:
+                    stack[-1] = _subtract(left, right)
+            return subtract_constant
+        def subtract():
+            right = pop()
+            left = stack[-1]
+            if type(left) is float and type(right) is float:
+                stack[-1] = left - right
+            else:
+                stack[-1] = _subtract(left, right)
+        return subtract
+
+    def multiply(argument):
+        if argument:
+            right = constants[argument - 1]
+            def multiply_constant():
+                left = stack[-1]
+                if type(left) is float and type(right) is float:
+                    stack[-1] = left * right
+                else:
+                    stack[-1] = _multiply(left, right)
+            return multiply_constant
+        def multiply():
+            right = pop()
+            left = stack[-1]
+            if type(left) is float and type(right) is float:
+                stack[-1] = left * right
+            else:
+                stack[-1] = _multiply(left, right)
+        return multiply
+
+    def divide(argument):
+        if argument:
+            right = constants[argument - 1]
+            def divide_constant():
+                left = stack[-1]
+                if type(left) is float and type(right) is float:
+                    stack[-1] = left / right
+                else:
+                    stack[-1] = _divide(left, right)
+            return divide_constant
+        def divide():
+            right = pop()
+            left = stack[-1]
+            if type(left) is float and type(right) is float:
+                stack[-1] = left / right
+            else:
+                stack[-1] = _divide(left, right)
+        return divide
+
+    def less(argument):
+        if argument:
+            right = constants[argument - 1]
+            def less_constant():
+                left = stack[-1]
+                if type(left) is float and type(right) is float:
+                    stack[-1] = left < right
+                else:
+                    stack[-1] = _less(left, right)
+            return less_constant
+        def less():
+            right = pop()
+            left = stack[-1]
+            if type(left) is float and type(right) is float:
+                stack[-1] = left < right
+            else:
+                stack[-1] = _less(left, right)
+        return less
+
+    def greater(argument):
+        if argument:
+            right = constants[argument - 1]
+            def greater_constant():
+                left = stack[-1]
+                if type(left) is float and type(right) is float:
+                    stack[-1] = left > right
+                else:
+                    stack[-1] = _greater(left, right)
+            return greater_constant
+        def greater():
+            right = pop()
+            left = stack[-1]
+            if type(left) is float and type(right) is float:
+                stack[-1] = left > right
+            else:
+                stack[-1] = _greater(left, right)
+        return greater
+
+    def less_equal(argument):
+        if argument:
+            right = constants[argument - 1]
+            def less_equal_constant():
+                left = stack[-1]
+                if type(left) is float and type(right) is float:
+                    stack[-1] = left <= right
+                else:
+                    stack[-1] = _less_equal(left, right)
+            return less_equal_constant
+        def less_equal():
+            right = pop()
+            left = stack[-1]
+            if type(left) is float and type(right) is float:
+                stack[-1] = left <= right
+            else:
+                stack[-1] = _less_equal(left, right)
+        return less_equal
+
+    def greater_equal(argument):
+        if argument:
+            right = constants[argument - 1]
+            def greater_equal_constant():
+                left = stack[-1]
+                if type(left) is float and type(right) is float:
+                    stack[-1] = left >= right
+                else:
+                    stack[-1] = _greater_equal(left, right)
+            return greater_equal_constant
+        def greater_equal():
+            right = pop()
+            left = stack[-1]
+            if type(left) is float and type(right) is float:
+                stack[-1] = left >= right
+            else:
+                stack[-1] = _greater_equal(left, right)
+        return greater_equal
+
+    def binary_operation(argument):
+        operation = BINARY_OPERATIONS[BYTECODE_BINARY[argument]]
+        def binary_operation():
+            right = pop()
+            stack[-1] = operation(stack[-1], right)
+        return binary_operation
+
+    def unary_operation(argument):
+        operation = UNARY_OPERATIONS[BYTECODE_UNARY[argument]]
+        def unary_operation():
+            stack[-1] = operation(stack[-1])
+        return unary_operation
+
+    def jump(argument):
+        target = argument >> 1
+        def jump():
+            nonlocal pc, countdown
+            pc = target
+            if yield_every:
+                countdown -= 1
+                if not countdown:
+                    countdown = yield_every
+                    return 'tick', None
+        return jump
+
+    def jump_if_false(argument):
+        target = argument >> 1
+        def jump_if_false():
+            nonlocal pc
+            condition = pop()
+            if condition is not True:
+                if condition is not False:
                     raise TypeError("Condition must be a boolean expression")
+                pc = target
+        return jump_if_false
+
+    def store_result(argument):
+        def store_result():
+            nonlocal result
+            result = pop()
+        return store_result
+
+    def clear_result(argument):
+        def clear_result():
+            nonlocal result
+            result = None
+        return clear_result
+
+    def print_value(argument):
+        def print_value():
+            nonlocal result
+            result = pop()
+            if write is None:
+                return 'print', result
+            write(result)
+        return print_value
+
+    def build_list(argument):
+        def build_list():
+            if argument:
+                elements = stack[-argument:]
+                del stack[-argument:]
+            else:
+                elements = []
+            push(elements)
+        return build_list
+
+    def list_access(argument):
+        def list_access():
+            index = pop()
+            stack[-1] = _list_access(stack[-1], index)
+        return list_access
+
+    def length(argument):
+        def length():
+            stack[-1] = _length(stack[-1])
+        return length
+
+    def read_input(argument):
+        def read_input():
+            return 'input', str(pop()) if argument else ""
+        return read_input
+
+    def load_target(message):
+        #Return the factory for an opcode that pushes a list variable for
+        #an append or an index assignment, failing with message if it is
+        #not a list.
+        def load_target(argument):
+            list_name = names[argument]
+            def load_target():
+                if list_name not in variables:
+                    raise ValueError(f"Undefined variable: {list_name}")
+                lst = variables[list_name]
+                if not isinstance(lst, _LIST_TYPES):
+                    raise TypeError(message)
+                push(lst)
+            return load_target
+        return load_target
+
+    def append(argument):
+        def append():
+            nonlocal result
+            result = pop()
+            pop().append(result)
+        return append
+
+    def check_index(argument):
+        def check_index():
+            stack[-1] = _check_index(stack[-2], stack[-1])
+        return check_index
+
+    def store_index(argument):
+        def store_index():
+            nonlocal result
+            result = pop()
+            index = pop()
+            pop()[index] = result
+        return store_index
+
+    def unknown_expression(argument):
+        def unknown_expression():
+            _unknown_expression(constants[argument])
+        return unknown_expression
+
+    def unknown_statement(argument):
+        def unknown_statement():
+            _unknown_statement(constants[argument])
+        return unknown_statement
+
+    def step(argument):
+        def step():
+            nonlocal spent, grant, fuel
+            fuel -= argument
+            if fuel < 0:
+                spent += grant - fuel
+                grant = fuel
+                if max_steps is not None and spent > max_steps:
+                    _steps_exceeded(max_steps)
+                if deadline is not None and time.perf_counter() > deadline:
+                    _time_exceeded(limits.timeout)
+                grant = fuel = (METER_INTERVAL if max_steps is None
+                                else min(METER_INTERVAL, max_steps - spent))
+        return step
+
+    def check_size(argument):
+        name = names[argument - 1] if argument else None
+        def check_size():
+            size = _value_size(result if name is None else variables[name], max_size)
+            if size > max_size:
+                _size_exceeded(size, max_size)
+        return check_size
+
+    def invalid(opcode):
+        #Return the factory for an unknown opcode, which fails if it is
+        #reached.
+        def invalid(argument):
+            def invalid():
+                raise ValueError(f"Invalid opcode: {opcode}")
+            return invalid
+        return invalid
+
+    # Instruction factories, indexed by opcode
+    factories = (
+        load_const, load_var, store_var,
+        add, subtract, multiply, divide, less, greater, less_equal, greater_equal,
+        binary_operation, unary_operation, jump, jump_if_false,
+        store_result, clear_result, print_value, build_list, list_access, length, read_input,
+        load_target("Cannot append to a non-list value"),
+        load_target("Cannot index-assign to a non-list value"),
+        append, check_index, store_index, unknown_expression, unknown_statement,
+        step, check_size)
+
+    code = bytecode['code']
+    program = []
+    for position in range(0, len(code), 2):
+        opcode = code[position]
+        factory = factories[opcode] if 0 <= opcode < len(factories) else invalid(opcode)
+        program.append(factory(code[position + 1]))
+    end = len(program)
 
-                if not condition:
-                    break
+    try:
+        while pc < end:
+            instruction = program[pc]
+            pc += 1
+            request = instruction()
+            if request is not None:
+                waited = time.perf_counter()
+                reply = yield request
+                if request[0] == 'input':
+                    push(reply)
+                    if deadline is not None:
+                        deadline += time.perf_counter() - waited
+
+    finally:
+        if limits is not None:
+            environment['steps'] = spent + grant - fuel
+    return result
+
+def _interpret_bytecode(ast, environment, limits=None):
+    #Run a program with the bytecode backend.
+    return run_bytecode(compile_bytecode(ast, limits), environment, limits), environment
+
+# Loop jumps between two chances for other tasks to run in interpret_async()
+ASYNC_YIELD_EVERY = 1000
+
+async def _read_input_async(prompt):
+    #Default input source of interpret_async(): read stdin in a thread.
+    return await asyncio.to_thread(_read_input, prompt)
+
+async def _drive_machine(machine, read, sink):
+    #Run a bytecode machine to the end: answer its input() calls with
+    #read(prompt), write its prints to sink and let other tasks run at its
+    #ticks. Returns the value of the program's last statement.
+    reply = None
+    try:
+        while True:
+            request, value = machine.send(reply)
+            reply = None
+            if request == 'tick':
+                await asyncio.sleep(0)
+            elif request == 'print':
+                await sink.write(value)
+            else:
+                reply = await read(value)
+    except StopIteration as stop:
+        return stop.value
+
+async def interpret_async(ast, environment=None, input_source=None, output=None, yield_every=ASYNC_YIELD_EVERY,
+                          limits=None):
+    #Interpret an abstract syntax tree as a coroutine, so one event loop
+    #can run many programs at once. input() awaits input_source(prompt),
+    #a coroutine function returning the line (default: read stdin in a
+    #thread). output is an AsyncOutputSink, whose writes are awaited, or
+    #anything interpret() accepts. Other tasks get to run every yield_every
+    #loop iterations. The program runs on the bytecode machine, which can
+    #stop between instructions; results and errors are those of
+    #interpret(), also for limits. Returns (result, environment).
+    if environment is None:
+        environment = {'variables': {}, 'output': []}
 
-                for statement in node['body']:
-                    result = execute(statement)
+    async_sink = output if isinstance(output, AsyncOutputSink) else None
+    if output is not None and async_sink is None:
+        environment['sink'] = make_sink(output) if isinstance(output, str) else output
+    sink = output_sink(environment) if async_sink is None else None
 
-            return result
+    async def read(prompt):
+        if sink is not None:
+            sink.flush()
+        return await (input_source or _read_input_async)(prompt)
 
-        raise ValueError(f"Unknown node type: {node['type']}")
+    if isinstance(ast, dict):
+        ast = node_from_dict(ast)
 
-    return execute(ast), environment
+    machine = _bytecode_machine(compile_bytecode(ast, limits), environment, sink and sink.write, yield_every, limits)
+    try:
+        return await _drive_machine(machine, read, async_sink), environment
+    finally:
+        if async_sink is not None:
+            await async_sink.flush()
+        else:
+            sink.flush()
+
+# Execution backends other than the default tree-walker
+BACKENDS = {
+    'closure': _interpret_closures,
+    'python': _interpret_python,
+    'bytecode': _interpret_bytecode
+}
+
+# Header of cached program files; bump CACHE_FORMAT when the layout changes
+CACHE_MAGIC = b'SGPC'
+CACHE_FORMAT = 2
+
+def default_cache_dir():
+    #Return the directory for cached programs: $SIGIL_CACHE_DIR, else sigil
+    #under $XDG_CACHE_HOME (if it is an absolute path, as the XDG spec
+    #requires) or ~/.cache. Returns None if there is no home directory to
+    #put it in, rather than writing the cache below the current directory.
+    if os.environ.get('SIGIL_CACHE_DIR'):
+        return os.environ['SIGIL_CACHE_DIR']
+    base = os.environ.get('XDG_CACHE_HOME')
+    if not base or not os.path.isabs(base):
+        home = os.path.expanduser('~')
+        if not os.path.isabs(home):
+            return None
+        base = os.path.join(home, '.cache')
+    return os.path.join(base, 'sigil')
 
-def run_program(code):
-    #Run a program from source code.
-    tokens = tokenize(code)
-    ast = parse(tokens)
-    return interpret(ast)
+@functools.lru_cache(maxsize=None)
+def interpreter_fingerprint():
+    #Identify this interpreter build so caches written by another are ignored.
+    digest = hashlib.sha256(f"{CACHE_FORMAT}:{sys.implementation.cache_tag}:".encode())
+    try:
+        with open(__file__, 'rb') as file:
+            digest.update(file.read())
+    except OSError:
+        pass
+    return digest.hexdigest()
+
+def cache_path(code, cache_dir=None):
+    #Return the cache file for a program's source text, or None if there is
+    #no cache directory.
+    cache_dir = cache_dir or default_cache_dir()
+    if cache_dir is None:
+        return None
+    key = hashlib.sha256(interpreter_fingerprint().encode())
+    key.update(code.encode('utf-8', 'surrogatepass'))
+    return os.path.join(cache_dir, key.hexdigest() + '.sgc')
+
+def _flatten_tree(root):
+    #Encode a syntax tree as a post-order list of tuples for marshal.
+    #Each entry is (kind, line, *fields); child nodes become the int index of
+    #their entry and statement lists become tuples of indexes. AST values are
+    #never ints or tuples, so the two cannot be confused.
+    entries = []
+
+    def visit(node, children):
+        # Marked and quickened nodes are stored as the node they stand for
+        values = [NODE_CLASSES[node.type].kind, node.line]
+        position = 0
+        for field in node.fields:
+            value = getattr(node, field)
+            if isinstance(value, Node):
+                value = children[position]
+                position += 1
+            elif isinstance(value, list):
+                value = tuple(children[position:position + len(value)])
+                position += len(value)
+            values.append(value)
+        entries.append(tuple(values))
+        return len(entries) - 1
+
+    _reduce_tree(root, visit)
+    return entries
+
+def _rebuild_tree(entries):
+    #Rebuild a syntax tree encoded by _flatten_tree().
+    nodes = []
+    append = nodes.append
+    kinds = NODE_KINDS
+
+    for entry in entries:
+        args = []
+        for value in entry[2:]:
+            value_type = type(value)
+            if value_type is int:
+                value = nodes[value]
+            elif value_type is tuple:
+                value = [nodes[index] for index in value]
+            args.append(value)
+        node = kinds[entry[0]](*args)
+        node.line = entry[1]
+        append(node)
+    return nodes[-1]
+
+def load_cached_program(code, cache_dir=None):
+    #Return the cached syntax tree for a program, or None if there is none.
+    #Missing, stale, corrupt and unreadable cache files are all treated as a
+    #miss.
+    path = cache_path(code, cache_dir)
+    if path is None:
+        return None
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+    except OSError:
+        return None
+
+    header = CACHE_MAGIC + interpreter_fingerprint().encode()
+    if not data.startswith(header):
+        return None
+    try:
+        return _rebuild_tree(marshal.loads(data[len(header):]))
+    except (EOFError, ValueError, TypeError, IndexError):
+        return None
 
-def interactive_mode():
+def store_cached_program(code, ast, cache_dir=None):
+    #Write a program's syntax tree to the cache. Failures, such as a cache
+    #directory that cannot be created or written, are ignored: the program
+    #then runs uncached.
+    path = cache_path(code, cache_dir)
+    if path is None:
+        return
+    data = CACHE_MAGIC + interpreter_fingerprint().encode() + marshal.dumps(_flatten_tree(ast))
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial file
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    except (OSError, ValueError):
+        pass
+
+def parse_cached(code, cache_dir=None):
+    #Tokenize and parse a program, reusing the on-disk cache when valid.
+    ast = load_cached_program(code, cache_dir)
+    if ast is None:
+        ast = parse(tokenize(code))
+        store_cached_program(code, ast, cache_dir)
+    return ast
+
+PROGRAM_CACHE_SIZE = 256
+
+class CompiledProgram:
+    #A program tokenized and parsed once and run any number of times, also
+    #from several threads at once. The program keeps its syntax tree only in
+    #the flat tuple form of the program cache, which cannot change. Running
+    #marks, quickens and assigns slots to a tree, so every run borrows a
+    #tree that no other run is using: one from a pool of trees left by
+    #earlier runs, or one rebuilt from the tuples when the pool is empty.
+    #A pooled tree keeps the loops the tracer compiled for it, so hot loops
+    #are compiled once per tree rather than once per run. The other
+    #backends compile the program once, on its first run with them, and
+    #share the result. Each run also gets a fresh environment, so runs
+    #share no state.
+    __slots__ = ('source', 'optimize', '_entries', '_indexes', '_trees', '_programs')
+
+    def __init__(self, code, optimize=False):
+        ast = parse(tokenize(code))
+        if optimize:
+            ast = fold_constants(ast)
+        set_attribute = object.__setattr__
+        set_attribute(self, 'source', code)
+        set_attribute(self, 'optimize', optimize)
+        set_attribute(self, '_entries', tuple(_flatten_tree(ast)))
+        # Slot index of every name in the program; only ever copied
+        set_attribute(self, '_indexes', self._prepare(ast).indexes)
+        # Prepared trees not in use, each with its loop traces by limits;
+        # list.pop() and append() are atomic
+        set_attribute(self, '_trees', [(ast, {})])
+        # Compiled programs of the other backends
+        set_attribute(self, '_programs', {})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CompiledProgram objects are immutable")
+
+    def _prepare(self, ast):
+        #Infer the types of a tree, mark its deep expressions and resolve
+        #its slots for an empty environment. Every tree of the program gets
+        #the same slots.
+        variables = VariableSlots()
+        infer_types(ast)
+        mark_deep_expressions(ast)
+        resolve_slots(ast, variables)
+        return variables
+
+    def _compiled(self, backend, limits):
+        #Return the program compiled for a backend other than the tree-walker,
+        #compiling it on first use. Bytecode differs with and without limits
+        #and a size limit, so each variant is kept.
+        key = backend
+        if backend == 'bytecode' and limits is not None:
+            key = (backend, limits.max_size is not None)
+        program = self._programs.get(key)
+        if program is None:
+            ast = _rebuild_tree(self._entries)
+            if backend == 'bytecode':
+                program = compile_bytecode(ast, limits)
+            elif backend == 'python':
+                try:
+                    program = compile_python(ast)
+                except (SyntaxError, RecursionError, MemoryError):
+                    program = compile_closures(ast)
+            else:
+                program = compile_closures(ast)
+            # Runs racing to compile store equal programs
+            self._programs[key] = program
+        return program
+
+    def run(self, variables=None, backend='tree', output=None, limits=None):
+        #Run the program and return (result, environment) like interpret().
+        #variables gives the initial global variables; lists among them are
+        #copied, so a run never changes the caller's values. limits are the
+        #Limits of this run. environment['variables'] is a plain dict on
+        #every backend.
+        bindings = {}
+        for name, value in (variables or {}).items():
+            if isinstance(value, (list, NumberList)):
+                value = copy.deepcopy(value)
+            bindings[name] = value
+        environment = {'variables': bindings, 'output': []}
+        if backend != 'tree':
+            if backend not in BACKENDS:
+                raise ValueError(f"Unknown backend: {backend}")
+            if limits is not None and backend != 'bytecode':
+                raise ValueError("Limits are only supported by the tree and bytecode backends")
+            program = self._compiled(backend, limits)
+            if output is not None:
+                environment['sink'] = make_sink(output) if isinstance(output, str) else output
+            sink = output_sink(environment)
+            try:
+                if backend == 'bytecode':
+                    return run_bytecode(program, environment, limits), environment
+                return program(environment), environment
+            finally:
+                sink.flush()
+
+        slots = VariableSlots()
+        slots.indexes = self._indexes.copy()
+        slots.values = [_UNSET] * len(slots.indexes)
+        slots.update(bindings)
+        environment['variables'] = slots
+        try:
+            ast, traces = self._trees.pop()
+        except IndexError:
+            ast, traces = _rebuild_tree(self._entries), {}
+            self._prepare(ast)
+        # Loops compiled under another size limit check sizes differently
+        limits_key = None if limits is None else (limits.max_size,)
+        try:
+            result, environment = interpret(ast, environment, output=output, prepared=True, limits=limits,
+                                            traces=traces.setdefault(limits_key, {}))
+        finally:
+            self._trees.append((ast, traces))
+        # Callers get a plain dict, as from interpret() and the other backends
+        environment['variables'] = dict(slots.items())
+        return result, environment
+
+@functools.lru_cache(maxsize=PROGRAM_CACHE_SIZE)
+def compile_program(code, optimize=False):
+    #Return the CompiledProgram for some source code. The PROGRAM_CACHE_SIZE
+    #most recently used programs are kept, so a service running the same
+    #scripts over and over parses each only once. Syntax errors are not cached.
+    return CompiledProgram(code, optimize)
+
+def run_program(code, backend='tree', output=None, optimize=False, limits=None):
+    #Run a program from source code, reusing compiled programs.
+    return compile_program(code, optimize).run(backend=backend, output=output, limits=limits)
+
+def interactive_mode(backend='tree', output=None, optimize=False, report=None):
     #Run the interpreter in interactive mode with persistent environment.
     print("Interactive Interpreter (Stage 1-6)")
     print("Type 'exit' or 'quit' to end the session")
@@ -867,57 +4867,82 @@ def interactive_mode():
     print("  Loops: while (x > 0) { print x; x = x - 1 }")
 
     environment = {'variables': {}, 'output': []}
+    if output is not None:
+        environment['sink'] = output
 
-    # Keep track of multiline input
-    code_buffer = []
+    # Tokens of the block being entered. Each line is tokenized once as it
+    # arrives and the block is parsed again, resuming after the statements
+    # that were already complete, so syntax errors show up on the line
+    # that has them.
+    block_tokens = TokenStream()
+    block_lines = 0
+    resume = {}
 
     while True:
         try:
-            prompt = "... " if code_buffer else "> "
+            prompt = "... " if block_lines else "> "
             line = input(prompt)
 
-            if not code_buffer and line.lower() in ['exit', 'quit']:
+            if not block_lines and line.lower() in ['exit', 'quit']:
                 break
 
-            code_buffer.append(line)
-
-            # Try to run the accumulated code
-            code = "\n".join(code_buffer)
+            block_lines += 1
 
             try:
-                tokens = tokenize(code)
-                ast = parse(tokens)
-                result, environment = interpret(ast, environment)
-                code_buffer = []  # Reset buffer on successful execution
+                block_tokens.extend(tokenize(line, block_lines))
+                ast = parse(block_tokens, resume)
+                block_tokens, block_lines, resume = TokenStream(), 0, {}
+                program = optimize_program(ast, report) if optimize else ast
+                result, environment = interpret(program, environment, backend)
 
                 if result is not None and ast['body'] and ast['body'][-1]['type'] != 'print':
                     print(f"Result: {result}")
 
+            except IncompleteInputError:
+                # The statement is not finished yet (e.g. "x = "), keep reading
+                continue
             except Exception as e:
-                # If the error is about unexpected end of file, continue reading input
-                if "Unexpected end of file" in str(e):
-                    continue
-                # Otherwise report the error and reset
+                # Report the error and reset
                 print(f"Error: {e}")
-                code_buffer = []
+                block_tokens, block_lines, resume = TokenStream(), 0, {}
 
         except KeyboardInterrupt:
             print("\nKeyboard interrupt")
-            code_buffer = []
+            block_tokens, block_lines, resume = TokenStream(), 0, {}
 
         except EOFError:
             print("\nEOF")
             break
 
-def process_file(file_path):
+def process_file(file_path, backend='tree', cache=True, cache_dir=None, output=None, optimize=False,
+                 report=None, stats=None, traces=None, profile=None, profile_output=None, limits=None):
     #Read and execute a program from a file.
+    #The parsed program is cached on disk unless cache is False. The cache
+    #holds the program as parsed; constant folding runs after loading it.
+    #If stats is a file, the quickening counters are written to it; if
+    #traces is a file, the loop tracer's report is. If profile is a file or
+    #profile_output a path, the program is profiled and the hot-spot table
+    #is written to the file and the profile to the path as JSON, even if
+    #the program fails. limits are the Limits of the run.
     try:
         with open(file_path, 'r') as file:
             code = file.read()
 
+        profiler = Profile() if profile is not None or profile_output is not None else None
         try:
-            result, environment = run_program(code)
+            if cache:
+                ast = parse_cached(code, cache_dir)
+            else:
+                ast = parse(tokenize(code))
+            if optimize:
+                ast = optimize_program(ast, report)
+            result, environment = interpret(ast, backend=backend, output=output, profile=profiler,
+                                            limits=limits)
             print("Program executed successfully.")
+            if stats is not None:
+                report_quickening(environment, stats)
+            if traces is not None:
+                report_traces(environment, traces)
             # if environment['output']:
             #     print("Output:")
             #     for item in environment['output']:
@@ -925,23 +4950,347 @@ def process_file(file_path):
         except Exception as e:
             print(f"Runtime error: {e}")
 
+        if profile is not None:
+            report_profile(profiler, profile, code)
+        if profile_output is not None:
+            with open(profile_output, 'w') as file:
+                json.dump(profiler.to_dict(), file, indent=2)
+
     except FileNotFoundError:
         print(f"File not found: {file_path}")
 
+def _batch_input(prompt=''):
+    #input() for batch workers: there is no one to answer.
+    raise EOFError("input() is not available in batch mode")
+
+def _start_batch_worker():
+    #Set up a batch worker process. A script that calls input() fails at
+    #once instead of blocking the worker.
+    builtins.input = _batch_input
+
+def run_batch_script(task):
+    #Run one script of a batch in a fresh environment. task is (file_path,
+    #backend, cache, cache_dir, optimize, limits). Returns a record with the path,
+    #whether it ran without error, the printed text, the error type and
+    #message (None on success) and the wall-clock seconds taken.
+    file_path, backend, cache, cache_dir, optimize, limits = task
+    printed = io.StringIO()
+    error_type = error = None
+    start = time.perf_counter()
+    try:
+        with open(file_path, 'r') as file:
+            code = file.read()
+        ast = parse_cached(code, cache_dir) if cache else parse(tokenize(code))
+        if optimize:
+            ast = fold_constants(ast)
+        interpret(ast, {'variables': {}, 'output': []}, backend, FileSink(printed), limits=limits)
+    except Exception as e:
+        error_type, error = type(e).__name__, str(e)
+    return {
+        'path': file_path,
+        'ok': error is None,
+        'output': printed.getvalue(),
+        'error_type': error_type,
+        'error': error,
+        'seconds': time.perf_counter() - start
+    }
+
+def batch_scripts(directory, pattern='*.txt'):
+    #Return the paths of the scripts under a directory matching a pattern,
+    #sorted so batches run in a stable order.
+    import fnmatch
+
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(name for name in dirs if not name.startswith('.'))
+        paths.extend(os.path.join(root, name) for name in sorted(files) if fnmatch.fnmatch(name, pattern))
+    return paths
+
+def run_batch(paths, jobs=None, backend='tree', cache=True, cache_dir=None, optimize=False, results=None,
+              file=None, limits=None):
+    #Run independent scripts across a pool of jobs worker processes (default:
+    #one per CPU). Workers are reused for many scripts, so Python starts
+    #once per worker rather than once per script. A line per script and a
+    #summary are written to file (default: sys.stdout); if results is a
+    #file, every script's record from run_batch_script() is written to it
+    #as a JSON line.
+    #limits apply to every script separately.
+    #Returns the number of scripts that failed.
+    import multiprocessing
+
+    if file is None:
+        file = sys.stdout
+    jobs = jobs or os.cpu_count() or 1
+    tasks = [(path, backend, cache, cache_dir, optimize, limits) for path in paths]
+    # Hand out scripts a few at a time to save round trips, while still
+    # giving every worker several chunks to balance uneven scripts
+    chunksize = max(1, len(tasks) // (jobs * 8))
+
+    failed = 0
+    total = 0.0
+    start = time.perf_counter()
+    with multiprocessing.Pool(jobs, initializer=_start_batch_worker) as pool:
+        for record in pool.imap(run_batch_script, tasks, chunksize):
+            total += record['seconds']
+            if record['ok']:
+                print(f"ok    {record['seconds']:8.3f}s  {record['path']}", file=file)
+            else:
+                failed += 1
+                print(f"FAIL  {record['seconds']:8.3f}s  {record['path']}: {record['error']}", file=file)
+            if results is not None:
+                results.write(json.dumps(record) + "\n")
+
+    elapsed = time.perf_counter() - start
+    print(f"Ran {len(tasks)} scripts in {elapsed:.3f}s with {jobs} workers: {len(tasks) - failed} ok, "
+          f"{failed} failed, {total:.3f}s of script time", file=file)
+    return failed
+
+class _SocketSink(AsyncOutputSink):
+    #Send the values a session prints to its client.
+    def __init__(self, writer):
+        self.writer = writer
+
+    async def write(self, value):
+        self.writer.write(f"{value}\n".encode())
+        # Wait for a slow client only once a lot of output is pending
+        if self.writer.transport.get_write_buffer_size() > 65536:
+            await self.writer.drain()
+
+    async def flush(self):
+        await self.writer.drain()
+
+class ReplServer:
+    #Hosts many interactive sessions in one process. Each client connection
+    #is a session with the prompts, results and errors of interactive_mode()
+    #and its own persistent environment; a program's input() reads the
+    #client's next line. Sessions run on the bytecode machine as asyncio
+    #tasks, each statement block under limits. Blocks are compiled once
+    #for all sessions: the cache maps the source text of the last
+    #cache_size blocks to their bytecode. A session is closed after
+    #idle_timeout seconds without input, and clients beyond max_sessions
+    #are turned away.
+    def __init__(self, optimize=False, limits=None, idle_timeout=300.0, max_sessions=1000, cache_size=1024):
+        self.optimize = optimize
+        self.limits = limits
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.compile = functools.lru_cache(maxsize=cache_size)(self._compile)
+        self.active = 0
+        self.stats = collections.Counter()
+
+    def _compile(self, source):
+        #Compile a block; returns the bytecode and whether to show its result.
+        ast = parse(tokenize(source))
+        program = fold_constants(ast) if self.optimize else ast
+        show_result = bool(ast['body']) and ast['body'][-1]['type'] != 'print'
+        return compile_bytecode(program, self.limits), show_result
+
+    async def session(self, reader, writer):
+        #Serve one client until it quits, disconnects or stays idle.
+        if self.active >= self.max_sessions:
+            self.stats['rejected'] += 1
+            writer.write(b"Error: too many sessions\n")
+            writer.close()
+            return
+        self.active += 1
+        self.stats['sessions'] += 1
+
+        async def read_line(prompt):
+            writer.write(prompt.encode())
+            await writer.drain()
+            line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+            if not line:
+                raise EOFError("EOF when reading a line")
+            return line.decode('utf-8', 'replace').rstrip('\r\n')
+
+        environment = {'variables': {}, 'output': []}
+        sink = _SocketSink(writer)
+        lines = []
+        # Tokens of the block being entered, parsed after every line like
+        # interactive_mode() does to find where it ends
+        block_tokens = TokenStream()
+        resume = {}
+        try:
+            while True:
+                line = await read_line("... " if lines else "> ")
+                if not lines and line.lower() in ['exit', 'quit']:
+                    break
+                lines.append(line)
+
+                try:
+                    block_tokens.extend(tokenize(line, len(lines)))
+                    parse(block_tokens, resume)
+                    bytecode, show_result = self.compile("\n".join(lines))
+                    lines, block_tokens, resume = [], TokenStream(), {}
+                    self.stats['blocks'] += 1
+                    machine = _bytecode_machine(bytecode, environment, None, ASYNC_YIELD_EVERY, self.limits)
+                    result = await _drive_machine(machine, read_line, sink)
+
+                    if result is not None and show_result:
+                        await sink.write(f"Result: {result}")
+
+                except IncompleteInputError:
+                    # The statement is not finished yet (e.g. "x = "), keep reading
+                    continue
+                except (EOFError, asyncio.TimeoutError):
+                    raise
+                except Exception as e:
+                    # Report the error and reset
+                    await sink.write(f"Error: {e}")
+                    lines, block_tokens, resume = [], TokenStream(), {}
+
+        except asyncio.TimeoutError:
+            self.stats['evicted'] += 1
+            writer.write(f"\nSession closed after {self.idle_timeout:g} seconds without input\n".encode())
+        except (EOFError, ConnectionError):
+            pass
+        finally:
+            self.active -= 1
+            writer.close()
+
+    async def serve(self, address, file=sys.stderr):
+        #Accept sessions on a Unix socket path or a [HOST:]PORT on TCP.
+        host, _, port = address.rpartition(':')
+        if port.isdigit():
+            server = await asyncio.start_server(self.session, host or '127.0.0.1', int(port))
+        else:
+            server = await asyncio.start_unix_server(self.session, address)
+        print(f"Serving Sigil sessions on {address}", file=file, flush=True)
+        async with server:
+            await server.serve_forever()
+
+    def report(self, file):
+        #Write the session and cache counters.
+        cache = self.compile.cache_info()
+        print(f"{self.stats['sessions']} sessions ({self.stats['evicted']} evicted for idleness, "
+              f"{self.stats['rejected']} turned away), {self.stats['blocks']} blocks run, "
+              f"{cache.hits} compiled blocks reused, {cache.currsize} cached", file=file)
+
 def main():
     #Main entry point for the program.
-    import sys
-
-    if len(sys.argv) == 1:
-        # No arguments, run in interactive mode
-        interactive_mode()
-    elif len(sys.argv) == 2:
-        # One argument, process file
-        process_file(sys.argv[1])
-    else:
-        print("Usage: python sigil.py [file_path]")
-        print("  If file_path is provided, the program from the file will be executed.")
-        print("  If no arguments are provided, interactive mode will be started.")
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Run a Sigil program from a file. If no file is given, interactive mode is started.")
+    parser.add_argument('file_path', nargs='?', help="program to execute")
+    parser.add_argument('--backend', choices=['tree'] + sorted(BACKENDS), default='tree',
+                        help="execution engine to use (default: tree)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="always re-parse the program instead of using the compiled-program cache")
+    parser.add_argument('--cache-dir', default=None,
+                        help="directory for the compiled-program cache (default: $SIGIL_CACHE_DIR, "
+                             "else sigil under $XDG_CACHE_HOME or ~/.cache)")
+    parser.add_argument('--output', default=None, metavar='SINK',
+                        help="where printed values go: capture (default: print and keep them), "
+                             "buffered[:BATCH], ring[:SIZE], file:PATH or discard")
+    parser.add_argument('--optimize', action='store_true',
+                        help="fold constant expressions and remove branches with constant conditions")
+    parser.add_argument('--show-node-counts', action='store_true',
+                        help="with --optimize, print the node counts before and after folding to stderr")
+    parser.add_argument('--show-quickening', action='store_true',
+                        help="print how often nodes were specialized and deoptimized to stderr "
+                             "(tree backend)")
+    parser.add_argument('--no-trace', action='store_true',
+                        help="do not compile hot while loops to Python (tree backend)")
+    parser.add_argument('--show-traces', action='store_true',
+                        help="print which while loops were compiled and the estimated time saved to stderr "
+                             "(tree backend)")
+    parser.add_argument('--profile', action='store_true',
+                        help="print the lines and nodes that took the most time to stderr (tree backend)")
+    parser.add_argument('--profile-output', metavar='PATH', default=None,
+                        help="profile the program and save the per-line and per-node numbers as JSON")
+    parser.add_argument('--max-steps', type=int, default=None, metavar='N',
+                        help="stop the program after N statements and loop iterations "
+                             "(tree and bytecode backends)")
+    parser.add_argument('--timeout', type=float, default=None, metavar='SECONDS',
+                        help="stop the program after it has run for SECONDS (tree and bytecode backends)")
+    parser.add_argument('--max-size', type=int, default=None, metavar='N',
+                        help="stop the program when it stores a value larger than N: string characters, or list "
+                             "elements including those of nested lists "
+                             "(tree and bytecode backends)")
+    parser.add_argument('--batch', metavar='DIR', default=None,
+                        help="run every script under DIR in a pool of worker processes instead of a single file")
+    parser.add_argument('--pattern', default='*.txt',
+                        help="with --batch, file name pattern of the scripts to run (default: *.txt)")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help="with --batch, number of worker processes (default: one per CPU)")
+    parser.add_argument('--batch-output', metavar='PATH', default=None,
+                        help="with --batch, write each script's output, error and time as JSON lines to PATH")
+    parser.add_argument('--serve', metavar='ADDRESS', default=None,
+                        help="host interactive sessions on a Unix socket path or a [HOST:]PORT on TCP "
+                             "(HOST defaults to 127.0.0.1)")
+    parser.add_argument('--idle-timeout', type=float, default=300.0, metavar='SECONDS',
+                        help="with --serve, close sessions that send nothing for SECONDS (default: 300)")
+    parser.add_argument('--max-sessions', type=int, default=1000, metavar='N',
+                        help="with --serve, the most sessions open at once (default: 1000)")
+    args = parser.parse_args()
+    report = sys.stderr if args.show_node_counts else None
+    if (args.profile or args.profile_output) and args.backend != 'tree':
+        parser.error("--profile and --profile-output need the tree backend")
+    limits = None
+    if args.max_steps is not None or args.timeout is not None or args.max_size is not None:
+        if args.backend not in ('tree', 'bytecode'):
+            parser.error("--max-steps, --timeout and --max-size need the tree or bytecode backend")
+        limits = Limits(args.max_steps, args.timeout, args.max_size)
+
+    if args.no_trace:
+        global TRACE_LOOPS
+        TRACE_LOOPS = False
+
+    if args.serve is not None:
+        if args.file_path is not None or args.batch is not None:
+            parser.error("--serve hosts interactive sessions; do not also give a file or --batch")
+        if args.backend not in ('tree', 'bytecode'):
+            parser.error("--serve runs sessions on the bytecode machine")
+        if args.output is not None:
+            parser.error("--serve sends each session's output to its client; do not also give --output")
+        server = ReplServer(args.optimize, limits, args.idle_timeout, args.max_sessions)
+        try:
+            asyncio.run(server.serve(args.serve))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.report(sys.stderr)
+        return
+
+    if args.batch is not None:
+        if args.file_path is not None:
+            parser.error("--batch runs a directory of scripts; do not also give a file")
+        if args.output is not None:
+            parser.error("--batch writes each script's output with --batch-output, not --output")
+        results = open(args.batch_output, 'w') if args.batch_output else None
+        try:
+            failed = run_batch(batch_scripts(args.batch, args.pattern), args.jobs, args.backend,
+                               cache=not args.no_cache, cache_dir=args.cache_dir, optimize=args.optimize,
+                               results=results, limits=limits)
+        finally:
+            if results is not None:
+                results.close()
+        if failed:
+            sys.exit(1)
+        return
+
+    # The sink is made only now, so a usage error above leaves no file behind
+    output = None
+    if args.output is not None:
+        try:
+            output = make_sink(args.output)
+        except (ValueError, OSError) as e:
+            parser.error(f"argument --output: {e}")
+    try:
+        if args.file_path is None:
+            # No file, run in interactive mode
+            interactive_mode(args.backend, output, args.optimize, report)
+        else:
+            process_file(args.file_path, args.backend, cache=not args.no_cache, cache_dir=args.cache_dir,
+                         output=output, optimize=args.optimize, report=report,
+                         stats=sys.stderr if args.show_quickening else None,
+                         traces=sys.stderr if args.show_traces else None,
+                         profile=sys.stderr if args.profile else None, profile_output=args.profile_output,
+                         limits=limits)
+    finally:
+        if output is not None:
+            output.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
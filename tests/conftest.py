@@ -0,0 +1,17 @@
+#Shared setup for the tests: make sigil importable and run programs.
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sigil
+
+@pytest.fixture
+def run(capsys):
+    #Return a function that runs source code and returns what it printed.
+    def run(code, backend='tree', **options):
+        sigil.interpret(sigil.parse(sigil.tokenize(code)), backend=backend, **options)
+        return capsys.readouterr().out
+    return run
@@ -0,0 +1,86 @@
+#Tests for the slotted AST node classes and their dict view.
+import glob
+import os
+
+import pytest
+
+import sigil
+
+# The test files that parse; *_error.txt ones are meant to fail
+TEST_FILES = sorted(path for path in glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                            '..', 'test_files', '*.txt'))
+                    if not path.endswith('_error.txt'))
+
+BACKENDS = ['tree'] + sorted(sigil.BACKENDS)
+
+SOURCE = ('x = input("p")\nl = [1, "a", true]\nl[0] = -l[0] * 2\nl.append(len(l))\n'
+          'if (x == "y" and !false) { print l } else { print x }\n'
+          'while (len(l) < 6) { l.append(input()) }\n')
+
+def read(path):
+    with open(path) as file:
+        return file.read()
+
+@pytest.mark.parametrize('path', TEST_FILES, ids=os.path.basename)
+def test_dict_round_trip(path):
+    ast = sigil.parse(sigil.tokenize(read(path)))
+    data = ast.to_dict()
+    rebuilt = sigil.node_from_dict(data)
+    assert rebuilt == ast
+    assert rebuilt.to_dict() == data
+    assert repr(rebuilt) == repr(data)
+
+def test_dict_view():
+    ast = sigil.parse(sigil.tokenize(SOURCE))
+    assignment = ast.body[0]
+    assert assignment['type'] == 'assignment'
+    assert assignment['name'] == 'x'
+    assert 'prompt' in assignment['value']
+    assert assignment['value'].get('missing', 1) == 1
+    assert list(assignment.keys()) == ['type', 'name', 'value']
+    assert dict(assignment)['value'] == {'type': 'input', 'prompt': {'type': 'string', 'value': 'p'}}
+    assert len(assignment) == 3
+    with pytest.raises(KeyError):
+        assignment['missing']
+    with pytest.raises(KeyError):
+        assignment['missing'] = 1
+    assignment['name'] = 'y'
+    assert assignment.name == 'y'
+
+def test_nodes_are_slotted():
+    ast = sigil.parse(sigil.tokenize(SOURCE))
+    for node_type, node_class in sigil.NODE_CLASSES.items():
+        assert node_class.type == node_type
+        assert not hasattr(node_class(*[None] * len(node_class.fields)), '__dict__')
+    assert ast.body[0].kind == sigil.Assignment.kind
+    assert sigil.NODE_KINDS[sigil.Assignment.kind] is sigil.Assignment
+
+def test_lines():
+    ast = sigil.parse(sigil.tokenize(SOURCE))
+    assert [statement.line for statement in ast.body] == [1, 2, 3, 4, 5, 6]
+    assert ast.body[4].if_body[0].line == 5
+    # Lines are not fields: they are left out of the dict view and equality
+    data = ast.to_dict()
+    assert 'line' not in data['body'][0]
+    data['body'][0]['line'] = 7
+    assert sigil.node_from_dict(data).body[0].line == 7
+    assert ast != data
+
+def test_unknown_node_type():
+    with pytest.raises(ValueError, match="Unknown node type: bogus"):
+        sigil.node_from_dict({'type': 'bogus'})
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_run_dict_tree(run, backend):
+    # interpret() still takes the dicts parse() used to return
+    ast = {'type': 'program', 'body': [
+        {'type': 'assignment', 'name': 'x', 'value': {'type': 'number', 'value': 2.0}},
+        {'type': 'print', 'expression': {
+            'type': 'binary', 'op': '*',
+            'left': {'type': 'variable', 'name': 'x'},
+            'right': {'type': 'list_literal', 'elements': [{'type': 'string', 'value': 'a'}]}}}]}
+    with pytest.raises(TypeError):
+        sigil.interpret(ast, backend=backend)
+    ast['body'][1]['expression']['right'] = {'type': 'number', 'value': 3.0}
+    sigil.interpret(ast, backend=backend)
+    assert run('print 6', backend) == "6.0\n6.0\n"
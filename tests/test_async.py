@@ -0,0 +1,89 @@
+#Tests for running programs as coroutines with interpret_async().
+import asyncio
+
+import pytest
+
+import sigil
+
+GREET = 'name = input("Name? ")\nprint "Hi " + name\nn = input("Count? ")\nprint len(n)\nn\n'
+
+class ListSink(sigil.AsyncOutputSink):
+    #Collect printed values, noting the awaits.
+    def __init__(self, events):
+        self.events = events
+
+    async def write(self, value):
+        await asyncio.sleep(0)
+        self.events.append(('print', value))
+
+    async def flush(self):
+        self.events.append(('flush', None))
+
+def answers(events, *lines):
+    #Return an input source answering with lines in turn.
+    lines = list(lines)
+
+    async def read(prompt):
+        events.append(('input', prompt))
+        await asyncio.sleep(0)
+        return lines.pop(0)
+    return read
+
+def parse(code):
+    return sigil.parse(sigil.tokenize(code))
+
+def test_input_and_print_round_trip():
+    events = []
+    result, environment = asyncio.run(sigil.interpret_async(
+        parse(GREET), input_source=answers(events, "Ada", "abc"), output=ListSink(events)))
+    assert events == [('input', "Name? "), ('print', "Hi Ada"), ('input', "Count? "), ('print', 3.0),
+                      ('flush', None)]
+    assert result == "abc"
+    assert environment['variables'] == {'name': "Ada", 'n': "abc"}
+
+def test_plain_output():
+    # Without an AsyncOutputSink, output goes where interpret() puts it
+    events = []
+    capture = sigil.CaptureSink()
+    asyncio.run(sigil.interpret_async(parse(GREET), input_source=answers(events, "Ada", ""), output=capture))
+    assert capture.values == ["Hi Ada", 0.0]
+    environment = {'variables': {}, 'output': []}
+    asyncio.run(sigil.interpret_async(parse('print [1, 2]'), environment))
+    assert environment['output'] == [[1.0, 2.0]]
+
+def test_programs_share_the_loop():
+    # The first program's input() waits for the second program to print,
+    # which needs both to run on one event loop
+    printed = asyncio.Event()
+    events = []
+
+    async def wait_for_print(prompt):
+        await printed.wait()
+        return "after"
+
+    class SignalSink(sigil.AsyncOutputSink):
+        async def write(self, value):
+            events.append(value)
+            printed.set()
+
+    async def both():
+        loop = 'i = 0\nwhile (i < 50) {\n  i = i + 1\n}\nprint '
+        await asyncio.wait_for(asyncio.gather(
+            sigil.interpret_async(parse(loop + 'input()'), input_source=wait_for_print, output=SignalSink(),
+                                  yield_every=10),
+            sigil.interpret_async(parse(loop + '"before"'), output=SignalSink(), yield_every=10)), 10)
+    asyncio.run(both())
+    assert events == ["before", "after"]
+
+@pytest.mark.parametrize('code', ['print 1 / 0', 'print y', 'print 1 + true'])
+def test_errors_match_interpret(code):
+    with pytest.raises(Exception) as expected:
+        sigil.interpret(parse(code), output='discard')
+    with pytest.raises(type(expected.value)) as error:
+        asyncio.run(sigil.interpret_async(parse(code), output='discard'))
+    assert str(error.value) == str(expected.value)
+
+def test_limits():
+    with pytest.raises(sigil.StepLimitError):
+        asyncio.run(sigil.interpret_async(parse('while (true) { }'), output='discard',
+                                          limits=sigil.Limits(max_steps=100)))
@@ -0,0 +1,178 @@
+#Tests that every backend prints the same values and raises the same errors
+#as the tree-walker.
+import array
+import builtins
+import glob
+import io
+import marshal
+import os
+import sys
+
+import pytest
+
+import sigil
+
+BACKENDS = sorted(sigil.BACKENDS)
+
+TEST_FILES = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                           '..', 'test_files', '*.txt')))
+
+PROGRAMS = {
+    'undefined': 'x = 1\nprint y',
+    'undefined_in_loop': 'i = 0\nwhile (i < 3) { if (i == 2) { print z } i = i + 1 }',
+    'number_condition': 'if (1) { print 1 }',
+    'number_loop_condition': 'i = 0\nwhile (i) { i = 1 }',
+    'add_boolean': 'print 1 + true',
+    'subtract_string': 'print "a" - 1',
+    'divide_by_zero': 'x = 0\nprint 1 / x',
+    'index': 'l = [1, 2, 3]\nprint l[1]\nprint l[1.5]',
+    'index_range': 'l = [1, 2, 3]\nprint l[3]',
+    'index_negative': 'l = [1, 2, 3]\nprint l[-1]',
+    'index_boolean': 'l = [5, 6]\nprint l[1.0]\nprint l[true]',
+    'index_non_list': 'l = 5\nprint l[0]',
+    'append_non_list': 'l = 5\nl.append(1)',
+    'append_undefined': 'q.append(1)',
+    'set_undefined': 'q[0] = 1',
+    'set_non_list': 'q = "s"\nq[0] = 1',
+    'set_range': 'q = [1]\nq[2] = 1',
+    'len': 'print len([1, 2]) + len("abc")\nprint len(5)',
+    'equality': 'print 1 == "1"\nprint [1] == [1]\nprint [1] != [2]\nprint true == true\nprint 1 != true',
+    'logic': 'print true and false\nprint true or false\nprint 1 and true',
+    'not': 'print !true\nprint !1',
+    'negate': 'print -(3)\nprint -"a"',
+    'concatenate': 'print "a" + [1, 2] + 3\nprint [1, "x"] + "b"\nprint [1] + [2]\nprint [1] + 2',
+    'compare': 'print 1 < 2\nprint 2 >= 2\nprint "a" < "b"',
+    'nested_loops': ('i = 0\nt = 0\nwhile (i < 10) { j = 0\n while (j < i) {\n'
+                     '  if (j / 2 == 1) { t = t + j } else { t = t - 1 }\n  j = j + 1 }\n'
+                     ' i = i + 1 }\nprint t'),
+    'lists': ('a = []\ni = 0\nwhile (i < 5) { a.append(i * i) i = i + 1 }\na[0] = "s"\n'
+              'print a\nprint a[4] + a[0]\nprint len(a)'),
+    'list_aliases': 'a = [1, 2]\nb = a\nb.append("x")\nprint a\na[0] = true\nprint b\nprint len(a)',
+    'nested_lists': 'a = []\na.append([1])\na[0].append(2)\nprint a\nprint a[0][1] * 2',
+    'strings': 's = ""\ni = 0\nwhile (i < 5) { s = s + i + "," i = i + 1 }\nprint s\nprint len(s)',
+    'escapes': 'print "a\\tb\\nc\\"d\\\\e\\q"',
+    'type_change': 'i = 0\nx = 1\nwhile (i < 3) { print x - 1\n x = "s"\n i = i + 1 }',
+    'branch_types': 'if (true) { y = 1 } else { y = "a" }\nprint y + 1\nprint y == 1',
+    'hot_loop': ('i = 0\nt = 0\ns = ""\nwhile (i < 3000) {\n  t = t + i * 2 - i / 4\n'
+                 '  if (i == 2500) { s = s + t }\n  i = i + 1\n}\nprint t\nprint s'),
+    'hot_loop_type_change': ('i = 0\nx = 0\nwhile (i < 3000) {\n  if (i == 2000) { x = "s" }\n'
+                             '  x = x + 1\n  i = i + 1\n}\nprint x'),
+    'input': 'name = input("Name: ")\nprint "Hello " + name\nprint len(input())',
+}
+
+@pytest.fixture(autouse=True)
+def answer_input(monkeypatch):
+    monkeypatch.setattr(builtins, 'input', lambda prompt='': 'apple')
+
+def outcome(code, backend, optimize=False):
+    #Return the text a program printed and the error it stopped with.
+    environment = {'variables': {}}
+    printed = io.StringIO()
+    sink = sigil.FileSink(printed)
+    try:
+        ast = sigil.parse(sigil.tokenize(code))
+        if optimize:
+            ast = sigil.fold_constants(ast)
+        sigil.interpret(ast, environment, backend, output=sink)
+        error = None
+    except Exception as e:
+        error = (type(e).__name__, str(e))
+    return printed.getvalue(), error
+
+def read(path):
+    with open(path) as file:
+        return file.read()
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('path', TEST_FILES, ids=os.path.basename)
+def test_test_files_match_tree(backend, path):
+    code = read(path)
+    assert outcome(code, backend) == outcome(code, 'tree')
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('name', sorted(PROGRAMS))
+@pytest.mark.parametrize('optimize', [False, True], ids=['plain', 'folded'])
+def test_programs_match_tree(backend, name, optimize):
+    code = PROGRAMS[name]
+    assert outcome(code, backend, optimize) == outcome(code, 'tree', optimize)
+
+def test_test_files_run():
+    # Guard against the parity tests passing because nothing ran
+    assert TEST_FILES
+    printed, error = outcome(read(TEST_FILES[0]), 'tree')
+    assert printed
+
+@pytest.mark.parametrize('backend', ['tree'] + BACKENDS)
+def test_expected_output(backend):
+    # The output of the original interpreter
+    printed, error = outcome(PROGRAMS['nested_loops'] + '\nprint [1, "a"] + "b"', backend)
+    assert (printed, error) == ("-24.0\n[1.0, a]b\n", None)
+
+@pytest.mark.parametrize('backend', ['tree'] + BACKENDS)
+def test_errors(backend):
+    assert outcome(PROGRAMS['undefined'], backend)[1] == ('ValueError', 'Undefined variable: y')
+    assert outcome(PROGRAMS['divide_by_zero'], backend)[1] == ('ZeroDivisionError', 'float division by zero')
+
+def test_python_backend_runs_native_loops():
+    # Variables become locals of one Python function, loops Python loops
+    code = PROGRAMS['nested_loops']
+    source, constants = sigil.translate_to_python(sigil.parse(sigil.tokenize(code)))
+    assert source.startswith("def _sigil_program(_environment):")
+    assert source.count("while ") == 2
+    program = sigil.compile_python(sigil.parse(sigil.tokenize(code)))
+    environment = {'variables': {'j': 'kept'}, 'output': []}
+    program(environment)
+    assert environment['variables'] == {'i': 10.0, 'j': 9.0, 't': -24.0}
+
+def test_python_backend_falls_back_to_closures(monkeypatch):
+    # A program the Python compiler rejects still runs
+    def too_deep(ast):
+        raise RecursionError("maximum recursion depth exceeded")
+    monkeypatch.setattr(sigil, 'compile_python', too_deep)
+    assert outcome(PROGRAMS['nested_loops'], 'python') == ("-24.0\n", None)
+
+def test_python_backend_option(monkeypatch, tmp_path, capsys):
+    program = tmp_path / 'program.txt'
+    program.write_text(PROGRAMS['lists'])
+    monkeypatch.setattr(sys, 'argv', ['sigil.py', str(program), '--no-cache', '--backend=python'])
+    sigil.main()
+    assert capsys.readouterr().out == "['s', 1.0, 4.0, 9.0, 16.0]\n16.0s\n5.0\nProgram executed successfully.\n"
+
+def test_bytecode_round_trips():
+    bytecode = sigil.compile_bytecode(sigil.parse(sigil.tokenize(PROGRAMS['lists'])))
+    data = sigil.dump_bytecode(bytecode)
+    assert data.startswith(sigil.BYTECODE_MAGIC)
+    loaded = sigil.load_bytecode(data)
+    assert loaded == bytecode
+    assert sigil.disassemble(loaded) == sigil.disassemble(bytecode)
+    environment = {'variables': {}, 'output': []}
+    sigil.run_bytecode(loaded, environment)
+    assert environment['variables']['a'] == ['s', 1.0, 4.0, 9.0, 16.0]
+
+def test_disassemble():
+    bytecode = sigil.compile_bytecode(sigil.parse(sigil.tokenize('x = 1 + 2\nprint x')))
+    assert sigil.disassemble(bytecode).splitlines() == [
+        "     0 LOAD_CONST           0 (1.0)",
+        "     2 ADD                  2 (2.0)",
+        "     4 STORE_VAR            0 (x)",
+        "     6 LOAD_VAR             0 (x)",
+        "     8 PRINT                0"]
+
+@pytest.mark.parametrize('data, message', [
+    (b'xxxx', "Not a Sigil bytecode file"),
+    (sigil.BYTECODE_MAGIC + b'\x00', "Corrupt Sigil bytecode"),
+    (sigil.BYTECODE_MAGIC + marshal.dumps((99, b'', (), ())), "Unsupported bytecode version: 99"),
+])
+def test_load_bytecode_errors(data, message):
+    with pytest.raises(ValueError) as error:
+        sigil.load_bytecode(data)
+    assert str(error.value) == message
+
+def test_invalid_opcode_fails_when_reached():
+    # The jump skips the unknown opcode 99
+    code = [sigil.OP_LOAD_CONST, 0, sigil.OP_PRINT, 0, sigil.OP_JUMP, 8, 99, 0]
+    environment = {'variables': {}, 'output': []}
+    sigil.run_bytecode({'code': array.array('i', code), 'constants': [1.0], 'names': []}, environment)
+    assert environment['output'] == [1.0]
+    with pytest.raises(ValueError, match="Invalid opcode: 99"):
+        sigil.run_bytecode({'code': array.array('i', [99, 0]), 'constants': [], 'names': []}, environment)
@@ -0,0 +1,74 @@
+#Tests for running a directory of scripts with --batch.
+import builtins
+import json
+import os
+import sys
+
+import pytest
+
+import sigil
+
+SCRIPTS = {
+    'a.txt': 'print 1 + 1\n',
+    'b.txt': 'x = 0\nprint 1 / x\n',
+    os.path.join('sub', 'c.txt'): 'print "c"\n',
+    os.path.join('.hidden', 'd.txt'): 'print "d"\n',
+    'notes.md': 'not a script\n',
+}
+
+@pytest.fixture
+def scripts(tmp_path):
+    for name, code in SCRIPTS.items():
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(code)
+    return tmp_path
+
+def main(monkeypatch, *arguments):
+    monkeypatch.setattr(sys, 'argv', ['sigil.py', *arguments])
+    sigil.main()
+
+def test_batch_scripts(scripts):
+    assert sigil.batch_scripts(str(scripts)) == [str(scripts / 'a.txt'), str(scripts / 'b.txt'),
+                                                 str(scripts / 'sub' / 'c.txt')]
+    assert sigil.batch_scripts(str(scripts), '*.md') == [str(scripts / 'notes.md')]
+
+@pytest.mark.parametrize('backend', ['tree'] + sorted(sigil.BACKENDS))
+def test_run_batch_script(scripts, backend):
+    record = sigil.run_batch_script((str(scripts / 'a.txt'), backend, False, None, False, None))
+    assert (record['ok'], record['output'], record['error_type'], record['error']) == (True, "2.0\n", None, None)
+    record = sigil.run_batch_script((str(scripts / 'b.txt'), backend, False, None, False, None))
+    assert (record['ok'], record['output']) == (False, "")
+    assert (record['error_type'], record['error']) == ('ZeroDivisionError', 'float division by zero')
+
+def test_batch_input_fails(monkeypatch, tmp_path):
+    monkeypatch.setattr(builtins, 'input', sigil._batch_input)
+    (tmp_path / 'ask.txt').write_text('print input("? ")\n')
+    record = sigil.run_batch_script((str(tmp_path / 'ask.txt'), 'tree', False, None, False, None))
+    assert (record['error_type'], record['error']) == ('EOFError', "input() is not available in batch mode")
+
+def test_batch_exit_status(monkeypatch, scripts, capsys):
+    # One script fails, so the batch does
+    results = scripts / 'results.jsonl'
+    with pytest.raises(SystemExit) as exit:
+        main(monkeypatch, '--batch', str(scripts), '--jobs', '2', '--no-cache', '--batch-output', str(results))
+    assert exit.value.code == 1
+    out = capsys.readouterr().out.splitlines()
+    assert [line.split()[0] for line in out[:3]] == ['ok', 'FAIL', 'ok']
+    assert out[1].endswith("b.txt: float division by zero")
+    assert out[3].startswith("Ran 3 scripts in ")
+    assert out[3].endswith(" with 2 workers: 2 ok, 1 failed, " + out[3].split(", ")[-1])
+    records = [json.loads(line) for line in results.read_text().splitlines()]
+    assert [(os.path.basename(record['path']), record['output']) for record in records] == [
+        ('a.txt', "2.0\n"), ('b.txt', ""), ('c.txt', "c\n")]
+
+def test_batch_succeeds(monkeypatch, scripts, capsys):
+    (scripts / 'b.txt').unlink()
+    main(monkeypatch, '--batch', str(scripts), '--jobs', '1', '--no-cache')
+    assert "2 ok, 0 failed" in capsys.readouterr().out
+
+def test_batch_rejects_file(monkeypatch, scripts, capsys):
+    with pytest.raises(SystemExit) as exit:
+        main(monkeypatch, str(scripts / 'a.txt'), '--batch', str(scripts))
+    assert exit.value.code == 2
+    assert "do not also give a file" in capsys.readouterr().err
@@ -0,0 +1,53 @@
+#Tests for the phase-separated benchmark suite and its baseline comparison.
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+import bench_suite
+
+def results(median, peak_bytes):
+    return {'workloads': {'numeric': {'parse': {'median': median, 'peak_bytes': peak_bytes}}}}
+
+@pytest.mark.parametrize('name', sorted(bench_suite.WORKLOADS))
+def test_workloads_run(name):
+    code = bench_suite.WORKLOADS[name](0.01)
+    phases = bench_suite.measure(code, 2)
+    assert list(phases) == list(bench_suite.PHASES)
+    for result in phases.values():
+        assert len(result['samples']) == 2
+        assert result['median'] <= result['p90'] <= max(result['samples'])
+        assert result['peak_bytes'] > 0
+
+def test_percentile():
+    assert bench_suite.percentile([3.0], 0.9) == 3.0
+    assert bench_suite.percentile([4.0, 1.0, 2.0, 3.0], 0.5) == 2.5
+    assert bench_suite.percentile(list(range(11)), 0.9) == 9.0
+
+def test_compare():
+    baseline = results(1.0, 1000)
+    assert bench_suite.compare(results(1.05, 1000), baseline, 0.10) == []
+    assert bench_suite.compare(results(1.5, 1200), baseline, 0.10) == [
+        "numeric parse median: 1 -> 1.5 (+50%)", "numeric parse peak_bytes: 1000 -> 1200 (+20%)"]
+    # Phases missing from the baseline are not compared
+    assert bench_suite.compare(results(1.5, 1200), {'workloads': {}}, 0.10) == []
+
+def test_baseline_regression_exits(monkeypatch, tmp_path, capsys):
+    saved = tmp_path / 'results.json'
+    monkeypatch.setattr(sys, 'argv', ['bench_suite.py', 'numeric', '--repeat', '1', '--scale', '0.01',
+                                      '--json', str(saved)])
+    bench_suite.main()
+    baseline = json.loads(saved.read_text())
+    assert set(baseline['workloads']) == {'numeric'}
+    for phase in baseline['workloads']['numeric'].values():
+        phase['median'] /= 100
+    saved.write_text(json.dumps(baseline))
+    monkeypatch.setattr(sys, 'argv', ['bench_suite.py', 'numeric', '--repeat', '1', '--scale', '0.01',
+                                      '--baseline', str(saved)])
+    with pytest.raises(SystemExit) as exit:
+        bench_suite.main()
+    assert exit.value.code == 1
+    assert "REGRESSION numeric tokenize median: " in capsys.readouterr().out
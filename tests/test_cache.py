@@ -0,0 +1,81 @@
+#Tests for the on-disk cache of parsed programs.
+import os
+
+import pytest
+
+import sigil
+
+CODE = 'x = [1, "a"]\nwhile (len(x) < 3) { x.append(true) }\nprint x'
+
+@pytest.fixture(autouse=True)
+def cache_environment(monkeypatch, tmp_path):
+    # Never touch the real cache, whatever the environment says
+    monkeypatch.delenv('SIGIL_CACHE_DIR', raising=False)
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'xdg'))
+    monkeypatch.setenv('HOME', str(tmp_path / 'home'))
+
+def no_parse(tokens):
+    raise AssertionError("parsed instead of using the cache")
+
+def test_hit(tmp_path, monkeypatch):
+    ast = sigil.parse_cached(CODE, str(tmp_path))
+    assert os.path.exists(sigil.cache_path(CODE, str(tmp_path)))
+    monkeypatch.setattr(sigil, 'parse', no_parse)
+    assert sigil.parse_cached(CODE, str(tmp_path)) == ast
+
+def test_misses(tmp_path, monkeypatch):
+    sigil.parse_cached(CODE, str(tmp_path))
+    # Different source text
+    assert sigil.load_cached_program(CODE + '\n', str(tmp_path)) is None
+    # A corrupt file
+    with open(sigil.cache_path(CODE, str(tmp_path)), 'r+b') as file:
+        file.truncate(len(sigil.CACHE_MAGIC) + len(sigil.interpreter_fingerprint()) + 3)
+    assert sigil.load_cached_program(CODE, str(tmp_path)) is None
+    assert sigil.parse_cached(CODE, str(tmp_path)) == sigil.parse(sigil.tokenize(CODE))
+    # Another interpreter version
+    monkeypatch.setattr(sigil, 'interpreter_fingerprint', lambda: 'other')
+    assert sigil.load_cached_program(CODE, str(tmp_path)) is None
+
+def test_default_directory(tmp_path, monkeypatch):
+    assert sigil.default_cache_dir() == str(tmp_path / 'xdg' / 'sigil')
+    # XDG_CACHE_HOME must be absolute to count
+    monkeypatch.setenv('XDG_CACHE_HOME', 'relative')
+    assert sigil.default_cache_dir() == str(tmp_path / 'home' / '.cache' / 'sigil')
+    monkeypatch.delenv('XDG_CACHE_HOME')
+    assert sigil.default_cache_dir() == str(tmp_path / 'home' / '.cache' / 'sigil')
+    monkeypatch.setenv('SIGIL_CACHE_DIR', str(tmp_path / 'own'))
+    assert sigil.default_cache_dir() == str(tmp_path / 'own')
+
+def test_no_home_directory(tmp_path, monkeypatch):
+    # Without a home directory nothing is written, not even below the
+    # current directory
+    monkeypatch.delenv('XDG_CACHE_HOME')
+    monkeypatch.setattr(os.path, 'expanduser', lambda path: path)
+    monkeypatch.chdir(tmp_path)
+    assert sigil.default_cache_dir() is None
+    assert sigil.parse_cached(CODE) == sigil.parse(sigil.tokenize(CODE))
+    assert os.listdir(tmp_path) == []
+
+@pytest.mark.parametrize('subdirectory', ['', 'sub'])
+def test_unwritable_directory(tmp_path, subdirectory):
+    # A cache directory that is a file, or lies below one, cannot be made
+    # or written, whoever runs the tests
+    blocker = tmp_path / 'file'
+    blocker.write_text('not a directory')
+    cache_dir = str(blocker / subdirectory) if subdirectory else str(blocker)
+    assert sigil.parse_cached(CODE, cache_dir) == sigil.parse(sigil.tokenize(CODE))
+    assert sigil.load_cached_program(CODE, cache_dir) is None
+    assert os.listdir(tmp_path) == ['file']
+
+def test_process_file(tmp_path, capsys):
+    program = tmp_path / 'program.txt'
+    program.write_text(CODE)
+    blocker = tmp_path / 'file'
+    blocker.write_text('')
+    sigil.process_file(str(program), cache_dir=str(blocker))
+    assert capsys.readouterr().out == "[1.0, 'a', True]\nProgram executed successfully.\n"
+    # Without the cache nothing is written to the default directory
+    sigil.process_file(str(program), cache=False)
+    assert not (tmp_path / 'xdg').exists()
+    sigil.process_file(str(program))
+    assert len(os.listdir(tmp_path / 'xdg' / 'sigil')) == 1
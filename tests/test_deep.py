@@ -0,0 +1,75 @@
+#Tests for expressions nested far deeper than Python's recursion limit.
+import sys
+
+import pytest
+
+import sigil
+
+BACKENDS = ['tree'] + sorted(sigil.BACKENDS)
+
+# Well past the recursion limit, so any recursion per level fails
+DEPTH = sys.getrecursionlimit() * 5
+
+DEEP_PROGRAM = ("x = 1\n"
+                "print " + " + ".join(["x"] * DEPTH) + "\n"
+                "print " + "-" * DEPTH + "x\n"
+                "print " + "(" * DEPTH + "x" + ")" * DEPTH + "\n"
+                "l = " + "[" * DEPTH + "2" + "]" * DEPTH + "\n"
+                "print len(l)\n"
+                "print l" + "[0]" * DEPTH + "\n"
+                "print " + "!" * DEPTH + "true\n")
+
+DEEP_OUTPUT = f"{float(DEPTH)}\n{(-1.0) ** DEPTH}\n1.0\n1.0\n2.0\n{DEPTH % 2 == 0}\n"
+
+@pytest.fixture(scope='module')
+def deep_ast():
+    return sigil.parse(sigil.tokenize(DEEP_PROGRAM))
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('optimize', [False, True], ids=['plain', 'folded'])
+def test_deep_expression_runs(capsys, backend, optimize):
+    ast = sigil.parse(sigil.tokenize(DEEP_PROGRAM))
+    if optimize:
+        ast = sigil.fold_constants(ast)
+    sigil.interpret(ast, backend=backend)
+    assert capsys.readouterr().out == DEEP_OUTPUT
+
+@pytest.mark.parametrize('index', [1, 2, 3, 4, 6, 7])
+def test_deep_expression_formats(deep_ast, index):
+    expression = deep_ast.body[index]['expression'] if index != 4 else deep_ast.body[index]['value']
+    text = sigil.format_expression(expression)
+    assert sigil.parse(sigil.tokenize("print " + text + "\n")).body[0].expression == expression
+
+def test_deep_expression_round_trips(deep_ast):
+    data = deep_ast.to_dict()
+    rebuilt = sigil.node_from_dict(data)
+    assert rebuilt == deep_ast
+    assert rebuilt == data
+    assert deep_ast == rebuilt.to_dict()
+    assert repr(rebuilt) == repr(deep_ast)
+
+def test_deep_expressions_differ(deep_ast):
+    other = sigil.parse(sigil.tokenize(DEEP_PROGRAM.replace("x\n", "y\n", 1)))
+    assert other != deep_ast
+    assert other != deep_ast.to_dict()
+
+def test_repr_matches_dict():
+    ast = sigil.parse(sigil.tokenize('if (x < [1, "a"][0]) { print -x }\n'))
+    assert repr(ast) == repr(ast.to_dict())
+    assert ast == ast.to_dict()
+    assert ast != dict(ast.to_dict(), line=1)
+
+def test_marking_is_its_own_pass():
+    # Type inference leaves the operators alone; the tree-walker's own pass
+    # switches those below RECURSION_DEPTH
+    def classes(ast):
+        found, stack = set(), [ast]
+        while stack:
+            node = stack.pop()
+            found.add(type(node))
+            stack.extend(sigil.child_nodes(node))
+        return found
+    ast = sigil.infer_types(sigil.parse(sigil.tokenize(DEEP_PROGRAM)))
+    assert not classes(ast) & set(sigil.DEEP_CLASSES.values())
+    assert sigil.mark_deep_expressions(ast) is ast
+    assert {sigil.DeepBinary, sigil.DeepUnary, sigil.DeepListLiteral, sigil.DeepListAccess} <= classes(ast)
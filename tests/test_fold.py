@@ -0,0 +1,83 @@
+#Tests for constant folding and dead-branch elimination.
+import pytest
+
+import sigil
+
+def folded(code):
+    #Return the folded program of some source code.
+    return sigil.fold_constants(sigil.parse(sigil.tokenize(code)))
+
+def folded_value(code):
+    #Return the folded right-hand side of a one-line assignment, formatted.
+    return sigil.format_expression(folded(code).body[0].value)
+
+@pytest.mark.parametrize('code, expected', [
+    ('x = 1 + 2 * 3', '7'),
+    ('x = "a" + "b" + 1', '"ab1.0"'),
+    ('x = !(1 < 2) or false', 'false'),
+    ('x = 1 == "1"', 'false'),
+    ('x = -(2)', '-2'),
+    ('x = [1, 2][1]', '2'),
+    ('x = len("abc") + len([1, y])', '3 + len([1, y])'),
+    ('x = 1 + 2 + y', '3 + y'),
+    ('x = y + 1 + 2', '(y + 1) + 2'),
+    ('x = input("a" + "b")', 'input("ab")'),
+])
+def test_folds(code, expected):
+    assert folded_value(code) == expected
+
+@pytest.mark.parametrize('code', [
+    'x = "a" - 1',
+    'x = 1 / 0',
+    'x = 0 / 0',
+    'x = [1, 2][5]',
+    'x = true and 1',
+    'x = -"a"',
+    'x = len(5)',
+])
+def test_errors_left_for_run_time(code):
+    # Expressions that raise are kept, so the error happens when they run
+    ast = sigil.parse(sigil.tokenize(code))
+    assert folded(code) == ast
+    with pytest.raises(Exception) as folded_error:
+        sigil.interpret(folded(code))
+    with pytest.raises(Exception) as error:
+        sigil.interpret(ast)
+    assert (type(folded_error.value), str(folded_error.value)) == (type(error.value), str(error.value))
+
+def test_dead_branches():
+    ast = folded('x = 1\nif (true) {\n  y = 2\n} else { z = 3 }\nwhile (false) { w = 4 }\n'
+                 'if (1 > 2) { w = 5 }\nprint x\n')
+    assert ast == {'type': 'program', 'body': [
+        {'type': 'assignment', 'name': 'x', 'value': {'type': 'number', 'value': 1.0}},
+        {'type': 'assignment', 'name': 'y', 'value': {'type': 'number', 'value': 2.0}},
+        {'type': 'print', 'expression': {'type': 'variable', 'name': 'x'}}]}
+    # Spliced statements keep their own lines
+    assert [statement.line for statement in ast.body] == [1, 3, 7]
+
+@pytest.mark.parametrize('code', [
+    'x = 1\nif (false) { x = 2 }',
+    'x = 1\nwhile (false) { x = 2 }',
+    'x = 1\nif (true) { }',
+])
+def test_removed_last_statement_keeps_result(code):
+    # A block ending in a removed statement still produces None
+    assert sigil.interpret(folded(code))[0] is None
+    assert sigil.interpret(sigil.parse(sigil.tokenize(code)))[0] is None
+
+def test_non_boolean_condition_kept():
+    code = 'if (1) { x = 2 }'
+    assert folded(code) == sigil.parse(sigil.tokenize(code))
+    with pytest.raises(TypeError, match="Condition must be a boolean expression"):
+        sigil.interpret(folded(code))
+
+def test_report(capsys):
+    ast = sigil.parse(sigil.tokenize('x = 1 + 2\nif (false) { y = 1 }\nprint x'))
+    report = []
+
+    class Report:
+        def write(self, text):
+            report.append(text)
+
+    sigil.optimize_program(ast, Report())
+    assert "".join(report) == "Nodes: 11 before folding, 5 after (6 removed)\n"
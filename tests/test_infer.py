@@ -0,0 +1,87 @@
+#Tests for type inference and the operator table it draws on.
+import pytest
+
+import sigil
+
+def inferred(code):
+    #Return the class names of the nodes of an inferred program, in source
+    #order.
+    names = []
+    stack = [sigil.infer_types(sigil.parse(sigil.tokenize(code)))]
+    while stack:
+        node = stack.pop()
+        names.append(type(node).__name__)
+        stack.extend(reversed(sigil.child_nodes(node)))
+    return names
+
+@pytest.mark.parametrize('code, expected', [
+    ('x = 1\ny = x + 2', ['Program', 'Assignment', 'Number',
+                          'Assignment', 'UncheckedBinary', 'UncheckedVariable', 'Number']),
+    ('x = true and false', ['Program', 'Assignment', 'UncheckedBinary', 'Boolean', 'Boolean']),
+    ('l = [1]\ny = len(l)', ['Program', 'Assignment', 'ListLiteral', 'Number',
+                             'Assignment', 'UncheckedLen', 'UncheckedVariable']),
+    ('b = !true', ['Program', 'Assignment', 'UncheckedUnary', 'Boolean']),
+    ('i = 0\nwhile (i < 3) { i = i + 1 }',
+     ['Program', 'Assignment', 'Number',
+      'UncheckedWhile', 'UncheckedBinary', 'UncheckedVariable', 'Number',
+      'Assignment', 'UncheckedBinary', 'UncheckedVariable', 'Number']),
+    # Both branches assign a number
+    ('x = 1\nif (c) { x = 2 } else { x = 3 }\ny = x * 2',
+     ['Program', 'Assignment', 'Number', 'If', 'Variable', 'Assignment', 'Number', 'Assignment', 'Number',
+      'Assignment', 'UncheckedBinary', 'UncheckedVariable', 'Number']),
+])
+def test_proven_nodes_are_unchecked(code, expected):
+    assert inferred(code) == expected
+
+@pytest.mark.parametrize('code, expected', [
+    # One branch may change the type
+    ('x = 1\nif (c) { x = "a" }\ny = x - 2',
+     ['Program', 'Assignment', 'Number', 'If', 'Variable', 'Assignment', 'String',
+      'Assignment', 'Binary', 'UncheckedVariable', 'Number']),
+    # So may a loop body, which may not run at all
+    ('x = 1\nwhile (c) { x = "s" }\ny = x - 1',
+     ['Program', 'Assignment', 'Number', 'While', 'Variable', 'Assignment', 'String',
+      'Assignment', 'Binary', 'UncheckedVariable', 'Number']),
+    # Unknown variables keep every check
+    ('y = -x', ['Program', 'Assignment', 'Unary', 'Variable']),
+    ('if (false) { y = 1 }\nz = y', ['Program', 'UncheckedIf', 'Boolean', 'Assignment', 'Number',
+                                     'Assignment', 'Variable']),
+    # Operands of the wrong type must still raise
+    ('x = "a"\ny = x - 1', ['Program', 'Assignment', 'String', 'Assignment', 'Binary',
+                            'UncheckedVariable', 'Number']),
+])
+def test_unproven_nodes_keep_checks(code, expected):
+    assert inferred(code) == expected
+
+def test_string_appends():
+    assert inferred('s = "a"\ns = s + 1') == ['Program', 'Assignment', 'String',
+                                             'StringAppend', 'Binary', 'BuilderVariable', 'Number']
+    # A number accumulator is not a string append
+    assert inferred('y = 1\ny = y + 1')[3] == 'Assignment'
+
+@pytest.mark.parametrize('code, output', [
+    ('x = 1\nif (c) { x = "a" }\nprint x - 2', "ValueError: Undefined variable: c"),
+    ('c = true\nx = 1\nif (c) { x = "a" }\nprint x - 2', "TypeError: Cannot subtract boolean, string, or list values"),
+    ('c = false\nx = 1\nif (c) { x = "a" }\nprint x - 2', "-1.0\n"),
+    ('x = 1\nwhile (x < 3) { x = x + 1 }\nprint x == 3 and x != "3"', "True\n"),
+    ('print [1] + [2] == [1, 2]', "True\n"),
+])
+def test_inferred_programs_run(run, code, output):
+    try:
+        printed = run(code)
+    except Exception as e:
+        printed = f"{type(e).__name__}: {e}"
+    assert printed == output
+
+def test_operator_tables_agree():
+    assert set(sigil.BINARY_OPERATIONS) == set(sigil.OPERATORS) == set(sigil.BINARY_OPERATORS)
+    assert set(sigil.NUMERIC_OPERATIONS) == set(sigil.ARITHMETIC_OPCODES)
+    assert set(sigil.NUMERIC_OPERATIONS) | set(sigil.BYTECODE_BINARY) == set(sigil.OPERATORS)
+    for op, (checked, unchecked, types) in sigil.OPERATORS.items():
+        # Wherever the unchecked function may be used, it agrees with the
+        # checked one
+        samples = {float: (3.0, 2.0), bool: (True, False), str: ("a", "b"), list: ([1.0], [2.0])}
+        for value_type in types:
+            left, right = samples[value_type]
+            assert unchecked(left, right) == checked(left, right)
+            assert type(unchecked(left, right)) is type(checked(left, right))
@@ -0,0 +1,96 @@
+#Tests for the interpret() embedding API and the quickening of tree nodes.
+import io
+import sys
+
+import pytest
+
+import sigil
+
+def parse(code):
+    return sigil.parse(sigil.tokenize(code))
+
+def test_caller_variables_dict_is_updated_in_place():
+    variables = {'a': 1.0}
+    environment = {'variables': variables, 'output': []}
+    sigil.interpret(parse('b = a + 1\ns = "x"\ns = s + "y"'), environment, output='discard')
+    assert environment['variables'] is variables
+    assert variables == {'a': 1.0, 'b': 2.0, 's': 'xy'}
+
+def test_caller_variables_dict_is_updated_when_the_run_fails():
+    variables = {}
+    with pytest.raises(TypeError):
+        sigil.interpret(parse('c = 5\nd = c + true'), {'variables': variables, 'output': []}, output='discard')
+    assert variables == {'c': 5.0}
+
+def test_variable_slots_are_kept():
+    slots = sigil.VariableSlots({'a': 2.0})
+    environment = {'variables': slots, 'output': []}
+    sigil.interpret(parse('a = a * 3'), environment, output='discard')
+    assert environment['variables'] is slots
+    assert dict(slots) == {'a': 6.0}
+
+# Operand types change from numbers to strings and back every ten iterations
+SWITCHING = ('l = [1, "a"]\ni = 0\nj = 0\nwhile (i < 300) {\n  x = l[0] + l[0]\n  j = j + 1\n'
+             '  if (j == 10) {\n    j = 0\n    l = [l[1], l[0]]\n  }\n  i = i + 1\n}\n')
+
+def test_quickened_nodes_are_counted():
+    ast = parse('l = [1, 2]\ni = 0\nwhile (i < 20) {\n  x = l[0] * 2\n  i = i + 1\n}\n')
+    environment = {'variables': {}}
+    sigil.interpret(ast, environment, output='discard')
+    assert environment['quickening'] == {('specialized', 'QuickListAccess'): 1,
+                                         ('specialized', 'QuickNumberBinary'): 1}
+    assert type(ast.body[2].body[0].value).__name__ == 'QuickNumberBinary'
+
+def test_failed_guards_deoptimize():
+    # After QUICKEN_MAX_DEOPTS failed guards a node stays generic
+    environment = {'variables': {}}
+    sigil.interpret(parse(SWITCHING), environment, output='discard')
+    stats = environment['quickening']
+    assert stats['deoptimized', 'QuickNumberBinary'] + stats['deoptimized', 'QuickStringBinary'] == \
+        sigil.QUICKEN_MAX_DEOPTS
+    assert environment['variables']['x'] in (2.0, "aa")
+
+def test_report_quickening():
+    environment = {'variables': {}}
+    sigil.interpret(parse(SWITCHING), environment, output='discard')
+    report = io.StringIO()
+    sigil.report_quickening(environment, report)
+    assert report.getvalue().splitlines() == [
+        "Quickening: QuickListAccess specialized 4 times, deoptimized 0 times",
+        "Quickening: QuickNumberBinary specialized 2 times, deoptimized 2 times",
+        "Quickening: QuickStringBinary specialized 2 times, deoptimized 2 times"]
+    report = io.StringIO()
+    sigil.report_quickening({'variables': {}}, report)
+    assert report.getvalue() == "Quickening: no nodes were specialized\n"
+
+def test_show_quickening(monkeypatch, tmp_path, capsys):
+    program = tmp_path / 'program.txt'
+    program.write_text(SWITCHING)
+    monkeypatch.setattr(sys, 'argv', ['sigil.py', str(program), '--no-cache', '--show-quickening'])
+    sigil.main()
+    captured = capsys.readouterr()
+    assert captured.out == "Program executed successfully.\n"
+    assert "Quickening: QuickNumberBinary specialized 2 times, deoptimized 2 times\n" in captured.err
+
+# Reads of s in the middle of the appends, and a change of type at the end
+APPENDS = ('s = "<"\ni = 0\nwhile (i < 5) {\n  s = s + i + ","\n  if (len(s) > 12) { print s }\n'
+           '  i = i + 1\n}\nt = s\ns = s + ">"\nprint t == s\nprint s\ns = 1\ns = s + 1\nprint s\n')
+
+@pytest.mark.parametrize('builders', [True, False], ids=['builders', 'copies'])
+def test_string_appends_match_copies(run, monkeypatch, builders):
+    monkeypatch.setattr(sigil, 'STRING_BUILDERS', builders)
+    assert run(APPENDS) == ("<0.0,1.0,2.0,\n<0.0,1.0,2.0,3.0,\n<0.0,1.0,2.0,3.0,4.0,\n"
+                            "False\n<0.0,1.0,2.0,3.0,4.0,>\n2.0\n")
+
+def test_string_builders_stay_inside_the_run():
+    environment = {'variables': {}}
+    sigil.interpret(parse('s = ""\ni = 0\nwhile (i < 3) {\n  s = s + "ab"\n  i = i + 1\n}\n'),
+                    environment, output='discard')
+    assert type(environment['variables']['s']) is str
+    assert environment['variables']['s'] == "ababab"
+
+def test_string_builder_joins_once():
+    builder = sigil.StringBuilder("a")
+    builder.parts += ["b", "c"]
+    assert builder.build() == "abc"
+    assert builder.parts == ["abc"]
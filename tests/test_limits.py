@@ -0,0 +1,103 @@
+#Tests for execution limits on the backends that support them.
+import pytest
+
+import sigil
+
+LIMITED_BACKENDS = ['tree', 'bytecode']
+
+@pytest.fixture(params=[False, True], ids=['untraced', 'traced'])
+def tracing(request, monkeypatch):
+    #Run each test with the loop tracer off, and again tracing every loop
+    #after its first iteration.
+    if request.param:
+        monkeypatch.setattr(sigil, 'TRACE_THRESHOLD', 1)
+    else:
+        monkeypatch.setattr(sigil, 'TRACE_THRESHOLD', 10**9)
+    return request.param
+
+@pytest.mark.parametrize('backend', LIMITED_BACKENDS)
+def test_step_limit(run, backend, tracing):
+    code = "i = 0\nwhile (true) {\n  i = i + 1\n}\n"
+    with pytest.raises(sigil.StepLimitError):
+        run(code, backend, limits=sigil.Limits(max_steps=1000))
+
+@pytest.mark.parametrize('backend', LIMITED_BACKENDS)
+def test_steps_match_tree(backend, tracing):
+    code = "i = 0\nwhile (i < 50) {\n  i = i + 1\n}\n"
+    environment = {'variables': {}}
+    sigil.interpret(sigil.parse(sigil.tokenize(code)), environment, backend=backend,
+                    limits=sigil.Limits(max_steps=10**6))
+    assert environment['steps'] == 103
+
+@pytest.mark.parametrize('backend', LIMITED_BACKENDS)
+@pytest.mark.parametrize('max_steps', [21, 150000])
+@pytest.mark.parametrize('body', ['i = i + 1', 'i = i + 1\n  j = i\n  k = j'], ids=['short', 'long'])
+def test_steps_after_step_limit(backend, tracing, max_steps, body):
+    # The count is that of the steps taken: compiled loops stop before a
+    # body that would pass the limit, the others after the step that does
+    code = f"i = 0\nwhile (true) {{\n  {body}\n}}\n"
+    environment = {'variables': {}}
+    with pytest.raises(sigil.StepLimitError):
+        sigil.interpret(sigil.parse(sigil.tokenize(code)), environment, backend=backend,
+                        limits=sigil.Limits(max_steps=max_steps))
+    statements = body.count('\n') + 1
+    assert max_steps - statements <= environment['steps'] <= max_steps + 1
+
+@pytest.mark.parametrize('backend', LIMITED_BACKENDS)
+@pytest.mark.parametrize('code', [
+    's = ""\nwhile (true) {\n  s = s + "ab"\n}\n',
+    'l = []\nwhile (true) {\n  l.append(1)\n}\n',
+    'l = []\nwhile (true) {\n  l = l + [1, 2]\n}\n',
+], ids=['string', 'append', 'concatenate'])
+def test_size_limit_flat(run, backend, tracing, code):
+    with pytest.raises(sigil.SizeLimitError):
+        run(code, backend, limits=sigil.Limits(max_size=100, max_steps=10**6))
+
+@pytest.mark.parametrize('backend', LIMITED_BACKENDS)
+@pytest.mark.parametrize('code', [
+    'a = []\nwhile (true) {\n  a = [a, a + [1]]\n}\n',
+    'a = []\nwhile (true) {\n  a = [a]\n}\n',
+    'a = ["ab"]\nwhile (true) {\n  a = [a[0] + a[0]]\n}\n',
+    'a = []\nb = []\nwhile (true) {\n  b.append(a)\n  a = [b, 1]\n}\n',
+    'a = [[1]]\nwhile (true) {\n  a[0] = [a[0], a[0] + [1]]\n}\n',
+    'l = []\ni = 0\nwhile (true) {\n  l.append("ab" + i)\n  i = i + 1\n}\n',
+], ids=['doubling', 'chain', 'nested-string', 'append', 'index-set', 'append-strings'])
+def test_size_limit_nested(run, backend, tracing, code):
+    with pytest.raises(sigil.SizeLimitError):
+        run(code, backend, limits=sigil.Limits(max_size=100, max_steps=10**6))
+
+@pytest.mark.parametrize('backend', LIMITED_BACKENDS)
+def test_appended_list_measured_whole(run, backend, tracing):
+    # Strings "0.0" to "49.0": the appends stop the loop, not the alias
+    # after it
+    code = 'l = []\ni = 0\nwhile (i < 50) {\n  l.append(i + "")\n  i = i + 1\n}\nprint "ok"\nm = l\n'
+    with pytest.raises(sigil.SizeLimitError) as error:
+        run(code, backend, limits=sigil.Limits(max_size=100))
+    assert str(error.value) == "Size limit exceeded: a value of size 102 is larger than 100"
+
+@pytest.mark.parametrize('backend', LIMITED_BACKENDS)
+def test_shared_values_counted_once(run, backend, tracing):
+    # Ten references to one 50-element list: 10 + 50 elements, not 10 * 50
+    code = ("row = []\ni = 0\nwhile (i < 50) {\n  row.append(i)\n  i = i + 1\n}\n"
+            "rows = []\ni = 0\nwhile (i < 10) {\n  rows.append(row)\n  i = i + 1\n}\n"
+            "print len(rows)\n")
+    assert run(code, backend, limits=sigil.Limits(max_size=100)) == "10.0\n"
+
+@pytest.mark.parametrize('backend', LIMITED_BACKENDS)
+def test_self_reference_within_limit(run, backend, tracing):
+    code = "l = [1]\nl.append(l)\nx = [l, l]\nprint len(x)\n"
+    assert run(code, backend, limits=sigil.Limits(max_size=10)) == "2.0\n"
+
+def test_value_size():
+    inner = [1.0, "abc"]
+    assert sigil._value_size("abcd", 100) == 4
+    assert sigil._value_size(1.0, 100) == 0
+    assert sigil._value_size([inner, inner], 100) == 2 + 2 + 3
+    # Counting stops once the size passes the limit
+    assert sigil._value_size([[1.0] * 50] * 3, 10) == 53
+
+@pytest.mark.parametrize('backend', ['closure', 'python'])
+def test_unsupported_backends_reject_limits(backend):
+    with pytest.raises(ValueError):
+        sigil.interpret(sigil.parse(sigil.tokenize("x = 1\n")), backend=backend,
+                        limits=sigil.Limits(max_size=10))
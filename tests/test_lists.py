@@ -0,0 +1,34 @@
+#Tests for Sigil lists and their NumberList storage.
+import pytest
+
+import sigil
+
+BACKENDS = ['tree'] + sorted(sigil.BACKENDS)
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_self_append_prints_ellipsis(run, backend):
+    code = 'l = [1, 2, 3]\nl.append(l)\nprint l\nprint "a" + l\nprint l + "b"\n'
+    assert run(code, backend) == (
+        "[1.0, 2.0, 3.0, [...]]\n"
+        "a[1.0, 2.0, 3.0, [1.0, 2.0, 3.0, [...]]]\n"
+        "[1.0, 2.0, 3.0, [1.0, 2.0, 3.0, [...]]]b\n")
+
+def test_number_list_repr():
+    numbers = sigil.NumberList()
+    numbers.append(1.0)
+    assert repr(numbers) == "[1.0]"
+    numbers.append(numbers)
+    assert repr(numbers) == "[1.0, [...]]"
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_captured_lists_are_plain(backend, capsys):
+    code = 'l = [1, 2]\nprint l\nprint [l, ["a"]]\nl.append(3)\nm = [1]\nm.append(m)\nprint m\n'
+    environment = {'variables': {}, 'output': []}
+    sigil.interpret(sigil.parse(sigil.tokenize(code)), environment, backend)
+    first, nested, cyclic = environment['output']
+    assert type(first) is list and first == [1.0, 2.0]
+    assert type(nested[0]) is list and nested == [[1.0, 2.0], ['a']]
+    assert type(cyclic) is list and cyclic[1] is cyclic
+    ring = sigil.RingBufferSink()
+    sigil.interpret(sigil.parse(sigil.tokenize(code)), {'variables': {}}, backend, output=ring)
+    assert type(ring.values[0]) is list
@@ -0,0 +1,80 @@
+#Tests for the profiler and the --profile and --profile-output options.
+import io
+import json
+import sys
+
+import pytest
+
+import sigil
+
+CODE = 'i = 0\nwhile (i < 3) {\n  i = i + 1\n}\nprint i\n'
+
+def profile(code):
+    profiler = sigil.Profile()
+    try:
+        sigil.interpret(sigil.parse(sigil.tokenize(code)), output='discard', profile=profiler)
+    except ZeroDivisionError:
+        pass
+    return profiler.to_dict()
+
+def main(monkeypatch, *arguments):
+    monkeypatch.setattr(sys, 'argv', ['sigil.py', *arguments])
+    sigil.main()
+
+def test_line_hits():
+    # Statements run on each line; the loop's condition runs once more
+    # than its body
+    data = profile(CODE)
+    assert {entry['line']: entry['hits'] for entry in data['lines']} == {1: 1, 2: 1, 3: 3, 5: 1}
+    calls = {(entry['line'], entry['source']): entry['calls'] for entry in data['nodes']}
+    assert calls[2, 'i < 3'] == 4
+    assert calls[3, 'i = i + 1'] == 3
+    assert calls[None, 'program'] == 1
+
+def test_times_add_up():
+    data = profile(CODE)
+    for entries in (data['lines'], data['nodes']):
+        assert [entry['self'] for entry in entries] == sorted((entry['self'] for entry in entries), reverse=True)
+        assert all(0 <= entry['self'] <= entry['total'] for entry in entries)
+    program = next(entry for entry in data['nodes'] if entry['type'] == 'program')
+    assert sum(entry['self'] for entry in data['nodes']) == pytest.approx(program['total'])
+
+def test_failed_run_is_profiled():
+    data = profile('x = 0\nprint 1 / x\n')
+    assert {entry['line']: entry['hits'] for entry in data['lines']} == {1: 1, 2: 1}
+
+@pytest.mark.parametrize('code, description', [
+    ('l[i + 1] = [1.5, "a"]', 'l[i + 1] = [1.5, "a"]'),
+    ('while (!done) { }', 'while (!done)'),
+    ('l.append(len(s))', 'l.append(len(s))'),
+    ('print input("> ")', 'print input("> ")'),
+])
+def test_describe_node(code, description):
+    assert sigil.describe_node(sigil.parse(sigil.tokenize(code)).body[0]) == description
+
+def test_report_profile():
+    profiler = sigil.Profile()
+    sigil.interpret(sigil.parse(sigil.tokenize(CODE)), output='discard', profile=profiler)
+    report = io.StringIO()
+    sigil.report_profile(profiler, report, CODE, limit=2)
+    lines = report.getvalue().splitlines()
+    assert lines[0].split() == ['line', 'hits', 'self', 'ms', 'total', 'ms', 'self', '%', 'source']
+    assert lines[3] == ""
+    assert lines[4].split() == ['line', 'calls', 'self', 'ms', 'total', 'ms', 'node']
+    assert len(lines) == 7
+
+def test_profile_options(monkeypatch, tmp_path, capsys):
+    program = tmp_path / 'program.txt'
+    program.write_text(CODE)
+    main(monkeypatch, str(program), '--no-cache', '--profile', '--profile-output', str(tmp_path / 'profile.json'))
+    captured = capsys.readouterr()
+    assert captured.out == "3.0\nProgram executed successfully.\n"
+    assert "i = i + 1" in captured.err
+    data = json.loads((tmp_path / 'profile.json').read_text())
+    assert {entry['line']: entry['hits'] for entry in data['lines']} == {1: 1, 2: 1, 3: 3, 5: 1}
+
+def test_profile_needs_tree_backend(monkeypatch, capsys):
+    with pytest.raises(SystemExit) as exit:
+        main(monkeypatch, 'program.txt', '--backend', 'closure', '--profile')
+    assert exit.value.code == 2
+    assert "--profile and --profile-output need the tree backend" in capsys.readouterr().err
@@ -0,0 +1,69 @@
+#Tests for compiled programs run many times with run_program().
+import pytest
+
+import sigil
+
+BACKENDS = ['tree'] + sorted(sigil.BACKENDS)
+
+LOOP = 'i = 0\nt = 0\nwhile (i < n) {\n  t = t + i\n  i = i + 1\n}\nprint t\n'
+
+def counting(monkeypatch, name):
+    #Count the calls of a sigil function.
+    calls = []
+    function = getattr(sigil, name)
+
+    def counted(*arguments):
+        calls.append(arguments)
+        return function(*arguments)
+    monkeypatch.setattr(sigil, name, counted)
+    return calls
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_runs_are_independent(run, backend):
+    program = sigil.CompiledProgram(LOOP)
+    for n in (3.0, 5.0, 3.0):
+        result, environment = program.run({'n': n}, backend, output='discard')
+        assert dict(environment['variables']) == {'n': n, 'i': n, 't': n * (n - 1) / 2}
+
+@pytest.mark.parametrize('backend, compiler', [
+    ('closure', 'compile_closures'), ('python', 'compile_python'), ('bytecode', 'compile_bytecode')])
+def test_backends_compile_once(monkeypatch, backend, compiler):
+    calls = counting(monkeypatch, compiler)
+    program = sigil.CompiledProgram(LOOP)
+    for n in range(5):
+        program.run({'n': float(n)}, backend, output='discard')
+    assert len(calls) == 1
+
+def test_bytecode_compiled_per_limits(monkeypatch):
+    calls = counting(monkeypatch, 'compile_bytecode')
+    program = sigil.CompiledProgram(LOOP)
+    for limits in [None, sigil.Limits(max_steps=100), sigil.Limits(max_size=10), None,
+                   sigil.Limits(timeout=5), sigil.Limits(max_steps=500, max_size=100)]:
+        program.run({'n': 3.0}, 'bytecode', output='discard', limits=limits)
+    assert len(calls) == 3
+    with pytest.raises(sigil.StepLimitError):
+        program.run({'n': 100.0}, 'bytecode', output='discard', limits=sigil.Limits(max_steps=20))
+
+def test_hot_loops_compiled_once(monkeypatch):
+    monkeypatch.setattr(sigil, 'TRACE_THRESHOLD', 5)
+    calls = counting(monkeypatch, 'compile_loop')
+    program = sigil.CompiledProgram(LOOP)
+    for n in range(20, 25):
+        result, environment = program.run({'n': float(n)}, output='discard')
+        assert environment['variables']['t'] == n * (n - 1) / 2
+    assert len(calls) == 1
+    # Loops compiled under a size limit check sizes; the others do not
+    program.run({'n': 20.0}, output='discard', limits=sigil.Limits(max_size=10))
+    assert len(calls) == 2
+
+def test_unknown_backend():
+    with pytest.raises(ValueError, match="Unknown backend: bogus"):
+        sigil.CompiledProgram(LOOP).run({'n': 1.0}, 'bogus')
+    with pytest.raises(ValueError):
+        sigil.CompiledProgram(LOOP).run({'n': 1.0}, 'closure', limits=sigil.Limits(max_steps=10))
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_variables_are_a_dict(backend):
+    result, environment = sigil.run_program('x = 1\nl = [x, "a"]', backend)
+    assert type(environment['variables']) is dict
+    assert environment['variables'] == {'x': 1.0, 'l': [1.0, 'a']}
@@ -0,0 +1,48 @@
+#Tests for interactive mode and the parser's support for it.
+import builtins
+
+import pytest
+
+import sigil
+
+def run_session(monkeypatch, capsys, lines):
+    #Feed lines to interactive_mode() and return what it printed after the banner.
+    feed = iter(lines + ['exit'])
+    monkeypatch.setattr(builtins, 'input', lambda prompt='': print(prompt, end='') or next(feed))
+    sigil.interactive_mode()
+    return capsys.readouterr().out.split("\n", 11)[-1]
+
+def test_blocks_span_lines(monkeypatch, capsys):
+    out = run_session(monkeypatch, capsys, ['i = 0', 'while (i < 2) {', '  print i', '  i = i + 1', '}',
+                                            'print (1', '+ 2)'])
+    assert out == "> Result: 0.0\n> ... ... ... 0.0\n1.0\nResult: 2.0\n> ... 3.0\n> "
+
+def test_syntax_error_in_open_bracket_is_reported_at_once(monkeypatch, capsys):
+    out = run_session(monkeypatch, capsys, ['print (1 +* 2', 'print 5'])
+    assert out == ("> Error: Line 1: Unexpected token: {'type': 'operator', 'value': '*', 'line': 1}\n"
+                   "> 5.0\n> ")
+
+def test_syntax_error_inside_block_is_reported_at_once(monkeypatch, capsys):
+    out = run_session(monkeypatch, capsys, ['while (false) {', '  x = )', 'print 7'])
+    assert out == ("> ... Error: Line 2: Unexpected token: {'type': 'punctuation', 'value': ')', 'line': 2}\n"
+                   "> 7.0\n> ")
+
+def test_missing_block_is_an_error(monkeypatch, capsys):
+    out = run_session(monkeypatch, capsys, ['if (true)'])
+    assert out == "> Error: Line end of file: Expected '{' to start block, got None\n> "
+
+def test_resumed_parse_matches_full_parse():
+    lines = ['x = [1,', '2]', 'while (x[0] < 3) {', '  if (true) {', '    x[0] = x[0] + 1', '  }',
+             '  x.append(len(x))', '}', 'print x']
+    tokens = sigil.TokenStream()
+    resume = {}
+    for number, line in enumerate(lines, 1):
+        tokens.extend(sigil.tokenize(line, number))
+        try:
+            ast = sigil.parse(tokens, resume)
+        except sigil.IncompleteInputError:
+            with pytest.raises(sigil.IncompleteInputError):
+                sigil.parse(tokens[:])
+        else:
+            assert ast == sigil.parse(tokens[:])
+            tokens, resume = sigil.TokenStream(), {}
@@ -0,0 +1,31 @@
+#Tests for REPL sessions served by ReplServer.
+import asyncio
+
+import sigil
+
+PROMPTS = (b"> ", b"... ")
+
+async def converse(server, path, lines):
+    #Run a session over a Unix socket and return everything the server sent.
+    listener = await asyncio.start_unix_server(server.session, path)
+    async with listener:
+        reader, writer = await asyncio.open_unix_connection(path)
+        received = b""
+        for line in lines + ['quit']:
+            while not received.endswith(PROMPTS):
+                received += await reader.read(4096)
+            writer.write(line.encode() + b"\n")
+            received += b"\n"
+        received += await reader.read()
+        writer.close()
+    return received.decode()
+
+def test_session_runs_blocks(tmp_path):
+    out = asyncio.run(converse(sigil.ReplServer(), str(tmp_path / 's.sock'),
+                               ['x = [1,', '2]', 'if (x[1] > 1) {', 'print x', '}']))
+    assert out == "> \n... \nResult: [1.0, 2.0]\n> \n... \n... \n[1.0, 2.0]\nResult: [1.0, 2.0]\n> \n"
+
+def test_session_reports_syntax_error_in_open_bracket(tmp_path):
+    out = asyncio.run(converse(sigil.ReplServer(), str(tmp_path / 's.sock'), ['print (1 +* 2', 'print 5']))
+    assert out == ("> \nError: Line 1: Unexpected token: {'type': 'operator', 'value': '*', 'line': 1}\n"
+                   "> \n5.0\n> \n")
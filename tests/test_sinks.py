@@ -0,0 +1,70 @@
+#Tests for the output sinks and the --output option.
+import sys
+
+import pytest
+
+import sigil
+
+CODE = 'l = [1]\nprint l\nl.append(2)\nprint "a"\n'
+
+def main(monkeypatch, *arguments):
+    monkeypatch.setattr(sys, 'argv', ['sigil.py', *arguments])
+    sigil.main()
+
+@pytest.mark.parametrize('spec, sink_type', [
+    ('capture', sigil.CaptureSink),
+    ('buffered', sigil.BufferedStdoutSink),
+    ('buffered:2', sigil.BufferedStdoutSink),
+    ('ring:3', sigil.RingBufferSink),
+    ('discard', sigil.DiscardSink),
+])
+def test_make_sink(spec, sink_type):
+    assert type(sigil.make_sink(spec)) is sink_type
+
+@pytest.mark.parametrize('spec', ['bogus', 'file', 'capture:1', 'ring:x'])
+def test_unknown_sink(spec):
+    with pytest.raises(ValueError):
+        sigil.make_sink(spec)
+
+def test_sinks_keep_printed_values(run):
+    # Lists are copied when printed, so later changes do not show
+    ring = sigil.RingBufferSink(1)
+    assert run(CODE, output=ring) == ""
+    assert list(ring.values) == ["a"]
+    capture = sigil.CaptureSink()
+    assert run(CODE, output=capture) == "[1.0]\na\n"
+    assert capture.values == [[1.0], "a"]
+
+def test_output_file(monkeypatch, tmp_path, capsys):
+    program = tmp_path / 'program.txt'
+    program.write_text(CODE)
+    main(monkeypatch, str(program), '--no-cache', '--output', f'file:{tmp_path / "out.txt"}')
+    assert (tmp_path / 'out.txt').read_text() == "[1.0]\na\n"
+    assert capsys.readouterr().out == "Program executed successfully.\n"
+
+def test_usage_error_opens_no_file(monkeypatch, tmp_path):
+    # The sink is made after the options are checked
+    with pytest.raises(SystemExit):
+        main(monkeypatch, 'program.txt', '--backend', 'bytecode', '--profile',
+             '--output', f'file:{tmp_path / "out.txt"}')
+    assert not (tmp_path / 'out.txt').exists()
+
+@pytest.mark.parametrize('spec', ['bogus', 'file:{tmp}/missing/out.txt'])
+def test_bad_output(monkeypatch, tmp_path, capsys, spec):
+    with pytest.raises(SystemExit) as exit:
+        main(monkeypatch, '--output', spec.format(tmp=tmp_path))
+    assert exit.value.code == 2
+    assert "argument --output: " in capsys.readouterr().err
+
+def test_batch_rejects_output(monkeypatch, tmp_path, capsys):
+    with pytest.raises(SystemExit) as exit:
+        main(monkeypatch, '--batch', str(tmp_path), '--output', 'capture')
+    assert exit.value.code == 2
+    assert "--batch-output, not --output" in capsys.readouterr().err
+
+def test_serve_rejects_output(monkeypatch, tmp_path, capsys):
+    with pytest.raises(SystemExit) as exit:
+        main(monkeypatch, '--serve', str(tmp_path / 'sigil.sock'), '--output', f'file:{tmp_path / "out.txt"}')
+    assert exit.value.code == 2
+    assert "do not also give --output" in capsys.readouterr().err
+    assert not (tmp_path / 'out.txt').exists()
@@ -0,0 +1,148 @@
+#Tests for the tokenizer, for operator precedence and for the messages of
+#syntax errors, which must stay those of the original character-at-a-time
+#tokenizer and parser.
+import pytest
+
+import sigil
+
+def tokens(code, line_num=1):
+    return [(token['type'], token['value'], token['line']) for token in sigil.tokenize(code, line_num)]
+
+def test_tokens():
+    assert tokens('x = 1.5 + "a\\n"\nprint x # comment\nwhile (true) { l[0] }') == [
+        ('identifier', 'x', 1), ('operator', '=', 1), ('number', 1.5, 1), ('operator', '+', 1),
+        ('string', 'a\n', 1),
+        ('keyword', 'print', 2), ('identifier', 'x', 2),
+        ('keyword', 'while', 3), ('punctuation', '(', 3), ('boolean', True, 3), ('punctuation', ')', 3),
+        ('punctuation', '{', 3), ('identifier', 'l', 3), ('punctuation', '[', 3), ('number', 0.0, 3),
+        ('punctuation', ']', 3), ('punctuation', '}', 3)]
+
+@pytest.mark.parametrize('code, expected', [
+    ('a<=b>=c==d!=e<f>g', ['a', '<=', 'b', '>=', 'c', '==', 'd', '!=', 'e', '<', 'f', '>', 'g']),
+    ('x = 1.2.3', ['x', '=', 1.2, 0.3]),
+    ('.5 + 1.', [0.5, '+', 1.0]),
+    ('printx = truely', ['printx', '=', 'truely']),
+    ('名前 = ٣', ['名前', '=', 3.0]),
+    ('x = "a\\"b\\\\c\\q"', ['x', '=', 'a"b\\c\\q']),
+    ('# only a comment', []),
+])
+def test_token_values(code, expected):
+    assert [value for token_type, value, line in tokens(code)] == expected
+
+def test_lines():
+    # A string spanning lines is given the line it ends on
+    assert [line for token_type, value, line in tokens('\t x\r\n= 1\n\n"a\nb" y')] == [1, 2, 2, 5, 5]
+    assert [line for token_type, value, line in tokens('x\ny', 10)] == [10, 11]
+
+@pytest.mark.parametrize('code, message', [
+    ('print 1 @ 2', "Line 1: Unrecognized character: @"),
+    ('x = 1 ; 2', "Line 1: Unrecognized character: ;"),
+    ('print "abc', "Line 1: Unterminated string literal"),
+    ('x = 1\n\ny = "a\nb', "Line 4: Unterminated string literal"),
+])
+def test_tokenize_errors(code, message):
+    with pytest.raises(ValueError) as error:
+        sigil.tokenize(code)
+    assert str(error.value) == message
+
+@pytest.mark.parametrize('code, message', [
+    ('print )', "Line 1: Unexpected token: {'type': 'punctuation', 'value': ')', 'line': 1}"),
+    ('if true { }', "Line 1: Expected '(' after 'if', got {'type': 'boolean', 'value': True, 'line': 1}"),
+    ('while (x) print 1',
+     "Line 1: Expected '{' to start block, got {'type': 'keyword', 'value': 'print', 'line': 1}"),
+    ('l.append 1', "Line 1: Expected '(' after append, got {'type': 'number', 'value': 1.0, 'line': 1}"),
+    ('l[0 = 1', "Line 1: Expected ']' after index, got {'type': 'operator', 'value': '=', 'line': 1}"),
+    ('print len 1', "Line 1: Expected '(' after 'len', got {'type': 'number', 'value': 1.0, 'line': 1}"),
+    ('x = 1\nelse { }', "Line 2: Unexpected token: {'type': 'keyword', 'value': 'else', 'line': 2}"),
+    ('x = = 1', "Line 1: Unexpected token: {'type': 'operator', 'value': '=', 'line': 1}"),
+    ('print (1 + 2', "Line end of file: Expected ')', got None"),
+    ('print [1, 2', "Line end of file: Expected ']' to close list literal, got None"),
+    ('if (true) { print 1', "Unexpected end of file, missing '}'"),
+    ('x = 1 +', "Unexpected end of file"),
+])
+def test_parse_errors(code, message):
+    with pytest.raises(ValueError) as error:
+        sigil.parse(sigil.tokenize(code))
+    assert str(error.value) == message
+
+def test_token_stream_matches_dicts():
+    stream = sigil.tokenize('x = [1, "a"]\nprint x')
+    dicts = list(stream)
+    assert stream == dicts
+    assert sigil.TokenStream.from_dicts(dicts) == stream
+    assert stream[2] == dicts[2]
+    assert list(stream[1:3]) == dicts[1:3]
+    assert sigil.parse(dicts) == sigil.parse(stream)
+
+def expression(code):
+    return sigil.format_expression(sigil.parse(sigil.tokenize('print ' + code)).body[0].expression)
+
+@pytest.mark.parametrize('code, grouped', [
+    ('1 + 2 * 3', '1 + (2 * 3)'),
+    ('1 - 2 - 3', '(1 - 2) - 3'),
+    ('8 / 4 * 2', '(8 / 4) * 2'),
+    ('a < b == c', '(a < b) == c'),
+    ('a or b and c == d < e + f * -g[0]', 'a or (b and (c == (d < (e + (f * -g[0])))))'),
+    ('(1 + 2) * 3', '(1 + 2) * 3'),
+    ('-(a - b) - c', '-(a - b) - c'),
+    ('!a == b', '!a == b'),
+])
+def test_precedence(code, grouped):
+    assert expression(code) == grouped
+
+def test_prefix_binds_tightest():
+    ast = sigil.parse(sigil.tokenize('print !a == -l[0]')).body[0].expression
+    assert ast.to_dict() == {
+        'type': 'binary', 'op': '==',
+        'left': {'type': 'unary', 'op': '!', 'expr': {'type': 'variable', 'name': 'a'}},
+        'right': {'type': 'unary', 'op': '-', 'expr': {'type': 'list_access', 'list': {'type': 'variable', 'name': 'l'},
+                                                        'index': {'type': 'number', 'value': 0.0}}}}
+
+def test_binding_power_table():
+    # Every binary operator is left-associative and binds more loosely
+    # than the prefix operators
+    prefix = min(sigil.PREFIX_OPERATORS.values())
+    for op, (left, right) in sigil.BINARY_OPERATORS.items():
+        assert left < right < prefix
+    assert set(sigil.BINARY_OPERATORS) | set(sigil.PREFIX_OPERATORS) <= set(sigil.TOKEN_CODES)
+
+def test_parser_reads_the_table(monkeypatch):
+    monkeypatch.setitem(sigil.BINARY_OPERATORS, '+', (11, 12))
+    monkeypatch.setitem(sigil.BINARY_OPERATORS, '*', (9, 10))
+    assert expression('1 + 2 * 3') == '(1 + 2) * 3'
+    assert expression('1 * 2 + 3') == '1 * (2 + 3)'
+
+def test_token_stream_columns():
+    stream = sigil.tokenize('x = 1\nprint "a" + x')
+    assert (stream.types.typecode, stream.lines.typecode) == ('B', 'l')
+    assert list(stream.types) == [sigil.TOKEN_IDENTIFIER, sigil.TOKEN_ASSIGN, sigil.TOKEN_NUMBER,
+                                  sigil.TOKEN_PRINT, sigil.TOKEN_STRING, sigil.TOKEN_PLUS, sigil.TOKEN_IDENTIFIER]
+    assert stream.values == ['x', '=', 1.0, 'print', 'a', '+', 'x']
+    assert list(stream.lines) == [1, 1, 1, 2, 2, 2, 2]
+    assert len(stream) == 7
+    assert stream[-1] == {'type': 'identifier', 'value': 'x', 'line': 2}
+    assert stream[3] == {'type': 'keyword', 'value': 'print', 'line': 2}
+
+def test_token_stream_extend():
+    stream = sigil.tokenize('x = 1')
+    stream.extend(sigil.tokenize('y', 2))
+    stream.extend([{'type': 'operator', 'value': '=', 'line': 2}, {'type': 'boolean', 'value': True, 'line': 2}])
+    assert stream == sigil.tokenize('x = 1\ny = true')
+    assert repr(stream).startswith("TokenStream([{'type': 'identifier', 'value': 'x', 'line': 1}, ")
+
+@pytest.mark.parametrize('token', [
+    {'type': 'operator', 'value': 'print', 'line': 1},
+    {'type': 'keyword', 'value': 'bogus', 'line': 1},
+    {'type': 'comment', 'value': '#', 'line': 1},
+])
+def test_token_stream_rejects_bad_tokens(token):
+    with pytest.raises(ValueError, match="Not a token"):
+        sigil.TokenStream.from_dicts([token])
+
+def test_token_stream_comparisons():
+    stream = sigil.tokenize('x = 1')
+    assert stream != sigil.tokenize('x = 2')
+    assert stream != list(sigil.tokenize('x = 1', 2))
+    assert stream != 'x = 1'
+    with pytest.raises(TypeError):
+        hash(stream)
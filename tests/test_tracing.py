@@ -0,0 +1,108 @@
+#Tests for the loop tracer: hot while loops compiled to Python, and side
+#exits back to the tree-walker when a type check fails.
+import builtins
+import io
+
+import pytest
+
+import sigil
+
+@pytest.fixture(autouse=True)
+def quick_tracing(monkeypatch):
+    # Compile loops after a few iterations, so short tests reach them
+    monkeypatch.setattr(sigil, 'TRACE_THRESHOLD', 5)
+    monkeypatch.setattr(builtins, 'input', lambda prompt='': 'apple')
+
+def traced_run(code, tracing=True):
+    #Run a program with or without the tracer and return what it printed,
+    #the error it stopped with and its environment.
+    saved = sigil.TRACE_LOOPS
+    sigil.TRACE_LOOPS = tracing
+    environment = {'variables': {}}
+    printed = io.StringIO()
+    try:
+        sigil.interpret(sigil.parse(sigil.tokenize(code)), environment, output=sigil.FileSink(printed))
+        error = None
+    except Exception as e:
+        error = (type(e).__name__, str(e))
+    finally:
+        sigil.TRACE_LOOPS = saved
+    return printed.getvalue(), error, environment
+
+def assert_same_as_untraced(code):
+    #Run a program both ways, check that they agree and return the traced
+    #run's environment.
+    printed, error, environment = traced_run(code)
+    assert (printed, error) == traced_run(code, tracing=False)[:2]
+    return environment
+
+def only_trace(environment):
+    traces = environment['traces']
+    assert len(traces) == 1
+    return traces[0]
+
+def test_hot_loop_is_compiled():
+    environment = assert_same_as_untraced(
+        'i = 0\nt = 0\nwhile (i < 100) {\n  t = t + i * 2\n  i = i + 1\n}\nprint t\nprint i')
+    trace = only_trace(environment)
+    assert len(trace.compiled) == 1
+    assert trace.compiled_iterations == 95
+    assert trace.side_exits == 0
+    assert environment['variables']['t'] == 9900.0
+
+def test_type_change_exits_to_tree_walker():
+    environment = assert_same_as_untraced(
+        'i = 0\nx = 0\nwhile (i < 100) {\n  if (i == 50) { x = "s" }\n  x = x + 1\n  i = i + 1\n}\nprint x')
+    trace = only_trace(environment)
+    assert trace.side_exits == 1
+    # One version for numbers and, after the exit, one for strings
+    assert len(trace.compiled) == 2
+    assert trace.compiled_iterations > 50
+
+def test_versions_are_capped():
+    # x takes five types in turn (number, string, boolean, number list and
+    # list): after TRACE_MAX_COMPILES versions the loop stays with the
+    # tree-walker
+    environment = assert_same_as_untraced(
+        'i = 0\nx = 0\nwhile (i < 200) {\n'
+        '  if (x == 0) { x = "a" } else { if (x == "a") { x = true } else { if (x == true) { x = [1] } else {'
+        ' if (x == [1]) { x = ["b"] } else { x = 0 } } } }\n'
+        '  i = i + 1\n}\nprint x\nprint i')
+    trace = only_trace(environment)
+    assert len(trace.compiled) == sigil.TRACE_MAX_COMPILES
+    assert trace.countdown < 0
+
+@pytest.mark.parametrize('code', [
+    # Errors raised inside the compiled loop are those of the tree-walker
+    'l = [1, 2, 3]\ni = 0\nt = 0\nwhile (i < 10) {\n  t = t + l[i]\n  i = i + 1\n}',
+    'i = 0\nwhile (i < 10) {\n  if (i == 8) { x = "a" - i }\n  i = i + 1\n}',
+    'i = 0\nwhile (i < 10) {\n  print i\n  if (i == 8) { print y }\n  i = i + 1\n}',
+    'i = 0\nx = 1\nwhile (i < 10) {\n  x = x / (7 - i)\n  i = i + 1\n}',
+    'i = 0\nwhile (i < 10) {\n  if (i == 8) { i = "s" } else { i = i + 1 }\n}',
+    'i = 0\nwhile (i < 10) {\n  if (i == 8) { i = true } else { i = i + 1 }\n}',
+])
+def test_errors_match(code):
+    printed, error, environment = traced_run(code)
+    assert error is not None
+    assert (printed, error) == traced_run(code, tracing=False)[:2]
+
+def test_lists_strings_and_input():
+    assert_same_as_untraced(
+        'l = []\ns = ""\ni = 0\nwhile (i < 20) {\n  l.append(i)\n  l[0] = l[0] + 1\n'
+        '  s = s + input("? ") + i\n  i = i + 1\n}\nprint l\nprint s\nprint len(s)')
+
+def test_nested_loops():
+    environment = assert_same_as_untraced(
+        'i = 0\nt = 0\nwhile (i < 20) {\n  j = 0\n  while (j < i) {\n    t = t + j\n    j = j + 1\n  }\n'
+        '  i = i + 1\n}\nprint t')
+    assert sum(trace.compiled_iterations for trace in environment['traces']) > 0
+
+def test_report():
+    printed, error, environment = traced_run('i = 0\nwhile (i < 100) { i = i + 1 }')
+    report = io.StringIO()
+    sigil.report_traces(environment, report)
+    assert report.getvalue().startswith(
+        "Tracing: while (i < 100): versions 1, compiled iterations 95, side exits 0, about ")
+    report = io.StringIO()
+    sigil.report_traces(traced_run('i = 0')[2], report)
+    assert report.getvalue() == "Tracing: no loops were compiled\n"